@@ -1,21 +1,23 @@
-from collections import Counter
+from aggregation.engine import Counts, Sum, collect
 
-def dominant(values):
-    if not values:
-        return None
-    return Counter(values).most_common(1)[0][0]
 
+DERIBIT_METRICS = {
+    "states": Counts("vbi_state"),
+    "patterns": Counts("vbi_pattern"),
+    "iv_slope_sum": Sum("iv_slope"),
+}
 
-def aggregate_deribit(rows: list[dict]) -> dict:
-    if not rows:
-        return {}
 
-    data = [r["data"] for r in rows]
+def aggregate_deribit(rows) -> dict:
+    return summarize_deribit(*collect(DERIBIT_METRICS, rows))
+
+
+def summarize_deribit(m: dict, total: int) -> dict:
+    if not total:
+        return {}
 
     return {
-        "vbi_state": dominant([d.get("vbi_state") for d in data]),
-        "vbi_pattern": dominant([d.get("vbi_pattern") for d in data]),
-        "iv_slope_avg": round(
-            sum(d.get("iv_slope", 0) for d in data) / len(data), 3
-        ),
+        "vbi_state": m["states"].most_common(1)[0][0],
+        "vbi_pattern": m["patterns"].most_common(1)[0][0],
+        "iv_slope_avg": round(m["iv_slope_sum"] / total, 3),
     }
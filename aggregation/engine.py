@@ -0,0 +1,347 @@
+import math
+from collections import Counter
+from itertools import islice, repeat
+from operator import itemgetter
+
+
+# Rows per batch: large enough to amortize the per-batch work, small
+# enough to keep a stream's memory flat.
+BATCH_ROWS = 4096
+
+# Field key standing for the row's top-level `ts` instead of a `data` key.
+TS = "__ts__"
+
+
+def _exact_parts(values: list) -> list[float]:
+    """
+    A few floats whose exact sum is that of `values` (Shewchuk-style
+    partials), so math.fsum of the parts is the correctly rounded sum of
+    every value. The first is the plain sum, each next one math.fsum of
+    what the earlier ones leave over: usually two fsum passes in all.
+    """
+    parts = []
+    rest = sum(values)
+    if not rest or not math.isfinite(rest):
+        # cancelled or overflowed: only an fsum result of 0 means exactly 0
+        try:
+            rest = math.fsum(values)
+        except (OverflowError, ValueError):
+            return [rest]  # no finite sum: inf or nan, as the plain sum
+    while rest:
+        parts.append(rest)
+        if not math.isfinite(rest):
+            break
+        rest = math.fsum(values + [-part for part in parts])
+    return parts
+
+
+class Metric:
+    """
+    One aggregate of a layer. `fields` are the (data key, default) pairs it
+    reads; `collect` hands it their values batch by batch, in row order, so
+    a metric never touches the rows themselves.
+
+    States are mergeable: `merge(state, other)` folds the state of the rows
+    that follow into `state`. It may update `state` in place (the caller
+    owns it) but never `other`, which can be a stored rollup partial.
+    """
+
+    fields: tuple = ()
+
+    def start(self):
+        return None
+
+    def add(self, state, columns: list[list]):
+        raise NotImplementedError
+
+    def merge(self, state, other):
+        raise NotImplementedError
+
+    def finish(self, state):
+        return state
+
+
+class Sum(Metric):
+    """
+    Sum of `data.get(key, default)`. Kept exact (ints as ints, floats as
+    fsum partials), so merged partial sums equal a sum over the rows in one
+    go; the result is an int when every value was, else the correctly
+    rounded float (ints mixed with floats are summed as floats).
+    """
+
+    def __init__(self, key: str, default=0):
+        self.fields = ((key, default),)
+
+    def start(self):
+        # (int total, float partials or None until a float is seen)
+        return 0, None
+
+    def add(self, state, columns):
+        ints, parts = state
+        values = columns[0]
+        total = sum(values)
+        if type(total) is not float:
+            return ints + total, parts
+        return ints, _exact_parts((parts or []) + values)
+
+    def merge(self, state, other):
+        if other[1] is None:
+            return state[0] + other[0], state[1]
+        return state[0] + other[0], _exact_parts((state[1] or []) + other[1])
+
+    def finish(self, state):
+        ints, parts = state
+        return ints if parts is None else math.fsum(parts + [ints])
+
+
+class AtLeast(Metric):
+    """Rows whose `data.get(key, default)` is >= threshold."""
+
+    def __init__(self, key: str, threshold, default=0):
+        self.fields = ((key, default),)
+        self.threshold = threshold
+
+    def start(self):
+        return 0
+
+    def add(self, state, columns):
+        threshold = self.threshold
+        return state + len([v for v in columns[0] if v >= threshold])
+
+    def merge(self, state, other):
+        return state + other
+
+
+class Counts(Metric):
+    """Counter of `data.get(key)`; truthy=True skips falsy values."""
+
+    def __init__(self, key: str, truthy: bool = False):
+        self.fields = ((key, None),)
+        self.truthy = truthy
+
+    def start(self):
+        return Counter()
+
+    def add(self, state, columns):
+        state.update(filter(None, columns[0]) if self.truthy else columns[0])
+        return state
+
+    def merge(self, state, other):
+        # Keys keep first-seen order when partials are merged in row order.
+        state.update(other)
+        return state
+
+
+class Mode(Metric):
+    """Most frequent value other than None / "" (ties: first seen)."""
+
+    def __init__(self, key: str):
+        self.fields = ((key, None),)
+
+    def start(self):
+        return Counter()
+
+    def add(self, state, columns):
+        # count everything at C speed, then drop the two skipped keys
+        state.update(columns[0])
+        state.pop(None, None)
+        state.pop("", None)
+        return state
+
+    def merge(self, state, other):
+        state.update(other)
+        return state
+
+    def finish(self, state):
+        return state.most_common(1)[0][0] if state else None
+
+
+class _Numeric(Metric):
+    # Reads only int / float values, as floats.
+
+    def __init__(self, key: str):
+        self.fields = ((key, None),)
+
+    @staticmethod
+    def numbers(values) -> list[float]:
+        # The column itself when it is all floats (callers never mutate it).
+        kinds = set(map(type, values))
+        if kinds <= {float}:
+            return values
+        if kinds <= {float, int}:
+            return list(map(float, values))
+        return [float(v) for v in values if isinstance(v, (int, float))]
+
+
+class Mean(_Numeric):
+    """Mean of the numeric values (None without any); exact sum, as Sum."""
+
+    def start(self):
+        return [], 0
+
+    def add(self, state, columns):
+        numbers = self.numbers(columns[0])
+        if not numbers:
+            return state
+        return _exact_parts(state[0] + numbers), state[1] + len(numbers)
+
+    def merge(self, state, other):
+        if not other[1]:
+            return state
+        return _exact_parts(state[0] + other[0]), state[1] + other[1]
+
+    def finish(self, state):
+        parts, count = state
+        return math.fsum(parts) / count if count else None
+
+
+class Min(_Numeric):
+    def add(self, state, columns):
+        numbers = self.numbers(columns[0])
+        if not numbers:
+            return state
+        return self.merge(state, min(numbers))
+
+    def merge(self, state, other):
+        if state is None or other is None:
+            return other if state is None else state
+        return min(state, other)
+
+
+class Max(_Numeric):
+    def add(self, state, columns):
+        numbers = self.numbers(columns[0])
+        if not numbers:
+            return state
+        return self.merge(state, max(numbers))
+
+    def merge(self, state, other):
+        if state is None or other is None:
+            return other if state is None else state
+        return max(state, other)
+
+
+class First(Metric):
+    """`data.get(key)` of the first row."""
+
+    def __init__(self, key: str):
+        self.fields = ((key, None),)
+
+    def start(self):
+        # () until a row is seen, then (value,)
+        return ()
+
+    def add(self, state, columns):
+        if not state and columns[0]:
+            return (columns[0][0],)
+        return state
+
+    def merge(self, state, other):
+        return state or other
+
+    def finish(self, state):
+        return state[0] if state else None
+
+
+class Latest(Metric):
+    """`data.get(key)` of the row with the greatest ts (first one on ties)."""
+
+    def __init__(self, key: str):
+        self.fields = ((TS, 0), (key, None))
+
+    def add(self, state, columns):
+        stamps, values = columns
+        if not stamps:
+            return state
+        ts = max(stamps)
+        if state is None or ts > state[0]:
+            # index() finds the first row with that ts, as a row walk would
+            state = (ts, values[stamps.index(ts)])
+        return state
+
+    def merge(self, state, other):
+        # state holds the earlier rows, so it wins ts ties
+        if state is None or (other is not None and other[0] > state[0]):
+            return other
+        return state
+
+    def finish(self, state):
+        return None if state is None else state[1]
+
+
+_DATA = itemgetter("data")
+
+
+def _batches(rows, fields: list[tuple]):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, BATCH_ROWS))
+        if not batch:
+            return
+
+        # map over the C-level getters: no bytecode runs per value
+        datas = list(map(_DATA, batch))
+        columns = {}
+        for key, default in fields:
+            if key == TS:
+                columns[(key, default)] = list(map(dict.get, batch, repeat("ts"), repeat(default)))
+            else:
+                columns[(key, default)] = list(map(dict.get, datas, repeat(key), repeat(default)))
+        yield len(batch), columns
+
+
+class Partial:
+    """
+    Metric states of one layer over a run of rows, plus the row count.
+    Partials of consecutive runs merge into the partial of their union.
+    """
+
+    __slots__ = ("states", "count")
+
+    def __init__(self, states: dict, count: int = 0):
+        self.states = states
+        self.count = count
+
+
+def partial(metrics: dict[str, Metric], rows) -> Partial:
+    """
+    Metric states over `rows` (a list or a stream) in one
+    pass. Each row's `data` is read once per field, never per metric.
+    """
+    fields = list(dict.fromkeys(field for metric in metrics.values() for field in metric.fields))
+    states = {name: metric.start() for name, metric in metrics.items()}
+    count = 0
+
+    for size, columns in _batches(rows, fields):
+        count += size
+        for name, metric in metrics.items():
+            states[name] = metric.add(states[name], [columns[field] for field in metric.fields])
+
+    return Partial(states, count)
+
+
+def merge(metrics: dict[str, Metric], partials) -> Partial:
+    """Merge partials of consecutive runs, given in row order, into a new one."""
+    states = {name: metric.start() for name, metric in metrics.items()}
+    count = 0
+
+    for part in partials:
+        count += part.count
+        for name, metric in metrics.items():
+            states[name] = metric.merge(states[name], part.states[name])
+
+    return Partial(states, count)
+
+
+def finish(metrics: dict[str, Metric], part: Partial) -> tuple[dict, int]:
+    """({name: result}, row count) of a partial."""
+    return {name: metric.finish(part.states[name]) for name, metric in metrics.items()}, part.count
+
+
+def collect(metrics: dict[str, Metric], rows) -> tuple[dict, int]:
+    """
+    Compute every metric over `rows` (a list or a stream).
+
+    Returns ({name: result}, row count).
+    """
+    return finish(metrics, partial(metrics, rows))
@@ -1,13 +1,23 @@
-from collections import Counter
+from aggregation.engine import Counts, collect
+
+
+META_METRICS = {
+    "regimes": Counts("regime", truthy=True),
+    "activity": Counts("activity", truthy=True),
+}
 
-def aggregate_meta(rows: list[dict]) -> dict:
-    if not rows:
-        return {}
 
-    regs = [r["data"].get("regime") for r in rows if r["data"].get("regime")]
-    act = [r["data"].get("activity") for r in rows if r["data"].get("activity")]
+def aggregate_meta(rows) -> dict:
+    return summarize_meta(*collect(META_METRICS, rows))
+
+
+def summarize_meta(m: dict, total: int) -> dict:
+    if not total:
+        return {}
 
+    regs = m["regimes"]
+    act = m["activity"]
     return {
-        "market_regime": Counter(regs).most_common(1)[0][0] if regs else None,
-        "activity_regime": Counter(act).most_common(1)[0][0] if act else None,
+        "market_regime": regs.most_common(1)[0][0] if regs else None,
+        "activity_regime": act.most_common(1)[0][0] if act else None,
     }
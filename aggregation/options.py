@@ -1,32 +1,24 @@
-from collections import Counter
+from aggregation.engine import Counts, collect
 
-def avg(values, digits: int):
-    numeric = [v for v in values if isinstance(v, (int, float))]
-    if not numeric:
-        return 0
-    return round(sum(numeric) / len(numeric), digits)
 
-def dominant(values):
-    if not values:
-        return None, 0.0
-    c = Counter(values)
-    k, v = c.most_common(1)[0]
-    return k, round(v / len(values) * 100, 1)
+OPTIONS_METRICS = {
+    "regimes": Counts("okx_liquidity_regime", truthy=True),
+}
 
 
-def aggregate_options(rows: list[dict]) -> dict:
-    if not rows:
-        return {}
+def aggregate_options(rows) -> dict:
+    return summarize_options(*collect(OPTIONS_METRICS, rows))
 
-    data = [r["data"] for r in rows]
 
-    regimes = [
-        d.get("okx_liquidity_regime")
-        for d in data
-        if d.get("okx_liquidity_regime")
-    ]
+def summarize_options(m: dict, total: int) -> dict:
+    if not total:
+        return {}
 
-    regime, pct = dominant(regimes)
+    regimes = m["regimes"]
+    regime, pct = None, 0.0
+    if regimes:
+        regime, count = regimes.most_common(1)[0]
+        pct = round(count / sum(regimes.values()) * 100, 1)
 
     return {
         "dominant_phase": regime,          # OKX liquidity regime
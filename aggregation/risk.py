@@ -1,17 +1,28 @@
-def aggregate_risk(rows: list[dict]) -> dict:
-    if not rows:
-        return {}
+from aggregation.engine import AtLeast, Counts, Sum, collect
+
+
+RISK_METRICS = {
+    "risk_sum": Sum("risk"),
+    "buildups": AtLeast("risk", 2),
+    "alerts": AtLeast("risk", 3),
+    "directions": Counts("direction"),
+}
 
-    risks = [r["data"].get("risk", 0) for r in rows]
-    dirs = [r["data"].get("direction") for r in rows]
 
-    total = len(risks)
+def aggregate_risk(rows) -> dict:
+    return summarize_risk(*collect(RISK_METRICS, rows))
+
+
+def summarize_risk(m: dict, total: int) -> dict:
+    # Layer dict from RISK_METRICS results (of rows or merged partials).
+    if not total:
+        return {}
 
     return {
-        "avg_risk": round(sum(risks) / total, 2),
-        "risk_2plus_pct": round(sum(r >= 2 for r in risks) / total * 100, 1),
-        "buildups": sum(r >= 2 for r in risks),
-        "alerts": sum(r >= 3 for r in risks),
-        "long_bias": dirs.count("LONG"),
-        "short_bias": dirs.count("SHORT"),
+        "avg_risk": round(m["risk_sum"] / total, 2),
+        "risk_2plus_pct": round(m["buildups"] / total * 100, 1),
+        "buildups": m["buildups"],
+        "alerts": m["alerts"],
+        "long_bias": m["directions"]["LONG"],
+        "short_bias": m["directions"]["SHORT"],
     }
@@ -0,0 +1,384 @@
+import json
+import os
+import threading
+from collections import Counter, OrderedDict
+from itertools import groupby
+
+from aggregation.engine import Partial, finish, merge, partial
+from config import (
+    SNAPSHOT_ROLLUP_DAYS,
+    SNAPSHOT_ROLLUP_FINAL_HOURS,
+    SNAPSHOT_ROLLUP_HOUR_DAYS,
+    SNAPSHOT_ROLLUP_KEYS,
+    SNAPSHOT_ROLLUP_MINUTE_HOURS,
+    SNAPSHOT_ROLLUP_PATH,
+    SUPABASE_ROW_CACHE_SETTLE_SECONDS,
+)
+
+
+MINUTE_MS = 60 * 1000
+HOUR_MS = 60 * MINUTE_MS
+DAY_MS = 24 * HOUR_MS
+
+# Tiers kept in the rollup file; minutes are cheap to rebuild.
+PERSISTED_STEPS = (DAY_MS, HOUR_MS)
+# 3: sums are stored as float partials; older files are not loaded.
+_FILE_VERSION = 3
+
+
+def _minute_of(row) -> int:
+    return row.ts_ms - row.ts_ms % MINUTE_MS
+
+
+def _ceil(ts: int, step: int) -> int:
+    return -(-ts // step) * step
+
+
+def day_chunks(ts_from: int, ts_to: int) -> list[tuple[int, int]]:
+    """Split [ts_from, ts_to] at UTC day boundaries, so each complete day is aggregated (and stored) on its own."""
+    chunks = []
+    while ts_from <= ts_to:
+        end = min(ts_to, ts_from - ts_from % DAY_MS + DAY_MS - 1)
+        chunks.append((ts_from, end))
+        ts_from = end + 1
+    return chunks
+
+
+class _Tier:
+    """Partials of one bucket size over covered ranges (whole buckets)."""
+
+    def __init__(self, step: int, keep_ms: int):
+        self.step = step
+        self.keep_ms = max(step, keep_ms - keep_ms % step)
+        # ts-sorted, disjoint, non-adjacent [start, end] ranges
+        self.segments: list[list[int]] = []
+        # bucket start -> {event: Partial}; buckets without rows are absent
+        self.buckets: dict[int, dict[str, Partial]] = {}
+
+    def covers(self, ts_from: int, ts_to: int) -> bool:
+        return any(start <= ts_from and ts_to <= end for start, end in self.segments)
+
+    def add(self, first: int, last: int, buckets: dict) -> bool:
+        """Record whole buckets [first, last] as covered, with `buckets` as their content."""
+        if self.segments and last + 1 < self.segments[-1][1] + 1 - self.keep_ms:
+            return False  # older than anything kept
+
+        for bucket in [b for b in self.buckets if first <= b <= last]:
+            del self.buckets[bucket]
+        self.buckets.update((b, parts) for b, parts in buckets.items() if first <= b <= last)
+
+        merged = []
+        for start, end in sorted(self.segments + [[first, last]]):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+
+        cutoff = merged[-1][1] + 1 - self.keep_ms
+        if merged[0][0] < cutoff:
+            merged = [[max(start, cutoff), end] for start, end in merged if end >= cutoff]
+            for bucket in [b for b in self.buckets if b < cutoff]:
+                del self.buckets[bucket]
+        self.segments = merged
+        return True
+
+    def promote(self, layers: dict, fine: "_Tier", until: int) -> bool:
+        # Buckets fully covered by the finer tier (possibly across several
+        # gaps) and ending by `until` are merged into buckets of this one.
+        changed = False
+        for start, end in list(fine.segments):
+            end = min(end, until)
+            bucket = _ceil(start, self.step)
+            while bucket + self.step - 1 <= end:
+                last = bucket + self.step - 1
+                if not self.covers(bucket, last):
+                    children = [fine.buckets.get(b) for b in range(bucket, last, fine.step)]
+                    children = [c for c in children if c]
+                    merged = {
+                        event: merge(metrics, [c[event] for c in children if event in c])
+                        for event, metrics in layers.items()
+                        if any(event in c for c in children)
+                    }
+                    changed |= self.add(bucket, last, {bucket: merged} if merged else {})
+                bucket += self.step
+        return changed
+
+
+def _pack(value):
+    # JSON form of a metric state (tuples, Counters, ...).
+    if isinstance(value, Counter):
+        return {"c": [[_pack(k), n] for k, n in value.items()]}
+    if isinstance(value, tuple):
+        return {"t": [_pack(v) for v in value]}
+    if isinstance(value, dict):
+        return {"d": [[_pack(k), _pack(v)] for k, v in value.items()]}
+    if isinstance(value, list):
+        return [_pack(v) for v in value]
+    return value
+
+
+def _unpack(value):
+    if isinstance(value, list):
+        return [_unpack(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if "c" in value:
+        return Counter({_unpack(k): n for k, n in value["c"]})
+    if "t" in value:
+        return tuple(_unpack(v) for v in value["t"])
+    return {_unpack(k): _unpack(v) for k, v in value["d"]}
+
+
+class RollupStore:
+    """
+    Per-minute, per-hour and per-day partial aggregates (engine.Partial) of
+    the snapshot layers, per key (symbol).
+
+    A window is then a merge of stored partials plus the partials of its
+    uncovered ranges ("gaps"), aggregated from fetched rows. Partials merge
+    exactly, so the result equals aggregating every row of the window.
+
+    Stored buckets are never revisited, so a row ingested after its bucket
+    was stored is missed. Minute buckets are stored once complete and older
+    than `settle_seconds`, the same finality assumption as the row cache
+    (they only live `minute_hours`). Hour and day buckets, kept for weeks
+    and saved, wait for the ingest horizon `final_hours` instead.
+
+    max_keys        — keys kept; least recently used go first (0 disables)
+    minute_hours    — how far back minute partials are kept
+    hour_days       — how far back hour partials are kept
+    days            — how far back day partials are kept
+    settle_seconds  — age at which a complete minute bucket is stored
+    final_hours     — age at which a complete hour or day bucket is stored:
+                      no row is expected to arrive later than that
+    path            — JSON file the hour and day tiers are saved to and
+                      loaded from, so long lookbacks survive restarts
+    """
+
+    def __init__(
+        self,
+        max_keys: int = 32,
+        minute_hours: float = 24.0,
+        hour_days: float = 35.0,
+        days: float = 35.0,
+        settle_seconds: float = 120.0,
+        final_hours: float = 6.0,
+        path: str = "",
+    ):
+        self.max_keys = max(0, max_keys)
+        self.keep_ms = {
+            DAY_MS: int(days * DAY_MS),
+            HOUR_MS: int(hour_days * DAY_MS),
+            MINUTE_MS: int(minute_hours * HOUR_MS),
+        }
+        self.settle_ms = int(settle_seconds * 1000)
+        self.final_ms = max(self.settle_ms, int(final_hours * HOUR_MS))
+        self.path = path
+
+        self._lock = threading.Lock()
+        # key -> (day tier, hour tier, minute tier)
+        self._entries: OrderedDict[tuple, tuple[_Tier, ...]] = OrderedDict()
+        self._loaded = not path
+        self._dirty = False
+
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self.buckets_served = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_keys > 0
+
+    def _tiers(self, key: tuple, create: bool = False) -> tuple:
+        tiers = self._entries.get(key)
+        if tiers is None and create:
+            tiers = self._entries[key] = tuple(_Tier(step, self.keep_ms[step]) for step in (DAY_MS, HOUR_MS, MINUTE_MS))
+        if tiers is not None:
+            self._entries.move_to_end(key)
+        return tiers or ()
+
+    def lookup(self, key: tuple, ts_from: int, ts_to: int) -> list[tuple]:
+        """
+        Split [ts_from, ts_to] into ts-ordered pieces: ("buckets", [{event:
+        Partial}, ...]) for stored ranges and ("gap", a, b) for ranges to
+        aggregate from rows.
+        """
+        pieces: list[tuple] = []
+        cursor = ts_from
+
+        with self._lock:
+            self._load()
+            tiers = self._tiers(key)
+
+            while cursor <= ts_to:
+                for tier in tiers:
+                    end = cursor + tier.step - 1
+                    if cursor % tier.step == 0 and end <= ts_to and tier.covers(cursor, end):
+                        if not pieces or pieces[-1][0] != "buckets":
+                            pieces.append(("buckets", []))
+                        bucket = tier.buckets.get(cursor)
+                        if bucket:
+                            pieces[-1][1].append(bucket)
+                            self.buckets_served += 1
+                        cursor = end + 1
+                        break
+                else:
+                    # Rows up to where a stored bucket could start next.
+                    inside = [t.step for t in tiers if t.covers(cursor, cursor)]
+                    if inside:
+                        step = min(inside)
+                        stop = cursor - cursor % step + step - 1
+                    else:
+                        starts = [s for t in tiers for s, _ in t.segments if s > cursor]
+                        stop = min(starts) - 1 if starts else ts_to
+                    stop = min(stop, ts_to)
+                    if pieces and pieces[-1][0] == "gap":
+                        pieces[-1] = ("gap", pieces[-1][1], stop)
+                    else:
+                        pieces.append(("gap", cursor, stop))
+                    cursor = stop + 1
+
+            gaps = sum(1 for piece in pieces if piece[0] == "gap")
+            if gaps == len(pieces):
+                self.misses += 1
+            elif gaps:
+                self.partial_hits += 1
+            else:
+                self.hits += 1
+
+        return pieces
+
+    def absorb(self, key: tuple, layers: dict, ts_from: int, ts_to: int, rows: dict, now_ms: int) -> dict[str, Partial]:
+        """
+        Aggregate the rows fetched for the gap [ts_from, ts_to] ({event:
+        ts-sorted rows, a list or a stream}) into one partial per event of
+        `layers` ({event: metrics}). Complete, settled minutes, hours and
+        days of the gap are stored for later windows (see the class doc for
+        when a bucket counts as settled).
+        """
+        if not self.enabled:
+            return {event: partial(metrics, rows[event]) for event, metrics in layers.items()}
+
+        levels: dict[int, dict] = {MINUTE_MS: {}, HOUR_MS: {}, DAY_MS: {}}
+        totals = {}
+
+        for event, metrics in layers.items():
+            parts = [(minute, partial(metrics, group)) for minute, group in groupby(rows[event], key=_minute_of)]
+            for step in (MINUTE_MS, HOUR_MS, DAY_MS):
+                if step != MINUTE_MS:
+                    parts = [
+                        (bucket, merge(metrics, [part for _, part in group]))
+                        for bucket, group in groupby(parts, key=lambda item: item[0] - item[0] % step)
+                    ]
+                for bucket, part in parts:
+                    levels[step].setdefault(bucket, {})[event] = part
+            totals[event] = merge(metrics, [part for _, part in parts])
+
+        with self._lock:
+            self._load()
+            day_tier, hour_tier, minute_tier = self._tiers(key, create=True)
+
+            for tier, coarse in ((minute_tier, None), (hour_tier, minute_tier), (day_tier, hour_tier)):
+                changed = False
+                settled_to = now_ms - (self.final_ms if tier.step in PERSISTED_STEPS else self.settle_ms)
+                if coarse is not None:
+                    changed |= tier.promote(layers, coarse, settled_to)
+                settled_to = min(ts_to, settled_to)
+                first = _ceil(ts_from, tier.step)
+                last = (settled_to + 1) // tier.step * tier.step - 1
+                if last > first:
+                    changed |= tier.add(first, last, levels[tier.step])
+                if changed and tier.step in PERSISTED_STEPS:
+                    self._dirty = True
+
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+
+        return totals
+
+    def _load(self) -> None:
+        # Called with the lock held: the first use reads the rollup file.
+        if self._loaded:
+            return
+        self._loaded = True
+
+        try:
+            with open(self.path, encoding="utf-8") as src:
+                saved = json.load(src)
+        except (OSError, ValueError):
+            return  # no file yet, or unreadable: start cold
+        if saved.get("version") != _FILE_VERSION:
+            return
+
+        for key, tiers in saved["entries"]:
+            entry = self._tiers(tuple(key), create=True)
+            for tier in entry:
+                segments, buckets = tiers.get(str(tier.step), ([], []))
+                tier.segments = [list(segment) for segment in segments]
+                tier.buckets = {
+                    bucket: {event: Partial(_unpack(states), count) for event, (states, count) in parts.items()}
+                    for bucket, parts in buckets
+                }
+
+    def save(self) -> bool:
+        """Write the hour and day tiers to `path` if they changed. Returns whether it wrote."""
+        with self._lock:
+            if not self.path or not self._dirty:
+                return False
+            entries = []
+            for key, tiers in self._entries.items():
+                entries.append([list(key), {
+                    str(tier.step): [
+                        tier.segments,
+                        [
+                            [bucket, {event: [_pack(p.states), p.count] for event, p in parts.items()}]
+                            for bucket, parts in sorted(tier.buckets.items())
+                        ],
+                    ]
+                    for tier in tiers
+                    if tier.step in PERSISTED_STEPS
+                }])
+            self._dirty = False
+
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as out:
+            json.dump({"version": _FILE_VERSION, "entries": entries}, out, separators=(",", ":"))
+        os.replace(tmp, self.path)
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "partial_hits": self.partial_hits,
+                "misses": self.misses,
+                "buckets_served": self.buckets_served,
+                "keys": len(self._entries),
+            }
+
+
+def combine(layers: dict, parts: list[dict]) -> dict[str, tuple[dict, int]]:
+    """
+    Merge per-event partials of consecutive pieces (in time order) and
+    finish them: {event: (metric results, row count)}.
+    """
+    return {
+        event: finish(metrics, merge(metrics, [p[event] for p in parts if event in p]))
+        for event, metrics in layers.items()
+    }
+
+
+default_rollups = RollupStore(
+    max_keys=SNAPSHOT_ROLLUP_KEYS,
+    minute_hours=SNAPSHOT_ROLLUP_MINUTE_HOURS,
+    hour_days=SNAPSHOT_ROLLUP_HOUR_DAYS,
+    days=SNAPSHOT_ROLLUP_DAYS,
+    settle_seconds=SUPABASE_ROW_CACHE_SETTLE_SECONDS,
+    final_hours=SNAPSHOT_ROLLUP_FINAL_HOURS,
+    path=SNAPSHOT_ROLLUP_PATH,
+)
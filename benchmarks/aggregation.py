@@ -0,0 +1,195 @@
+"""
+Snapshot layer aggregators on synthetic decoded rows, in ms per run.
+
+    python -m benchmarks.aggregation
+    python -m benchmarks.aggregation --sizes 10000 100000 --repeat 15
+
+Times each layer's single-pass engine aggregator against the per-layer
+list passes it replaced, and the OKX part of /options against its
+per-field rescans (kept below as the reference, which must give the same
+result).
+"""
+
+import argparse
+import math
+import random
+import time
+from collections import Counter
+
+from aggregation.deribit import aggregate_deribit
+from aggregation.engine import collect
+from aggregation.meta import aggregate_meta
+from aggregation.options import aggregate_options
+from aggregation.risk import aggregate_risk
+from data.records import decode_row
+from tg.bot_formatting import OPTIONS_OKX_METRICS
+
+
+# ---- reference: the aggregators before the engine ----
+
+def _dominant(values):
+    return Counter(values).most_common(1)[0][0] if values else None
+
+
+def _risk(rows):
+    if not rows:
+        return {}
+    risks = [r["data"].get("risk", 0) for r in rows]
+    dirs = [r["data"].get("direction") for r in rows]
+    total = len(risks)
+    return {
+        "avg_risk": round(sum(risks) / total, 2),
+        "risk_2plus_pct": round(sum(r >= 2 for r in risks) / total * 100, 1),
+        "buildups": sum(r >= 2 for r in risks),
+        "alerts": sum(r >= 3 for r in risks),
+        "long_bias": dirs.count("LONG"),
+        "short_bias": dirs.count("SHORT"),
+    }
+
+
+def _deribit(rows):
+    if not rows:
+        return {}
+    data = [r["data"] for r in rows]
+    return {
+        "vbi_state": _dominant([d.get("vbi_state") for d in data]),
+        "vbi_pattern": _dominant([d.get("vbi_pattern") for d in data]),
+        "iv_slope_avg": round(sum(d.get("iv_slope", 0) for d in data) / len(data), 3),
+    }
+
+
+def _meta(rows):
+    if not rows:
+        return {}
+    regs = [r["data"].get("regime") for r in rows if r["data"].get("regime")]
+    act = [r["data"].get("activity") for r in rows if r["data"].get("activity")]
+    return {"market_regime": _dominant(regs), "activity_regime": _dominant(act)}
+
+
+def _options(rows):
+    if not rows:
+        return {}
+    regimes = [r["data"].get("okx_liquidity_regime") for r in rows if r["data"].get("okx_liquidity_regime")]
+    if not regimes:
+        return {"dominant_phase": None, "dominant_phase_pct": 0.0}
+    regime, count = Counter(regimes).most_common(1)[0]
+    return {"dominant_phase": regime, "dominant_phase_pct": round(count / len(regimes) * 100, 1)}
+
+
+def _numbers(rows, field):
+    return [float(v) for v in (r.get("data", {}).get(field) for r in rows) if isinstance(v, (int, float))]
+
+
+def _avg(rows, field):
+    numeric = _numbers(rows, field)
+    return sum(numeric) / len(numeric) if numeric else None
+
+
+def _mode(rows, field):
+    values = [r.get("data", {}).get(field) for r in rows]
+    values = [v for v in values if v not in (None, "")]
+    return max(set(values), key=values.count) if values else None
+
+
+def _latest(rows, field):
+    return max(rows, key=lambda r: r.get("ts", 0)).get("data", {}).get(field) if rows else None
+
+
+def _okx_snapshot(rows):
+    return {
+        "okx_olsi_latest": _latest(rows, "okx_olsi_avg"),
+        "okx_olsi_avg": _avg(rows, "okx_olsi_avg"),
+        "okx_olsi_min": min(_numbers(rows, "okx_olsi_avg"), default=None),
+        "okx_olsi_max": max(_numbers(rows, "okx_olsi_avg"), default=None),
+        "okx_olsi_slope": _latest(rows, "okx_olsi_slope"),
+        "okx_liquidity_regime": _mode(rows, "okx_liquidity_regime"),
+        "divergence": _mode(rows, "divergence_type"),
+        "divergence_diff": _avg(rows, "divergence_diff"),
+        "divergence_strength": _avg(rows, "divergence_strength"),
+        "divergence_strength_label": _mode(rows, "divergence_strength_label"),
+    }
+
+
+def _okx_engine(rows):
+    return collect(OPTIONS_OKX_METRICS, rows)[0]
+
+
+# ---- synthetic rows ----
+
+def _data(event: str, rng: random.Random) -> dict:
+    if event == "risk_eval":
+        return {"symbol": "BTCUSDT", "risk": rng.randint(0, 6), "direction": rng.choice(("LONG", "SHORT", None))}
+    if event == "deribit_vbi_snapshot":
+        return {
+            "vbi_state": rng.choice(("HOT", "WARM", "COLD")),
+            "vbi_pattern": rng.choice(("CALM", "BUILDUP", "RELEASE")),
+            "iv_slope": rng.uniform(-3, 3),
+        }
+    if event == "market_regime":
+        return {"regime": rng.choice(("RISK_ON", "RISK_OFF", "")), "activity": rng.choice(("HIGH", "LOW", None))}
+    if event == "okx_market_state":
+        return {"okx_liquidity_regime": rng.choice(("THIN", "NORMAL", "DEEP", None))}
+    # okx_options: weighted choices, so every mode is unambiguous
+    return {
+        "okx_olsi_avg": rng.uniform(0, 1),
+        "okx_olsi_slope": rng.uniform(-1, 1),
+        "okx_liquidity_regime": rng.choices(("THIN", "NORMAL", "DEEP"), (1, 3, 2))[0],
+        "divergence_type": rng.choices(("NONE", "BULLISH", "BEARISH"), (4, 2, 1))[0],
+        "divergence_diff": rng.uniform(-1, 1),
+        "divergence_strength": rng.uniform(0, 1),
+        "divergence_strength_label": rng.choices(("WEAK", "MODERATE", "STRONG"), (3, 2, 1))[0],
+    }
+
+
+LAYERS = (
+    ("risk", "risk_eval", aggregate_risk, _risk),
+    ("deribit", "deribit_vbi_snapshot", aggregate_deribit, _deribit),
+    ("meta", "market_regime", aggregate_meta, _meta),
+    ("options", "okx_market_state", aggregate_options, _options),
+    ("okx /options", "okx_options", _okx_engine, _okx_snapshot),
+)
+
+
+def _synthetic_rows(count: int, event: str) -> list:
+    rng = random.Random(count)
+    ts = 1_760_000_000_000
+    return [decode_row({"ts": ts + i * 100, "event": event, "data": _data(event, rng)}) for i in range(count)]
+
+
+def _same(a: dict, b: dict) -> bool:
+    # The reference sums floats left to right; the engine rounds exactly.
+    return a.keys() == b.keys() and all(
+        math.isclose(a[k], b[k]) if isinstance(a[k], float) else a[k] == b[k] for k in a
+    )
+
+
+def _best(fn, rows, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def _run(size: int, repeat: int) -> None:
+    for name, event, engine, reference in LAYERS:
+        rows = _synthetic_rows(size, event)
+        assert _same(engine(rows), reference(rows)), name
+        before = _best(reference, rows, repeat)
+        after = _best(engine, rows, repeat)
+        print(f"{size} rows   {name:12} list passes {before:8.1f} ms   engine {after:8.1f} ms   x{before / after:.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        _run(size, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
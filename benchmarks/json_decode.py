@@ -0,0 +1,127 @@
+"""
+Decode cost of `risk_eval` pages, in ms per 1000 rows.
+
+    python -m benchmarks.json_decode --record pages.jsonl --hours 6
+    python -m benchmarks.json_decode --pages pages.jsonl
+
+--record saves raw response bodies of a live risk_eval fetch (one page per
+line); without --pages the benchmark runs on synthetic risk_eval-shaped
+pages.
+"""
+
+import argparse
+import json
+import random
+import time
+
+from data import json_codec
+
+
+def _synthetic_pages(count: int, rows_per_page: int = 1000) -> list[bytes]:
+    rng = random.Random(7)
+    symbols = ("BTCUSDT", "ETHUSDT", "SOLUSDT", "XRPUSDT", "DOGEUSDT")
+    ts = 1_760_000_000_000
+    pages = []
+
+    for _ in range(count):
+        rows = []
+        for _ in range(rows_per_page):
+            ts += rng.randint(200, 2000)
+            rows.append({
+                "id": ts // 7,
+                "ts": ts,
+                "event": "risk_eval",
+                "symbol": rng.choice(symbols),
+                "data": {
+                    "risk": rng.randint(0, 6),
+                    "direction": rng.choice(("LONG", "SHORT", None)),
+                    "funding": round(rng.uniform(-0.001, 0.001), 6),
+                    "oi_change": round(rng.uniform(-5, 5), 3),
+                    "reasons": rng.sample(["crowding", "squeeze", "oi_spike", "funding_extreme"], 2),
+                },
+            })
+        pages.append(json.dumps(rows, separators=(",", ":")).encode("utf-8"))
+
+    return pages
+
+
+def _record(path: str, hours: float) -> None:
+    from data.client import LogQuery
+    from data.queries import client
+
+    ts_to = int(time.time() * 1000)
+    ts_from = ts_to - int(hours * 3600 * 1000)
+    query = LogQuery(events=("risk_eval",))
+    cursor = None
+    pages = 0
+
+    with open(path, "wb") as out:
+        while True:
+            url = client._page_url(query, ts_from, ts_to, cursor=cursor)
+            status, _, body = client.pool.request("GET", url, headers=client._build_headers())
+            if status >= 400:
+                raise RuntimeError(f"Supabase HTTP error {status}")
+            out.write(body.replace(b"\n", b"") + b"\n")
+            pages += 1
+
+            page = json_codec.loads(body)
+            cursor = client._page_cursor(page)
+            if len(page) < client.PAGE_SIZE or cursor is None:
+                break
+
+    print(f"recorded {pages} pages to {path}")
+
+
+def _chunked(body: bytes, size: int = 16 * 1024):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+def _decoders() -> dict:
+    decoders = {
+        "json.loads(str)": lambda body: json.loads(body.decode("utf-8")),
+        "json.loads(bytes)": json.loads,
+        "incremental": lambda body: list(json_codec.iter_array(_chunked(body))),
+    }
+    if json_codec.orjson is not None:
+        decoders["orjson"] = json_codec.orjson.loads
+    return decoders
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", help="recorded pages, one raw response body per line")
+    parser.add_argument("--record", help="record live risk_eval pages to this file and exit")
+    parser.add_argument("--hours", type=float, default=6.0, help="window to record")
+    parser.add_argument("--synthetic", type=int, default=20, help="synthetic pages without --pages")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.record:
+        _record(args.record, args.hours)
+        return
+
+    if args.pages:
+        with open(args.pages, "rb") as src:
+            pages = [line.rstrip(b"\n") for line in src if line.strip()]
+    else:
+        pages = _synthetic_pages(args.synthetic)
+
+    rows = sum(len(json.loads(page)) for page in pages)
+    size = sum(len(page) for page in pages)
+    print(f"{len(pages)} pages, {rows} rows, {size / 1024:.0f} KiB")
+
+    if not rows:
+        return
+
+    for name, decode in _decoders().items():
+        best = float("inf")
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            for page in pages:
+                decode(page)
+            best = min(best, time.perf_counter() - started)
+        print(f"{name:<20} {best * 1000 / rows * 1000:8.2f} ms / 1000 rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Pure Python vs NumPy backend on synthetic decoded rows, in ms per run.
+
+    python -m benchmarks.numpy_backend
+    python -m benchmarks.numpy_backend --sizes 10000 100000 --repeat 5
+
+Times the per-symbol risk series of the market structure (latest /
+earliest risk, hourly dispersion and impulses) with the NumPy path
+switched off and on.
+"""
+
+import argparse
+import random
+import time
+
+from data.records import decode_row
+from trend import market_structure
+
+
+SYMBOLS = ("BTCUSDT", "ETHUSDT", "SOLUSDT", "XRPUSDT", "DOGEUSDT", "BNBUSDT", "ADAUSDT", "AVAXUSDT")
+HOUR_MS = 3600 * 1000
+
+
+def _synthetic_rows(count: int, event: str, ts_to: int, span_ms: int) -> list:
+    rng = random.Random(count)
+    step = max(1, span_ms // count)
+    ts = ts_to - span_ms
+    rows = []
+
+    for _ in range(count):
+        ts += rng.randint(0, 2 * step)
+        if event == "risk_eval":
+            row = {
+                "ts": ts,
+                "event": event,
+                "symbol": rng.choice(SYMBOLS),
+                "data": {
+                    "risk": rng.randint(0, 6),
+                    "direction": rng.choice(("LONG", "SHORT", None)),
+                    "funding": round(rng.uniform(-0.001, 0.001), 6),
+                },
+            }
+        elif event == "bybit_market_state":
+            row = {"ts": ts, "event": event, "data": {"mci": rng.uniform(-1, 1), "mci_slope": rng.uniform(-1, 1)}}
+        else:
+            row = {"ts": ts, "event": event, "data": {"iv_slope": rng.uniform(-3, 3)}}
+        rows.append(decode_row(row))
+
+    return rows
+
+
+def _best(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def _run(size: int, repeat: int) -> None:
+    ts_to = 1_760_000_000_000
+    risk_12h = _synthetic_rows(size, "risk_eval", ts_to, 12 * HOUR_MS)
+    # market-wide layers are ~1/10 of risk_eval
+    bybit_12h = _synthetic_rows(max(1, size // 10), "bybit_market_state", ts_to, 12 * HOUR_MS)
+    deribit_12h = _synthetic_rows(max(1, size // 10), "deribit_vbi_snapshot", ts_to, 12 * HOUR_MS)
+    risk_1h = [r for r in risk_12h if r.ts_ms >= ts_to - HOUR_MS]
+    risk_30m = [r for r in risk_1h if r.ts_ms >= ts_to - HOUR_MS // 2]
+
+    supported = list(SYMBOLS)
+    supported_norm = [market_structure._normalize_symbol(s) for s in supported]
+
+    def series():
+        market_structure._risk_series(risk_30m, risk_1h, risk_12h, bybit_12h, deribit_12h, supported, supported_norm)
+
+    numpy_ms = market_structure.USE_NUMPY
+    try:
+        market_structure.USE_NUMPY = False
+        python = _best(series, repeat)
+        line = f"{size} rows   python {python:9.1f} ms"
+        if numpy_ms:
+            market_structure.USE_NUMPY = True
+            vectorized = _best(series, repeat)
+            line += f"   numpy {vectorized:9.1f} ms   x{python / vectorized:.1f}"
+        print(line)
+    finally:
+        market_structure.USE_NUMPY = numpy_ms
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if not market_structure.USE_NUMPY:
+        print("numpy is not installed: timing the pure Python path only")
+
+    for size in args.sizes:
+        _run(size, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
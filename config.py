@@ -3,6 +3,55 @@ import os
 SUPABASE_URL = os.getenv("SUPABASE_URL", "").strip()
 SUPABASE_KEY = os.getenv("SUPABASE_KEY", "").strip()
 
+# Keep-alive transport shared by every Supabase reader/writer.
+SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", "8"))
+SUPABASE_POOL_PER_HOST = int(os.getenv("SUPABASE_POOL_PER_HOST", "8"))
+SUPABASE_POOL_IDLE_SECONDS = float(os.getenv("SUPABASE_POOL_IDLE_SECONDS", "30"))
+# HTTP/2 for the async (httpx) client; needs the `h2` package.
+SUPABASE_HTTP2 = os.getenv("SUPABASE_HTTP2", "0").strip().lower() in ("1", "true", "yes")
+
+# In-process cache of recent `logs` rows shared by overlapping windows.
+# SUPABASE_ROW_CACHE_ROWS=0 disables it.
+SUPABASE_ROW_CACHE_ROWS = int(os.getenv("SUPABASE_ROW_CACHE_ROWS", "100000"))
+SUPABASE_ROW_CACHE_LIVE_MAX_AGE_SECONDS = float(os.getenv("SUPABASE_ROW_CACHE_LIVE_MAX_AGE_SECONDS", "30"))
+SUPABASE_ROW_CACHE_SETTLE_SECONDS = float(os.getenv("SUPABASE_ROW_CACHE_SETTLE_SECONDS", "120"))
+
+# Per-minute / per-hour / per-day partial aggregates of the snapshot layers,
+# so a window only aggregates the rows of its uncovered edges. Keys are
+# (symbol, event) pairs, five per symbol; SNAPSHOT_ROLLUP_KEYS=0 disables them.
+SNAPSHOT_ROLLUP_KEYS = int(os.getenv("SNAPSHOT_ROLLUP_KEYS", "160"))
+SNAPSHOT_ROLLUP_MINUTE_HOURS = float(os.getenv("SNAPSHOT_ROLLUP_MINUTE_HOURS", "24"))
+SNAPSHOT_ROLLUP_HOUR_DAYS = float(os.getenv("SNAPSHOT_ROLLUP_HOUR_DAYS", "35"))
+SNAPSHOT_ROLLUP_DAYS = float(os.getenv("SNAPSHOT_ROLLUP_DAYS", "35"))
+# Ingest horizon: hour and day partials are only stored once this old, and
+# never revisited, so a row logged later than that is missing from them.
+# Minute partials use SUPABASE_ROW_CACHE_SETTLE_SECONDS like the row cache.
+SNAPSHOT_ROLLUP_FINAL_HOURS = float(os.getenv("SNAPSHOT_ROLLUP_FINAL_HOURS", "6"))
+# Absolute path the watcher saves hour and day partials to, so they survive
+# restarts. Empty (the default): not saved. Only useful on a persistent disk;
+# the Render web service's own disk is wiped on every deploy and restart.
+SNAPSHOT_ROLLUP_PATH = os.getenv("SNAPSHOT_ROLLUP_PATH", "").strip()
+# The watcher backfills market-wide partials this far back, a day per cycle,
+# so 7d/30d /stats only fetch their edges (0 disables).
+SNAPSHOT_ROLLUP_BACKFILL_DAYS = int(os.getenv("SNAPSHOT_ROLLUP_BACKFILL_DAYS", "30"))
+# Uncovered ranges of a snapshot (split at days) are fetched this many at a
+# time; each fetch fans out itself, so 2 x FETCH_FAN_OUT fills the pool.
+SNAPSHOT_LOAD_WORKERS = int(os.getenv("SNAPSHOT_LOAD_WORKERS", "2"))
+# A snapshot whose rows are not all loaded by then fails as a timeout
+# (0 waits indefinitely).
+SNAPSHOT_DEADLINE_SECONDS = float(os.getenv("SNAPSHOT_DEADLINE_SECONDS", "90"))
+# /options loads its venues together; a venue not loaded by then is shown
+# as N/A (0 waits indefinitely).
+OPTIONS_DEADLINE_SECONDS = float(os.getenv("OPTIONS_DEADLINE_SECONDS", "20"))
+
+# Relative windows end on this grid (time_utils.as_of_ms) instead of the
+# current ms, so requests a moment apart ask for the same window (0: no grid).
+AS_OF_GRID_SECONDS = float(os.getenv("AS_OF_GRID_SECONDS", "30"))
+# Finished snapshots by (window, symbol, window end); SNAPSHOT_CACHE_SIZE=0
+# disables the cache.
+SNAPSHOT_CACHE_SIZE = int(os.getenv("SNAPSHOT_CACHE_SIZE", "64"))
+SNAPSHOT_CACHE_TTL_SECONDS = float(os.getenv("SNAPSHOT_CACHE_TTL_SECONDS", "60"))
+
 DEFAULT_WINDOW_HOURS = int(os.getenv("DEFAULT_WINDOW_HOURS", "12"))
 
 DATA_SCOPE = {
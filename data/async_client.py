@@ -0,0 +1,397 @@
+import asyncio
+import time
+import weakref
+from urllib.parse import urlencode
+
+import httpx
+
+from config import (
+    SUPABASE_HTTP2,
+    SUPABASE_KEY,
+    SUPABASE_POOL_IDLE_SECONDS,
+    SUPABASE_POOL_PER_HOST,
+    SUPABASE_POOL_SIZE,
+    SUPABASE_URL,
+)
+from data.client import LogQuery, SupabaseClient, SupabaseHTTPError
+from data.http_pool import transfer_stats
+from data.json_codec import loads
+from data.records import decode_row, row_ts_ms
+from data.row_cache import SegmentRowCache
+from data.single_flight import AsyncSingleFlight, default_async_single_flight
+
+
+# Transport errors raised before the request reached the server: the only
+# ones after which a non-idempotent request (an insert) is sent again.
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# One client per event loop: an httpx client's connections belong to the
+# loop that opened them. Weak keys, so a finished loop drops its client.
+_http: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def _new_http() -> httpx.AsyncClient:
+    http2 = SUPABASE_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            http2 = False
+
+    limits = httpx.Limits(
+        max_connections=SUPABASE_POOL_PER_HOST,
+        max_keepalive_connections=SUPABASE_POOL_SIZE,
+        keepalive_expiry=SUPABASE_POOL_IDLE_SECONDS,
+    )
+    return httpx.AsyncClient(limits=limits, http2=http2)
+
+
+def get_http() -> httpx.AsyncClient:
+    """Shared keep-alive httpx client of the running event loop."""
+    loop = asyncio.get_running_loop()
+    http = _http.get(loop)
+    if http is None or http.is_closed:
+        http = _http[loop] = _new_http()
+    return http
+
+
+async def close_http() -> None:
+    """Close the running event loop's client."""
+    http = _http.pop(asyncio.get_running_loop(), None)
+    if http is not None:
+        await http.aclose()
+
+
+async def gather_all(coros) -> list:
+    """asyncio.gather that cancels the siblings when one of them fails."""
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+class AsyncSupabaseClient(SupabaseClient):
+    """
+    asyncio variant of SupabaseClient for the Telegram bot.
+
+    Query building, filtering, the row cache and the projection rules are
+    shared with the blocking client; only the transport is httpx. Awaiting
+    callers can be cancelled, which cancels their in-flight requests.
+    """
+
+    def __init__(
+        self,
+        http: httpx.AsyncClient | None = None,
+        row_cache: SegmentRowCache | None = None,
+        single_flight: AsyncSingleFlight | None = None,
+    ):
+        super().__init__(row_cache=row_cache)
+        self._http = http
+        self.async_single_flight = single_flight or default_async_single_flight
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        return self._http or get_http()
+
+    async def _execute_request_async(self, url: str, headers: dict, label: str = "logs") -> tuple[list[dict], str]:
+        for attempt in range(1, self.MAX_RETRIES + 1):
+            try:
+                response = await self.http.get(url, headers=headers, timeout=self.REQUEST_TIMEOUT_SECONDS)
+            except httpx.TransportError as exc:
+                if attempt == self.MAX_RETRIES:
+                    raise RuntimeError(f"Supabase connection error: {exc}") from exc
+                await asyncio.sleep(self.RETRY_BACKOFF_SECONDS * attempt)
+                continue
+            except httpx.RequestError as exc:
+                # undecodable body, redirect loop, ...: a data source error,
+                # not worth a retry
+                raise RuntimeError(f"Supabase request error: {exc}") from exc
+
+            # httpx decodes gzip / deflate itself; count both sizes.
+            transfer_stats.record(label, response.num_bytes_downloaded, len(response.content))
+
+            if response.status_code >= 400:
+                raise SupabaseHTTPError(response.status_code, response.text)
+
+            page = loads(response.content)
+            content_range = response.headers.get("Content-Range", "")
+            return page, content_range
+
+        raise RuntimeError("Supabase connection error: exhausted retries")
+
+    async def _request_page_async(
+        self,
+        query: LogQuery,
+        ts_from: int,
+        ts_to: int,
+        offset: int = 0,
+        cursor: tuple[object, object] | None = None,
+        count: str | None = None,
+    ) -> tuple[list[dict], str]:
+        url = self._page_url(query, ts_from, ts_to, offset=offset, cursor=cursor)
+        page, content_range = await self._execute_request_async(
+            url,
+            self._build_headers(count),
+            label=",".join(query.events),
+        )
+        if query.fields is not None:
+            page = self._unpack_projection(page, query.fields)
+        return page, content_range
+
+    async def _walk_keyset_async(
+        self,
+        query: LogQuery,
+        ts_from: int,
+        ts_to: int,
+        cursor: tuple[object, object] | None = None,
+        offset: int = 0,
+    ) -> list[dict]:
+        rows: list[dict] = []
+
+        while True:
+            page, _ = await self._request_page_async(query, ts_from, ts_to, offset=offset, cursor=cursor)
+            rows.extend(page)
+
+            if len(page) < self.PAGE_SIZE:
+                return rows
+
+            next_cursor = self._page_cursor(page)
+            if next_cursor is None:
+                offset += len(page)
+            else:
+                cursor = next_cursor
+                offset = 0
+
+    async def _collect_keyset(self, query: LogQuery, ts_from: int, ts_to: int, fan_out: int) -> list[dict]:
+        first, content_range = await self._request_page_async(
+            query,
+            ts_from,
+            ts_to,
+            count="estimated" if fan_out > 1 else None,
+        )
+        if len(first) < self.PAGE_SIZE:
+            return first
+
+        cursor, bounds = self._slice_plan(first, content_range, ts_to, fan_out)
+
+        if bounds is None:
+            rest = await self._walk_keyset_async(
+                query,
+                ts_from,
+                ts_to,
+                cursor=cursor,
+                offset=0 if cursor is not None else len(first),
+            )
+            return first + rest
+
+        walks = [self._walk_keyset_async(query, ts_from, bounds[1], cursor=cursor)]
+        walks.extend(
+            self._walk_keyset_async(query, bounds[idx] + 1, bounds[idx + 1])
+            for idx in range(1, len(bounds) - 1)
+        )
+
+        rows = list(first)
+        for part in await gather_all(walks):
+            rows.extend(part)
+        return rows
+
+    async def _collect_offset(self, query: LogQuery, ts_from: int, ts_to: int, fan_out: int) -> list[dict]:
+        first, content_range = await self._request_page_async(query, ts_from, ts_to, count="exact")
+        rows = list(first)
+
+        total = self._parse_total_from_content_range(content_range)
+        if total is None:
+            offset = 0
+            page = first
+            while len(page) >= self.PAGE_SIZE:
+                offset += self.PAGE_SIZE
+                page, _ = await self._request_page_async(query, ts_from, ts_to, offset=offset)
+                rows.extend(page)
+            return rows
+
+        if not first:
+            return rows
+
+        slots = asyncio.Semaphore(max(1, fan_out))
+
+        async def request(offset: int) -> list[dict]:
+            async with slots:
+                page, _ = await self._request_page_async(query, ts_from, ts_to, offset=offset)
+                return page
+
+        for page in await gather_all(request(o) for o in range(self.PAGE_SIZE, total, self.PAGE_SIZE)):
+            rows.extend(page)
+        return rows
+
+    async def _collect_rows(
+        self,
+        query: LogQuery,
+        ts_from: int,
+        ts_to: int,
+        keep,
+        pagination: str | None,
+        fan_out: int | None,
+    ) -> list[dict]:
+        mode = pagination or self.PAGINATION
+        fan_out = self.FETCH_FAN_OUT if fan_out is None else fan_out
+
+        async def rows_for(q: LogQuery) -> list[dict]:
+            if mode == "keyset":
+                page = await self._collect_keyset(q, ts_from, ts_to, fan_out)
+            elif mode == "offset":
+                page = await self._collect_offset(q, ts_from, ts_to, fan_out)
+            else:
+                raise ValueError(f"Unknown pagination mode: {mode}")
+
+            return self._decode_page(page, ts_from, ts_to, keep)
+
+        # Same HTTP 400 fallback as the blocking client.
+        plain = LogQuery(events=query.events)
+        if query == plain:
+            return await rows_for(plain)
+
+        try:
+            return await rows_for(query)
+        except SupabaseHTTPError as exc:
+            if exc.status != 400:
+                raise
+            return await rows_for(plain)
+
+    async def fetch(
+        self,
+        event: str,
+        ts_from: int,
+        ts_to: int,
+        symbol: str | None = None,
+        pagination: str | None = None,
+        fan_out: int | None = None,
+        symbol_pushdown: bool | None = None,
+        fields: tuple[str, ...] | None = None,
+    ) -> list[dict]:
+        result = await self.fetch_many(
+            (event,),
+            ts_from,
+            ts_to,
+            symbol=symbol,
+            fields=None if fields is None else {event: fields},
+            pagination=pagination,
+            fan_out=fan_out,
+            symbol_pushdown=symbol_pushdown,
+        )
+        return result[event]
+
+    async def fetch_many(
+        self,
+        events,
+        ts_from: int,
+        ts_to: int,
+        symbol: str | None = None,
+        symbols: dict | None = None,
+        fields: dict | None = None,
+        pagination: str | None = None,
+        fan_out: int | None = None,
+        symbol_pushdown: bool | None = None,
+    ) -> dict[str, list[dict]]:
+        if not SUPABASE_URL or not SUPABASE_KEY:
+            raise RuntimeError("Supabase credentials not set")
+
+        events = tuple(dict.fromkeys(events))
+        args = (events, ts_from, ts_to, symbol, symbols, fields, pagination, fan_out, symbol_pushdown)
+        result = await self.async_single_flight.do(
+            self._fetch_many_key(*args),
+            lambda: self._fetch_many_async(*args),
+            stamp=ts_to,
+        )
+        return {event: list(rows) for event, rows in result.items()}
+
+    async def _fetch_many_async(
+        self, events, ts_from, ts_to, symbol, symbols, fields, pagination, fan_out, symbol_pushdown
+    ) -> dict[str, list[dict]]:
+        if not events:
+            return {}
+
+        projected = self._projection(events, fields)
+
+        async def load(group, a, b):
+            query, keep = self._logs_query(
+                group,
+                self._event_symbols(group, symbol, symbols),
+                projected,
+                symbol_pushdown,
+            )
+            rows = await self._collect_rows(query, a, b, keep, pagination, fan_out)
+            return self._split_by_event(group, rows)
+
+        if not self.row_cache.enabled:
+            return await load(events, ts_from, ts_to)
+
+        keys = self._cache_keys(events, symbol, symbols, projected)
+        pieces, gaps = self._cache_plan(keys, ts_from, ts_to)
+
+        now_ms = int(time.time() * 1000)
+        loaded = await gather_all(load(tuple(group), a, b) for (a, b), group in gaps.items())
+
+        fetched: dict[tuple[str, int], list[dict]] = {}
+        for gap, part in zip(gaps, loaded):
+            self._cache_fill(keys, gap, part, now_ms, fetched)
+
+        return self._cache_assemble(pieces, fetched)
+
+    async def _request_page_generic_async(
+        self,
+        endpoint: str,
+        query_params: list[tuple[str, str]],
+        count: str | None = None,
+    ) -> tuple[list[dict], str]:
+        url = f"{SUPABASE_URL}/rest/v1/{endpoint}?{urlencode(query_params)}"
+        return await self._execute_request_async(url, self._build_headers(count), label=endpoint)
+
+    async def fetch_table(
+        self,
+        table: str,
+        ts_from: int,
+        ts_to: int,
+        symbol: str | None = None,
+        ts_column: str = "ts_unix_ms",
+    ) -> list[dict]:
+        if not SUPABASE_URL or not SUPABASE_KEY:
+            raise RuntimeError("Supabase credentials not set")
+
+        rows: list[dict] = []
+        offset = 0
+        total = None
+
+        while True:
+            page, content_range = await self._request_page_generic_async(
+                table,
+                self._table_params(ts_column, ts_from, ts_to, offset),
+                count="exact" if offset == 0 else None,
+            )
+            rows.extend(page)
+
+            if total is None:
+                total = self._parse_total_from_content_range(content_range)
+
+            if total is not None:
+                if offset + len(page) >= total or not page:
+                    break
+            elif len(page) < self.PAGE_SIZE:
+                break
+
+            offset += self.PAGE_SIZE
+
+        return self._filter_by_symbol([decode_row(self._extract_row_payload(r)) for r in rows], symbol)
+
+    async def fetch_latest_log_ts(self) -> int | None:
+        if not SUPABASE_URL or not SUPABASE_KEY:
+            raise RuntimeError("Supabase credentials not set")
+
+        page, _ = await self._request_page_generic_async("logs", self._latest_ts_params())
+
+        if not page:
+            return None
+
+        return row_ts_ms(page[0])
@@ -1,12 +1,36 @@
-from datetime import datetime, timezone
-from json import loads
-import socket
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import math
+import queue
+import threading
 import time
-from urllib.error import HTTPError, URLError
 from urllib.parse import urlencode
-from urllib.request import Request, urlopen
 
 from config import SUPABASE_URL, SUPABASE_KEY
+from data.http_pool import ACCEPT_ENCODING, TRANSIENT_ERRORS, ConnectionPool, default_pool
+from data.json_codec import load_chunks, loads
+from data.records import SYMBOL_QUOTES, SYMBOL_SEPARATORS, LogRow, decode_row, normalize_symbol, row_ts_ms
+from data.row_cache import SegmentRowCache, default_row_cache
+from data.single_flight import SingleFlight, default_single_flight
+
+
+_FIELD_ALIAS_PREFIX = "data__"
+
+
+@dataclass(frozen=True)
+class LogQuery:
+    """Shape of a paginated `logs` request, shared by every page of a fetch."""
+
+    events: tuple[str, ...]
+    conditions: tuple[str, ...] = ()
+    fields: tuple[str, ...] | None = None
+
+
+class SupabaseHTTPError(RuntimeError):
+    def __init__(self, status: int, detail: str):
+        super().__init__(f"Supabase HTTP error {status}: {detail}")
+        self.status = status
 
 
 class SupabaseClient:
@@ -14,17 +38,39 @@ class SupabaseClient:
     REQUEST_TIMEOUT_SECONDS = 10
     MAX_RETRIES = 3
     RETRY_BACKOFF_SECONDS = 1.5
-
-    def _build_request(self, url: str) -> Request:
-        return Request(
-            url,
-            headers={
-                "apikey": SUPABASE_KEY,
-                "Authorization": f"Bearer {SUPABASE_KEY}",
-                "Prefer": "count=exact",
-            },
-            method="GET",
-        )
+    # "keyset" resumes each page after the last (ts, id) seen; "offset" is the
+    # legacy limit/offset walk, kept for endpoints without a stable id column.
+    PAGINATION = "keyset"
+    # Concurrent page requests per fetch once the row count is known.
+    FETCH_FAN_OUT = 4
+    # Pages a parallel slice may buffer ahead of the consumer; bounds the
+    # memory of a streaming fetch to fan_out * SLICE_BUFFER_PAGES pages.
+    SLICE_BUFFER_PAGES = 2
+    # Send the symbol predicate to PostgREST instead of filtering locally.
+    SYMBOL_PUSHDOWN = True
+    # Parse pages while they download instead of after the whole body is in.
+    # Lowers peak memory per page; costs CPU with the stdlib parser.
+    STREAM_DECODE = False
+
+    def __init__(
+        self,
+        pool: ConnectionPool | None = None,
+        row_cache: SegmentRowCache | None = None,
+        single_flight: SingleFlight | None = None,
+    ):
+        self.pool = pool or default_pool
+        self.row_cache = row_cache or default_row_cache
+        self.single_flight = single_flight or default_single_flight
+
+    def _build_headers(self, count: str | None = None) -> dict:
+        headers = {
+            "apikey": SUPABASE_KEY,
+            "Authorization": f"Bearer {SUPABASE_KEY}",
+            "Accept-Encoding": ACCEPT_ENCODING,
+        }
+        if count:
+            headers["Prefer"] = f"count={count}"
+        return headers
 
     def _parse_total_from_content_range(self, content_range: str) -> int | None:
         if "/" not in content_range:
@@ -36,25 +82,46 @@ class SupabaseClient:
 
         return None
 
-    def _execute_request(self, req: Request) -> tuple[list[dict], str]:
+    def _execute_request(self, url: str, headers: dict, label: str = "logs") -> tuple[list[dict], str]:
+        # `label` groups the transfer byte counters (event name or table).
         for attempt in range(1, self.MAX_RETRIES + 1):
             try:
-                with urlopen(req, timeout=self.REQUEST_TIMEOUT_SECONDS) as response:
-                    raw = response.read().decode("utf-8")
-                    page = loads(raw)
-                    content_range = response.headers.get("Content-Range", "")
-                    return page, content_range
-            except HTTPError as exc:
-                detail = exc.read().decode("utf-8", errors="replace") if exc.fp else str(exc)
-                raise RuntimeError(f"Supabase HTTP error {exc.code}: {detail}") from exc
-            except (TimeoutError, socket.timeout, URLError) as exc:
+                if self.STREAM_DECODE:
+                    return self._execute_request_streamed(url, headers, label)
+                status, response_headers, body = self.pool.request(
+                    "GET",
+                    url,
+                    headers=headers,
+                    timeout=self.REQUEST_TIMEOUT_SECONDS,
+                    label=label,
+                )
+            except TRANSIENT_ERRORS as exc:
                 if attempt == self.MAX_RETRIES:
                     reason = getattr(exc, "reason", exc)
                     raise RuntimeError(f"Supabase connection error: {reason}") from exc
                 time.sleep(self.RETRY_BACKOFF_SECONDS * attempt)
+                continue
+
+            if status >= 400:
+                detail = body.decode("utf-8", errors="replace")
+                raise SupabaseHTTPError(status, detail)
+
+            page = loads(body)
+            content_range = response_headers.get("Content-Range", "")
+            return page, content_range
 
         raise RuntimeError("Supabase connection error: exhausted retries")
 
+    def _execute_request_streamed(self, url: str, headers: dict, label: str) -> tuple[list[dict], str]:
+        response = self.pool.open("GET", url, headers=headers, timeout=self.REQUEST_TIMEOUT_SECONDS)
+
+        if response.status >= 400:
+            detail = response.read_decoded(label).decode("utf-8", errors="replace")
+            raise SupabaseHTTPError(response.status, detail)
+
+        page = load_chunks(response.iter_decoded(label))
+        return page, response.headers.get("Content-Range", "")
+
     def _extract_row_payload(self, row: dict) -> dict:
         """
         Normalize heterogeneous Supabase rows into a common `logs`-like shape.
@@ -85,144 +152,735 @@ class SupabaseClient:
 
         return normalized
 
-    def _row_ts_ms(self, row: dict) -> int | None:
-        ts = row.get("ts")
-
-        if ts is None and isinstance(row.get("data"), dict):
-            data = row["data"]
-            ts = (
-                data.get("ts")
-                or data.get("timestamp")
-                or data.get("time")
-                or data.get("created_at")
-            )
+    def _decode_page(self, page: list[dict], ts_from: int, ts_to: int, keep) -> list[LogRow]:
+        """
+        Decode the rows of `page` inside [ts_from, ts_to] that pass
+        `keep(row)`. Every later stage reads the decoded fields.
+        """
+        rows: list[LogRow] = []
 
-        if ts is None:
-            ts = row.get("created_at") or row.get("timestamp") or row.get("time")
+        for row in page:
+            row_ts = row_ts_ms(row)
+            # Strict mode: rows without a parsable timestamp are excluded,
+            # otherwise different windows can collapse to the same dataset.
+            if row_ts is None or not ts_from <= row_ts <= ts_to:
+                continue
+            record = decode_row(self._extract_row_payload(row), row_ts)
+            # The local symbol filter stays on: it makes the pushed-down
+            # superset exact and covers the no-pushdown path.
+            if keep(record):
+                rows.append(record)
 
-        if isinstance(ts, (int, float)):
-            value = int(ts)
-            # Heuristic: convert seconds to milliseconds.
-            return value * 1000 if value < 10_000_000_000 else value
+        return rows
 
-        if isinstance(ts, str):
-            try:
-                return int(ts)
-            except ValueError:
-                try:
-                    dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
-                    if dt.tzinfo is None:
-                        dt = dt.replace(tzinfo=timezone.utc)
-                    return int(dt.timestamp() * 1000)
-                except ValueError:
-                    return None
+    def _normalize_symbol(self, symbol: str) -> str:
+        return normalize_symbol(symbol)
 
-        return None
+    def _symbol_matches(self, row: LogRow, normalized_symbol: str) -> bool:
+        # Keep rows without symbol (global market metrics) to avoid empty
+        # snapshots when only part of the pipeline is symbolized.
+        return row.sym is None or row.sym == normalized_symbol
 
-    def _filter_by_window(self, rows: list[dict], ts_from: int, ts_to: int) -> list[dict]:
-        filtered: list[dict] = []
+    def _filter_by_symbol(self, rows: list[LogRow], symbol: str | None) -> list[LogRow]:
+        if not symbol:
+            return rows
 
-        for row in rows:
-            row_ts = self._row_ts_ms(row)
-            if row_ts is None:
-                # Strict mode: rows without a parsable timestamp are excluded,
-                # otherwise different windows can collapse to the same dataset.
-                continue
-            if ts_from <= row_ts <= ts_to:
-                filtered.append(row)
+        normalized_symbol = self._normalize_symbol(symbol)
+        return [row for row in rows if self._symbol_matches(row, normalized_symbol)]
 
-        return filtered
+    def _page_cursor(self, page: list[dict]) -> tuple[object, object] | None:
+        if not page:
+            return None
 
-    def _normalize_symbol(self, symbol: str) -> str:
-        separators = ("-", "_", "/", ":")
-        value = symbol.upper()
+        last = page[-1]
+        last_ts = last.get("ts")
+        last_id = last.get("id")
+        if isinstance(last_ts, bool) or not isinstance(last_ts, (int, float)):
+            return None
+        if last_id is None:
+            return None
 
-        for sep in separators:
-            value = value.split(sep, 1)[0]
+        return last_ts, last_id
 
-        for quote in ("USDT", "USD", "PERP"):
-            if value.endswith(quote):
-                return value[: -len(quote)]
+    def _symbol_condition(self, symbol: str | None) -> str | None:
+        """
+        PostgREST predicate on data->>symbol matching every row that
+        `_filter_by_symbol` would keep for `symbol`.
 
-        return value
+        A row symbol normalizes to N when its part before the first separator
+        is N, optionally followed by one quote suffix. The predicate is a
+        superset of that rule (ilike treats `_` as a wildcard), so the local
+        filter still runs afterwards to make the result exact.
+        """
+        if not symbol:
+            return None
 
-    def _row_symbol(self, row: dict) -> str | None:
-        if isinstance(row.get("symbol"), str):
-            return row["symbol"]
+        base = self._normalize_symbol(symbol)
+        if not base:
+            return None
 
-        data = row.get("data")
-        if isinstance(data, dict) and isinstance(data.get("symbol"), str):
-            return data["symbol"]
+        heads = [base] + [base + quote for quote in SYMBOL_QUOTES]
+        patterns = list(heads)
+        for head in heads:
+            patterns.extend(f"{head}{sep}*" for sep in SYMBOL_SEPARATORS)
+
+        clauses = ["data->>symbol.is.null"]
+        clauses.extend(f'data->>symbol.ilike."{pattern}"' for pattern in patterns)
+        return f"or({','.join(clauses)})"
+
+    def _select_clause(self, fields: tuple[str, ...]) -> str:
+        # Each JSON path is aliased so it can be folded back into `data`.
+        columns = ["id", "ts", "event"]
+        columns.extend(f"{_FIELD_ALIAS_PREFIX}{field}:data->{field}" for field in fields)
+        return ",".join(columns)
+
+    def _unpack_projection(self, page: list[dict], fields: tuple[str, ...]) -> list[dict]:
+        rows = []
+        for row in page:
+            data = {}
+            for field in fields:
+                value = row.pop(f"{_FIELD_ALIAS_PREFIX}{field}", None)
+                # Missing keys come back as null; drop them so `.get(key,
+                # default)` in the aggregators behaves as with the full blob.
+                if value is not None:
+                    data[field] = value
+            row["data"] = data
+            rows.append(row)
+        return rows
+
+    def _event_filter(self, events: tuple[str, ...]) -> str:
+        if len(events) == 1:
+            return f"eq.{events[0]}"
+        return f"in.({','.join(events)})"
+
+    def _page_url(
+        self,
+        query: LogQuery,
+        ts_from: int,
+        ts_to: int,
+        offset: int = 0,
+        cursor: tuple[object, object] | None = None,
+    ) -> str:
+        clauses = [f"ts.gte.{ts_from}", f"ts.lte.{ts_to}"]
 
-        return None
+        if cursor is not None:
+            last_ts, last_id = cursor
+            clauses.append(f"or(ts.gt.{last_ts},and(ts.eq.{last_ts},id.gt.{last_id}))")
 
-    def _filter_by_symbol(self, rows: list[dict], symbol: str | None) -> list[dict]:
-        if not symbol:
-            return rows
+        clauses.extend(query.conditions)
 
-        normalized_symbol = self._normalize_symbol(symbol)
-        filtered: list[dict] = []
+        query_params = [
+            ("event", self._event_filter(query.events)),
+            ("and", f"({','.join(clauses)})"),
+        ]
 
-        for row in rows:
-            row_symbol = self._row_symbol(row)
-            if row_symbol is None:
-                # Keep rows without symbol (global market metrics) to avoid
-                # empty snapshots when only part of the pipeline is symbolized.
-                filtered.append(row)
-                continue
+        if query.fields is not None:
+            query_params.append(("select", self._select_clause(query.fields)))
 
-            if self._normalize_symbol(row_symbol) == normalized_symbol:
-                filtered.append(row)
+        if cursor is not None:
+            query_params.append(("order", "ts.asc,id.asc"))
+        else:
+            query_params.append(("order", "ts.asc,id.asc" if self.PAGINATION == "keyset" else "ts.asc"))
 
-        return filtered
+        query_params.append(("limit", str(self.PAGE_SIZE)))
+        if offset:
+            query_params.append(("offset", str(offset)))
 
-    def _request_page(self, event: str, ts_from: int, ts_to: int, offset: int) -> tuple[list[dict], str]:
-        query = urlencode(
-            [
-                ("event", f"eq.{event}"),
-                ("and", f"(ts.gte.{ts_from},ts.lte.{ts_to})"),
-                ("order", "ts.asc"),
-                ("limit", str(self.PAGE_SIZE)),
-                ("offset", str(offset)),
-            ]
-        )
-        url = f"{SUPABASE_URL}/rest/v1/logs?{query}"
+        return f"{SUPABASE_URL}/rest/v1/logs?{urlencode(query_params)}"
 
-        req = self._build_request(url)
-        page, content_range = self._execute_request(req)
+    def _request_page(
+        self,
+        query: LogQuery,
+        ts_from: int,
+        ts_to: int,
+        offset: int = 0,
+        cursor: tuple[object, object] | None = None,
+        count: str | None = None,
+    ) -> tuple[list[dict], str]:
+        url = self._page_url(query, ts_from, ts_to, offset=offset, cursor=cursor)
+        page, content_range = self._execute_request(url, self._build_headers(count), label=",".join(query.events))
+        if query.fields is not None:
+            page = self._unpack_projection(page, query.fields)
         return page, content_range
 
-    def _request_page_generic(self, endpoint: str, query_params: list[tuple[str, str]]) -> tuple[list[dict], str]:
+    def _request_page_generic(
+        self,
+        endpoint: str,
+        query_params: list[tuple[str, str]],
+        count: str | None = None,
+    ) -> tuple[list[dict], str]:
         query = urlencode(query_params)
         url = f"{SUPABASE_URL}/rest/v1/{endpoint}?{query}"
 
-        req = self._build_request(url)
-        page, content_range = self._execute_request(req)
+        page, content_range = self._execute_request(url, self._build_headers(count), label=endpoint)
         return page, content_range
 
-    def fetch(self, event: str, ts_from: int, ts_to: int, symbol: str | None = None) -> list[dict]:
+    def _walk_keyset(
+        self,
+        query: LogQuery,
+        ts_from: int,
+        ts_to: int,
+        cursor: tuple[object, object] | None = None,
+        prefetch: bool = False,
+        offset: int = 0,
+    ):
+        """
+        Walk the window with a (ts, id) cursor instead of an offset.
+
+        Every page is an index range scan starting right after the last row
+        seen, so deep pages cost the same as the first one and rows inserted
+        mid-walk cannot shift page boundaries (no duplicates, no gaps).
+
+        With prefetch=True the request for page N+1 is in flight while the
+        caller is still processing page N.
+        """
+        def request(cur, off):
+            page, _ = self._request_page(query, ts_from, ts_to, offset=off, cursor=cur)
+            return page
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = executor.submit(request, cursor, offset) if prefetch else None
+
+            while True:
+                page = pending.result() if pending is not None else request(cursor, offset)
+                pending = None
+
+                if len(page) < self.PAGE_SIZE:
+                    yield page
+                    return
+
+                next_cursor = self._page_cursor(page)
+                if next_cursor is None:
+                    # Rows without a usable (ts, id): continue with offsets over
+                    # the remaining tail, relative to the last good cursor.
+                    offset += len(page)
+                else:
+                    cursor = next_cursor
+                    offset = 0
+
+                if prefetch:
+                    pending = executor.submit(request, cursor, offset)
+                yield page
+
+    def _iter_pages_keyset(self, query: LogQuery, ts_from: int, ts_to: int, fan_out: int):
+        first, content_range = self._request_page(
+            query,
+            ts_from,
+            ts_to,
+            count="estimated" if fan_out > 1 else None,
+        )
+        yield first
+
+        if len(first) < self.PAGE_SIZE:
+            return
+
+        cursor, bounds = self._slice_plan(first, content_range, ts_to, fan_out)
+
+        if bounds is None:
+            # Row count unknown (or a single page left): stay sequential but
+            # keep the next request in flight while this one is consumed.
+            yield from self._walk_keyset(
+                query,
+                ts_from,
+                ts_to,
+                cursor=cursor,
+                prefetch=cursor is not None,
+                # no usable cursor: skip the rows of the first page by offset
+                offset=0 if cursor is not None else len(first),
+            )
+            return
+
+        # Walk each time slice with its own cursor concurrently. Slices are
+        # yielded in time order, so the result stays ts-sorted.
+        walkers = [lambda: self._walk_keyset(query, ts_from, bounds[1], cursor=cursor)]
+        walkers.extend(
+            (lambda lo=bounds[idx] + 1, hi=bounds[idx + 1]: self._walk_keyset(query, lo, hi))
+            for idx in range(1, len(bounds) - 1)
+        )
+        yield from self._stream_slices(walkers)
+
+    def _slice_plan(self, first: list[dict], content_range: str, ts_to: int, fan_out: int):
+        """
+        Decide how to walk the rest of a keyset fetch after its first page.
+
+        Returns (cursor, bounds): `bounds` splits (cursor ts, ts_to] into
+        contiguous time slices to walk concurrently, or is None when the
+        rest should be walked sequentially from `cursor`.
+        """
+        cursor = self._page_cursor(first)
+        estimate = self._parse_total_from_content_range(content_range)
+        slices = 1
+        if fan_out > 1 and cursor is not None and estimate is not None and isinstance(cursor[0], int):
+            remaining = max(0, estimate - len(first))
+            slices = max(1, min(fan_out, math.ceil(remaining / self.PAGE_SIZE), ts_to - cursor[0]))
+
+        if cursor is None or slices == 1:
+            return cursor, None
+
+        last_ts = cursor[0]
+        bounds = [last_ts + (ts_to - last_ts) * k // slices for k in range(slices + 1)]
+        bounds[-1] = ts_to
+        return cursor, bounds
+
+    def _stream_slices(self, walkers: list):
+        """
+        Run each page walker on its own thread and yield their pages in
+        walker order. Every walker buffers at most SLICE_BUFFER_PAGES pages,
+        so later slices download ahead without holding the whole window.
+        """
+        cancel = threading.Event()
+        done = object()
+        queues = [queue.Queue(maxsize=self.SLICE_BUFFER_PAGES) for _ in walkers]
+
+        def put(q: queue.Queue, item) -> bool:
+            while not cancel.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def run(walk, q: queue.Queue) -> None:
+            try:
+                for page in walk():
+                    if not put(q, page):
+                        return
+                put(q, done)
+            except BaseException as exc:  # noqa: BLE001 - re-raised by the consumer
+                put(q, exc)
+
+        for walk, q in zip(walkers, queues):
+            threading.Thread(target=run, args=(walk, q), daemon=True).start()
+
+        try:
+            for q in queues:
+                while True:
+                    item = q.get()
+                    if item is done:
+                        break
+                    if isinstance(item, BaseException):
+                        raise item
+                    yield item
+        finally:
+            # Consumer finished or gave up: let blocked walkers exit.
+            cancel.set()
+
+    def _iter_pages_offset(self, query: LogQuery, ts_from: int, ts_to: int, fan_out: int):
+        # Only the first page pays for the exact count.
+        first, content_range = self._request_page(query, ts_from, ts_to, count="exact")
+        yield first
+
+        total = self._parse_total_from_content_range(content_range)
+
+        if total is None:
+            offset = 0
+            page = first
+            while len(page) >= self.PAGE_SIZE:
+                offset += self.PAGE_SIZE
+                page, _ = self._request_page(query, ts_from, ts_to, offset=offset)
+                yield page
+            return
+
+        offsets = list(range(self.PAGE_SIZE, total, self.PAGE_SIZE))
+        if not offsets or not first:
+            return
+
+        def request(offset: int) -> list[dict]:
+            page, _ = self._request_page(query, ts_from, ts_to, offset=offset)
+            return page
+
+        # Sliding window of in-flight pages: at most fan_out pages are
+        # requested ahead of the one being consumed.
+        workers = max(1, min(fan_out, len(offsets)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            remaining = iter(offsets)
+            for offset in remaining:
+                pending.append(executor.submit(request, offset))
+                if len(pending) >= workers:
+                    break
+
+            while pending:
+                page = pending.popleft().result()
+                next_offset = next(remaining, None)
+                if next_offset is not None:
+                    pending.append(executor.submit(request, next_offset))
+                yield page
+
+    def _iter_pages(self, query: LogQuery, ts_from: int, ts_to: int, pagination: str, fan_out: int):
+        if pagination == "keyset":
+            return self._iter_pages_keyset(query, ts_from, ts_to, fan_out)
+        if pagination == "offset":
+            return self._iter_pages_offset(query, ts_from, ts_to, fan_out)
+        raise ValueError(f"Unknown pagination mode: {pagination}")
+
+    def _stream_rows(
+        self,
+        query: LogQuery,
+        ts_from: int,
+        ts_to: int,
+        keep,
+        pagination: str | None,
+        fan_out: int | None,
+    ):
+        """
+        Yield rows of `query` that pass the window filter and `keep(row)`.
+
+        If PostgREST rejects the pushed-down predicate or projection (HTTP
+        400) before any row was produced, the plain event stream is fetched
+        instead and filtered client side.
+        """
+        plain = LogQuery(events=query.events)
+
+        def rows_for(q: LogQuery):
+            pages = self._iter_pages(
+                q,
+                ts_from,
+                ts_to,
+                pagination or self.PAGINATION,
+                self.FETCH_FAN_OUT if fan_out is None else fan_out,
+            )
+            for page in pages:
+                yield from self._decode_page(page, ts_from, ts_to, keep)
+
+        if query == plain:
+            yield from rows_for(plain)
+            return
+
+        started = False
+        try:
+            for row in rows_for(query):
+                started = True
+                yield row
+        except SupabaseHTTPError as exc:
+            if exc.status != 400 or started:
+                raise
+            yield from rows_for(plain)
+
+    def _logs_query(
+        self,
+        events: tuple[str, ...],
+        per_event_symbol: dict,
+        fields: tuple[str, ...] | None,
+        symbol_pushdown: bool | None,
+    ):
+        """
+        Build the LogQuery for `events` and the local `keep(row)` predicate
+        that makes its (superset) symbol push-down exact.
+        """
+        pushdown = self.SYMBOL_PUSHDOWN if symbol_pushdown is None else symbol_pushdown
+        conditions: tuple[str, ...] = ()
+        if pushdown and any(per_event_symbol.values()):
+            if len(events) == 1:
+                condition = self._symbol_condition(per_event_symbol[events[0]])
+                conditions = (condition,) if condition else ()
+            else:
+                branches = []
+                for e in events:
+                    condition = self._symbol_condition(per_event_symbol[e])
+                    branches.append(f"and(event.eq.{e},{condition})" if condition else f"event.eq.{e}")
+                conditions = (f"or({','.join(branches)})",)
+
+        normalized = {
+            e: self._normalize_symbol(sym) if sym else None
+            for e, sym in per_event_symbol.items()
+        }
+
+        if len(events) == 1:
+            target = normalized[events[0]]
+
+            def keep(row: LogRow) -> bool:
+                return target is None or self._symbol_matches(row, target)
+        else:
+            def keep(row: LogRow) -> bool:
+                event = row.get("event")
+                if event not in normalized:
+                    return False
+                target = normalized[event]
+                return target is None or self._symbol_matches(row, target)
+
+        return LogQuery(events=events, conditions=conditions, fields=fields), keep
+
+    def fetch_iter(
+        self,
+        event: str,
+        ts_from: int,
+        ts_to: int,
+        symbol: str | None = None,
+        pagination: str | None = None,
+        fan_out: int | None = None,
+        symbol_pushdown: bool | None = None,
+        fields: tuple[str, ...] | None = None,
+    ):
+        """
+        Yield rows of one `logs` event inside [ts_from, ts_to], ts-sorted,
+        page by page. Only a few pages are buffered at any time, so memory
+        does not grow with the window.
+
+        fields — JSON keys of `data` to transfer (None: the whole blob).
+        `symbol` is always added so the local symbol filter keeps working.
+        """
         if not SUPABASE_URL or not SUPABASE_KEY:
             raise RuntimeError("Supabase credentials not set")
-        rows: list[dict] = []
-        offset = 0
 
-        while True:
-            page, content_range = self._request_page(event, ts_from, ts_to, offset)
-            rows.extend(page)
+        query, keep = self._logs_query(
+            (event,),
+            {event: symbol},
+            self._projection((event,), {event: fields}),
+            symbol_pushdown,
+        )
+        yield from self._stream_rows(query, ts_from, ts_to, keep, pagination, fan_out)
+
+    def _fetch_key(self, event, ts_from, ts_to, symbol, pagination, fan_out, symbol_pushdown, fields) -> tuple:
+        return (
+            "fetch",
+            event,
+            ts_to - ts_from,
+            self._normalize_symbol(symbol) if symbol else None,
+            self._projection((event,), {event: fields}),
+            pagination,
+            fan_out,
+            symbol_pushdown,
+        )
 
-            total = self._parse_total_from_content_range(content_range)
+    def fetch(
+        self,
+        event: str,
+        ts_from: int,
+        ts_to: int,
+        symbol: str | None = None,
+        pagination: str | None = None,
+        fan_out: int | None = None,
+        symbol_pushdown: bool | None = None,
+        fields: tuple[str, ...] | None = None,
+    ) -> list[dict]:
+        """
+        Fetch one event over [ts_from, ts_to]. Identical concurrent calls
+        (same window end) share one fetch.
+        """
+        rows = self.single_flight.do(
+            self._fetch_key(event, ts_from, ts_to, symbol, pagination, fan_out, symbol_pushdown, fields),
+            lambda: self._fetch(event, ts_from, ts_to, symbol, pagination, fan_out, symbol_pushdown, fields),
+            stamp=ts_to,
+        )
+        # Callers sharing a result each get their own list.
+        return list(rows)
+
+    def _fetch(self, event, ts_from, ts_to, symbol, pagination, fan_out, symbol_pushdown, fields) -> list[dict]:
+        def load(events, a, b):
+            rows = self.fetch_iter(
+                event,
+                a,
+                b,
+                symbol=symbol,
+                pagination=pagination,
+                fan_out=fan_out,
+                symbol_pushdown=symbol_pushdown,
+                fields=fields,
+            )
+            return {event: list(rows)}
 
-            if total is not None:
-                if offset + len(page) >= total:
-                    break
-            elif len(page) < self.PAGE_SIZE:
-                break
+        if not self.row_cache.enabled:
+            return load((event,), ts_from, ts_to)[event]
 
-            offset += self.PAGE_SIZE
+        key = self._cache_key(event, symbol, self._projection((event,), {event: fields}))
+        return self._read_through({event: key}, ts_from, ts_to, load)[event]
+
+    def fetch_many_iter(
+        self,
+        events,
+        ts_from: int,
+        ts_to: int,
+        symbol: str | None = None,
+        symbols: dict | None = None,
+        fields: dict | None = None,
+        pagination: str | None = None,
+        fan_out: int | None = None,
+        symbol_pushdown: bool | None = None,
+    ):
+        """
+        Yield rows of several `logs` events from one `event=in.(...)` stream,
+        in (ts, id) order. Every row keeps its `event` key.
+
+        symbols — per-event symbol overriding `symbol` (e.g. okx -> MARKET)
+        fields  — per-event JSON keys; the request projects their union, and
+                  an event without an entry disables projection entirely.
+        """
+        if not SUPABASE_URL or not SUPABASE_KEY:
+            raise RuntimeError("Supabase credentials not set")
+
+        events = tuple(dict.fromkeys(events))
+        if not events:
+            return
 
-        rows = self._filter_by_window(rows, ts_from, ts_to)
-        rows = self._filter_by_symbol(rows, symbol)
-        return [self._extract_row_payload(r) for r in rows]
+        query, keep = self._logs_query(
+            events,
+            self._event_symbols(events, symbol, symbols),
+            self._projection(events, fields),
+            symbol_pushdown,
+        )
+        yield from self._stream_rows(query, ts_from, ts_to, keep, pagination, fan_out)
+
+    def _fetch_many_key(
+        self, events, ts_from, ts_to, symbol, symbols, fields, pagination, fan_out, symbol_pushdown
+    ) -> tuple:
+        per_event_symbol = self._event_symbols(events, symbol, symbols)
+        return (
+            "fetch_many",
+            events,
+            ts_to - ts_from,
+            tuple(
+                self._normalize_symbol(per_event_symbol[e]) if per_event_symbol[e] else None
+                for e in events
+            ),
+            self._projection(events, fields),
+            pagination,
+            fan_out,
+            symbol_pushdown,
+        )
+
+    def fetch_many(
+        self,
+        events,
+        ts_from: int,
+        ts_to: int,
+        symbol: str | None = None,
+        symbols: dict | None = None,
+        fields: dict | None = None,
+        pagination: str | None = None,
+        fan_out: int | None = None,
+        symbol_pushdown: bool | None = None,
+    ) -> dict[str, list[dict]]:
+        """
+        Fetch several events over the same window in one paginated request
+        chain and split the rows back by event (each list ts-sorted).
+        Identical concurrent calls share one fetch, as in `fetch`.
+        """
+        events = tuple(dict.fromkeys(events))
+        args = (events, ts_from, ts_to, symbol, symbols, fields, pagination, fan_out, symbol_pushdown)
+        result = self.single_flight.do(
+            self._fetch_many_key(*args),
+            lambda: self._fetch_many(*args),
+            stamp=ts_to,
+        )
+        return {event: list(rows) for event, rows in result.items()}
+
+    def _fetch_many(
+        self, events, ts_from, ts_to, symbol, symbols, fields, pagination, fan_out, symbol_pushdown
+    ) -> dict[str, list[dict]]:
+        projected = self._projection(events, fields)
+
+        def load(group, a, b):
+            rows = self.fetch_many_iter(
+                group,
+                a,
+                b,
+                symbol=symbol,
+                symbols=symbols,
+                # Every group is projected like the full request so cached
+                # rows look the same whichever group fetched them.
+                fields=None if projected is None else {e: projected for e in group},
+                pagination=pagination,
+                fan_out=fan_out,
+                symbol_pushdown=symbol_pushdown,
+            )
+            return self._split_by_event(group, rows)
+
+        if not self.row_cache.enabled or not events:
+            return load(events, ts_from, ts_to)
+
+        keys = self._cache_keys(events, symbol, symbols, projected)
+        return self._read_through(keys, ts_from, ts_to, load)
+
+    def _split_by_event(self, events: tuple[str, ...], rows) -> dict[str, list[dict]]:
+        result: dict[str, list[dict]] = {e: [] for e in events}
+        for row in rows:
+            result[row["event"]].append(row)
+        return result
+
+    def _event_symbols(self, events: tuple[str, ...], symbol: str | None, symbols: dict | None) -> dict:
+        symbols = symbols or {}
+        return {e: symbols[e] if e in symbols else symbol for e in events}
+
+    def _projection(self, events: tuple[str, ...], fields: dict | None) -> tuple[str, ...] | None:
+        # Union of the per-event keys; None (the whole blob) if any event
+        # needs it. `symbol` is always kept for the local symbol filter.
+        if fields is None or any(fields.get(e) is None for e in events):
+            return None
+        projected = ("symbol",)
+        for e in events:
+            projected += tuple(fields[e])
+        return tuple(dict.fromkeys(projected))
+
+    def _cache_key(self, event: str, symbol: str | None, fields: tuple[str, ...] | None) -> tuple:
+        return ("logs", event, self._normalize_symbol(symbol) if symbol else None, fields)
+
+    def _cache_keys(self, events, symbol, symbols, projected) -> dict:
+        per_event_symbol = self._event_symbols(events, symbol, symbols)
+        return {e: self._cache_key(e, per_event_symbol[e], projected) for e in events}
+
+    def _cache_plan(self, keys: dict, ts_from: int, ts_to: int):
+        """
+        Look [ts_from, ts_to] up for every key. Returns (pieces, gaps):
+        per-event cache pieces and {(a, b): [events missing that range]}.
+        """
+        pieces = {e: self.row_cache.lookup(key, ts_from, ts_to) for e, key in keys.items()}
+
+        gaps: dict[tuple[int, int], list[str]] = {}
+        for e, event_pieces in pieces.items():
+            for piece in event_pieces:
+                if piece[0] == "gap":
+                    gaps.setdefault(piece[1:], []).append(e)
+
+        return pieces, gaps
+
+    def _cache_fill(self, keys: dict, gap: tuple[int, int], loaded: dict, now_ms: int, fetched: dict) -> None:
+        a, b = gap
+        for e, rows in loaded.items():
+            row_ts = [row.ts_ms for row in rows]
+            self.row_cache.store(keys[e], a, b, rows, row_ts, now_ms)
+            fetched[(e, a)] = rows
+
+    def _cache_assemble(self, pieces: dict, fetched: dict) -> dict[str, list[dict]]:
+        result: dict[str, list[dict]] = {}
+        for e, event_pieces in pieces.items():
+            rows: list[dict] = []
+            for piece in event_pieces:
+                rows.extend(piece[1] if piece[0] == "rows" else fetched[(e, piece[1])])
+            result[e] = rows
+        return result
+
+    def _read_through(self, keys: dict, ts_from: int, ts_to: int, load) -> dict[str, list[dict]]:
+        """
+        Serve {event: rows} for [ts_from, ts_to] from the row cache, calling
+        `load(events, a, b) -> {event: rows}` once per missing range. Events
+        missing the same range (the usual case) share one request chain.
+        """
+        pieces, gaps = self._cache_plan(keys, ts_from, ts_to)
+
+        fetched: dict[tuple[str, int], list[dict]] = {}
+        for (a, b), group in gaps.items():
+            now_ms = int(time.time() * 1000)
+            self._cache_fill(keys, (a, b), load(tuple(group), a, b), now_ms, fetched)
+
+        return self._cache_assemble(pieces, fetched)
+
+    def _table_params(self, ts_column: str, ts_from: int, ts_to: int, offset: int) -> list[tuple[str, str]]:
+        return [
+            (ts_column, f"gte.{ts_from}"),
+            (ts_column, f"lte.{ts_to}"),
+            ("order", f"{ts_column}.asc"),
+            ("limit", str(self.PAGE_SIZE)),
+            ("offset", str(offset)),
+        ]
+
+    def _latest_ts_params(self) -> list[tuple[str, str]]:
+        return [
+            ("select", "ts"),
+            ("order", "ts.desc"),
+            ("limit", "1"),
+        ]
 
     def fetch_table(
         self,
@@ -237,47 +895,36 @@ class SupabaseClient:
 
         rows: list[dict] = []
         offset = 0
+        total = None
 
         while True:
             page, content_range = self._request_page_generic(
                 table,
-                [
-                    (ts_column, f"gte.{ts_from}"),
-                    (ts_column, f"lte.{ts_to}"),
-                    ("order", f"{ts_column}.asc"),
-                    ("limit", str(self.PAGE_SIZE)),
-                    ("offset", str(offset)),
-                ],
+                self._table_params(ts_column, ts_from, ts_to, offset),
+                count="exact" if offset == 0 else None,
             )
             rows.extend(page)
 
-            total = self._parse_total_from_content_range(content_range)
+            if total is None:
+                total = self._parse_total_from_content_range(content_range)
 
             if total is not None:
-                if offset + len(page) >= total:
+                if offset + len(page) >= total or not page:
                     break
             elif len(page) < self.PAGE_SIZE:
                 break
 
             offset += self.PAGE_SIZE
 
-        rows = self._filter_by_symbol(rows, symbol)
-        return [self._extract_row_payload(r) for r in rows]
+        return self._filter_by_symbol([decode_row(self._extract_row_payload(r)) for r in rows], symbol)
 
     def fetch_latest_log_ts(self) -> int | None:
         if not SUPABASE_URL or not SUPABASE_KEY:
             raise RuntimeError("Supabase credentials not set")
 
-        page, _ = self._request_page_generic(
-            "logs",
-            [
-                ("select", "ts"),
-                ("order", "ts.desc"),
-                ("limit", "1"),
-            ],
-        )
+        page, _ = self._request_page_generic("logs", self._latest_ts_params())
 
         if not page:
             return None
 
-        return self._row_ts_ms(page[0])
+        return row_ts_ms(page[0])
@@ -0,0 +1,400 @@
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+import zlib
+
+from config import (
+    SUPABASE_POOL_IDLE_SECONDS,
+    SUPABASE_POOL_PER_HOST,
+    SUPABASE_POOL_SIZE,
+)
+
+
+# Errors worth retrying at the caller level (socket timeouts, resets, DNS
+# failures, truncated responses). HTTP status errors are reported separately.
+TRANSIENT_ERRORS = (OSError, http.client.HTTPException)
+
+# A kept-alive socket may have been closed by the server while it sat idle;
+# the first write/read on it then fails with one of these.
+_STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+)
+
+# Requests safe to send again once they were written: the server may have
+# processed a request whose response was lost, and a second POST would
+# insert twice.
+_IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+class RequestSentError(RuntimeError):
+    """
+    A non-idempotent request failed after it was written. It may have been
+    processed, so it is neither retried here nor a transient error for
+    callers' retry loops.
+    """
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# Encodings every Supabase reader asks for; responses are decoded on the fly.
+ACCEPT_ENCODING = "gzip, deflate"
+
+
+class TransferStats:
+    """Response bytes per label (event / table): on the wire vs decoded."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_label: dict[str, list[int]] = {}
+
+    def record(self, label: str, wire_bytes: int, decoded_bytes: int) -> None:
+        with self._lock:
+            counters = self._by_label.setdefault(label, [0, 0, 0])
+            counters[0] += 1
+            counters[1] += wire_bytes
+            counters[2] += decoded_bytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                label: {
+                    "responses": responses,
+                    "wire_bytes": wire,
+                    "decoded_bytes": decoded,
+                    "saved_pct": round((1 - wire / decoded) * 100, 1) if decoded else 0.0,
+                }
+                for label, (responses, wire, decoded) in self._by_label.items()
+            }
+
+
+transfer_stats = TransferStats()
+
+
+class _StreamDecoder:
+    """Incremental gzip / deflate decoder (zlib-wrapped or raw deflate)."""
+
+    def __init__(self, encoding: str):
+        if encoding in ("gzip", "x-gzip"):
+            self._wbits = 16 + zlib.MAX_WBITS
+        elif encoding == "deflate":
+            self._wbits = zlib.MAX_WBITS
+        else:
+            raise http.client.HTTPException(f"unsupported Content-Encoding: {encoding}")
+        self._raw_fallback = encoding == "deflate"
+        self._obj = zlib.decompressobj(self._wbits)
+        self._started = False
+
+    def decompress(self, chunk: bytes) -> bytes:
+        try:
+            data = self._obj.decompress(chunk)
+        except zlib.error:
+            if self._started or not self._raw_fallback:
+                raise
+            # Some servers send "deflate" without the zlib header.
+            self._raw_fallback = False
+            self._obj = zlib.decompressobj(-zlib.MAX_WBITS)
+            data = self._obj.decompress(chunk)
+        self._started = True
+        return data
+
+    def flush(self) -> bytes:
+        return self._obj.flush()
+
+
+class PooledResponse:
+    """
+    HTTP response bound to a pooled connection.
+
+    The connection goes back to the pool only when the body was read to the
+    end and the server did not ask to close it; otherwise it is discarded.
+    """
+
+    def __init__(self, pool: "ConnectionPool", key: tuple, conn, response: http.client.HTTPResponse):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self._released = False
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+
+    def read(self) -> bytes:
+        try:
+            body = self._response.read()
+        except BaseException:
+            self._release(reusable=False)
+            raise
+        self._release(reusable=True)
+        return body
+
+    def iter_decoded(self, label: str | None = None):
+        """
+        Yield the body chunk by chunk, decompressed according to
+        Content-Encoding. With `label`, the wire and decoded sizes are added
+        to `transfer_stats` once the body was read to the end.
+        """
+        encoding = (self.headers.get("Content-Encoding") or "").strip().lower()
+        wire = 0
+        decoded = 0
+
+        try:
+            decoder = None if encoding in ("", "identity") else _StreamDecoder(encoding)
+            for chunk in self.read_chunks():
+                wire += len(chunk)
+                if decoder is not None:
+                    chunk = decoder.decompress(chunk)
+                decoded += len(chunk)
+                if chunk:
+                    yield chunk
+            if decoder is not None:
+                tail = decoder.flush()
+                decoded += len(tail)
+                if tail:
+                    yield tail
+        except zlib.error as exc:
+            self.close()
+            raise http.client.HTTPException(f"corrupt {encoding} body: {exc}") from exc
+        except BaseException:
+            self.close()
+            raise
+
+        if label is not None:
+            transfer_stats.record(label, wire, decoded)
+
+    def read_decoded(self, label: str | None = None) -> bytes:
+        return b"".join(self.iter_decoded(label))
+
+    def read_chunks(self, chunk_size: int = 64 * 1024):
+        try:
+            while True:
+                chunk = self._response.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        except BaseException:
+            self._release(reusable=False)
+            raise
+        self._release(reusable=True)
+
+    def close(self) -> None:
+        self._release(reusable=False)
+
+    def _release(self, reusable: bool) -> None:
+        if self._released:
+            return
+        self._released = True
+        reusable = reusable and not self._response.will_close and self._response.isclosed()
+        self._pool._release(self._key, self._conn, reusable)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class ConnectionPool:
+    """
+    Thread-safe HTTP/1.1 keep-alive connection pool.
+
+    max_size      — idle connections retained across all hosts
+    max_per_host  — connections checked out at once for a single host
+    idle_timeout  — idle connections older than this are closed, not reused
+    """
+
+    def __init__(self, max_size: int = 8, max_per_host: int = 8, idle_timeout: float = 30.0):
+        self.max_size = max(0, max_size)
+        self.max_per_host = max(1, max_per_host)
+        self.idle_timeout = idle_timeout
+
+        self._lock = threading.Lock()
+        self._idle: dict[tuple, list[tuple[object, float]]] = {}
+        self._host_slots: dict[tuple, threading.BoundedSemaphore] = {}
+
+        self.connections_opened = 0
+        self.connections_reused = 0
+        self.connections_discarded = 0
+        self.requests = 0
+
+    def _key_for(self, url: str) -> tuple[tuple, str]:
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in _DEFAULT_PORTS:
+            raise ValueError(f"Unsupported URL scheme: {parts.scheme}")
+
+        host = parts.hostname or ""
+        port = parts.port or _DEFAULT_PORTS[scheme]
+        path = parts.path or "/"
+        if parts.query:
+            path = f"{path}?{parts.query}"
+
+        return (scheme, host, port), path
+
+    def _slot(self, key: tuple) -> threading.BoundedSemaphore:
+        with self._lock:
+            slot = self._host_slots.get(key)
+            if slot is None:
+                slot = threading.BoundedSemaphore(self.max_per_host)
+                self._host_slots[key] = slot
+            return slot
+
+    def _new_connection(self, key: tuple, timeout: float):
+        scheme, host, port = key
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(host, port, timeout=timeout)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+
+        with self._lock:
+            self.connections_opened += 1
+        return conn
+
+    def _take_idle(self, key: tuple):
+        now = time.monotonic()
+        expired = []
+
+        with self._lock:
+            bucket = self._idle.get(key, [])
+            conn = None
+            while bucket:
+                candidate, last_used = bucket.pop()
+                if now - last_used > self.idle_timeout:
+                    expired.append(candidate)
+                    continue
+                conn = candidate
+                self.connections_reused += 1
+                break
+            self.connections_discarded += len(expired)
+
+        for stale in expired:
+            stale.close()
+
+        return conn
+
+    def _release(self, key: tuple, conn, reusable: bool) -> None:
+        keep = False
+
+        if reusable:
+            with self._lock:
+                idle_total = sum(len(bucket) for bucket in self._idle.values())
+                if idle_total < self.max_size:
+                    self._idle.setdefault(key, []).append((conn, time.monotonic()))
+                    keep = True
+                else:
+                    self.connections_discarded += 1
+        else:
+            with self._lock:
+                self.connections_discarded += 1
+
+        if not keep:
+            conn.close()
+
+        self._slot(key).release()
+
+    def open(
+        self,
+        method: str,
+        url: str,
+        headers: dict | None = None,
+        body: bytes | None = None,
+        timeout: float = 10.0,
+    ) -> PooledResponse:
+        """
+        Send a request and return the response with the connection still
+        checked out. Callers must read() the body or close() the response.
+        """
+        key, path = self._key_for(url)
+        slot = self._slot(key)
+
+        if not slot.acquire(timeout=timeout):
+            raise TimeoutError(f"connection pool exhausted for {key[1]}")
+
+        with self._lock:
+            self.requests += 1
+
+        conn = self._take_idle(key)
+        reused = conn is not None
+        if conn is None:
+            conn = self._new_connection(key, timeout)
+
+        while True:
+            sent = False
+            try:
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                conn.request(method, path, body=body, headers=headers or {})
+                sent = True
+                response = conn.getresponse()
+                return PooledResponse(self, key, conn, response)
+            except _STALE_CONNECTION_ERRORS as exc:
+                conn.close()
+                with self._lock:
+                    self.connections_discarded += 1
+                if sent and method.upper() not in _IDEMPOTENT_METHODS:
+                    slot.release()
+                    raise RequestSentError(f"{method} {key[1]} failed after sending: {exc}") from exc
+                if not reused:
+                    slot.release()
+                    raise
+                # Server dropped the idle socket: retry once on a fresh one.
+                conn = self._new_connection(key, timeout)
+                reused = False
+            except BaseException as exc:
+                conn.close()
+                with self._lock:
+                    self.connections_discarded += 1
+                slot.release()
+                if sent and isinstance(exc, TRANSIENT_ERRORS) and method.upper() not in _IDEMPOTENT_METHODS:
+                    raise RequestSentError(f"{method} {key[1]} failed after sending: {exc}") from exc
+                raise
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        headers: dict | None = None,
+        body: bytes | None = None,
+        timeout: float = 10.0,
+        label: str | None = None,
+    ) -> tuple[int, http.client.HTTPMessage, bytes]:
+        """
+        Send a request and read the (decoded) body. With `label`, the wire
+        and decoded sizes are added to `transfer_stats`.
+        """
+        response = self.open(method, url, headers=headers, body=body, timeout=timeout)
+        payload = response.read_decoded(label)
+        return response.status, response.headers, payload
+
+    def stats(self) -> dict:
+        with self._lock:
+            idle = sum(len(bucket) for bucket in self._idle.values())
+            return {
+                "requests": self.requests,
+                "connections_opened": self.connections_opened,
+                "connections_reused": self.connections_reused,
+                "connections_discarded": self.connections_discarded,
+                "idle": idle,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            buckets = list(self._idle.values())
+            self._idle = {}
+
+        for bucket in buckets:
+            for conn, _ in bucket:
+                conn.close()
+
+
+default_pool = ConnectionPool(
+    max_size=SUPABASE_POOL_SIZE,
+    max_per_host=SUPABASE_POOL_PER_HOST,
+    idle_timeout=SUPABASE_POOL_IDLE_SECONDS,
+)
@@ -0,0 +1,96 @@
+import codecs
+import json
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = ",]" + _WHITESPACE
+
+
+def loads(data: bytes):
+    """
+    Parse a JSON document from response bytes. orjson parses the bytes
+    directly; the stdlib parser only works on str (json.loads(bytes) just
+    sniffs the encoding and decodes), so it decodes first.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data.decode("utf-8"))
+
+
+def iter_array(chunks):
+    """
+    Yield the elements of a top-level JSON array as its bytes arrive.
+
+    Only the unparsed tail of the document is buffered, so a page is never
+    held as raw bytes and as objects at the same time.
+    """
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    pos = 0
+    started = False
+    closed = False
+
+    def pending():
+        nonlocal buf, pos
+        # drop the consumed prefix before appending more text
+        buf = buf[pos:]
+        pos = 0
+
+    for chunk in chunks:
+        pending()
+        buf += text_decoder.decode(chunk)
+
+        while True:
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            if pos >= len(buf):
+                break
+
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError("expected a JSON array")
+                started = True
+                pos += 1
+                continue
+
+            if closed:
+                raise ValueError("unexpected data after the JSON array")
+
+            if buf[pos] in ",]":
+                closed = buf[pos] == "]"
+                pos += 1
+                continue
+
+            try:
+                item, end = _decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # element not complete yet: wait for more bytes
+                break
+            # A scalar is complete only once a delimiter follows it ("12"
+            # may still become "12.5").
+            if not isinstance(item, (dict, list, str)) and (end == len(buf) or buf[end] not in _DELIMITERS):
+                break
+            pos = end
+            yield item
+
+    pending()
+    buf += text_decoder.decode(b"", final=True)
+    if buf.strip() or not closed:
+        raise ValueError("truncated or malformed JSON array")
+
+
+def load_chunks(chunks) -> list:
+    """
+    Parse a JSON array page from an iterable of byte chunks. With orjson
+    the body is joined and parsed in one call (faster than any incremental
+    parse); otherwise it is decoded incrementally.
+    """
+    if orjson is not None:
+        return orjson.loads(b"".join(chunks))
+    return list(iter_array(chunks))
@@ -1,27 +1,110 @@
+from data.async_client import AsyncSupabaseClient
 from data.client import SupabaseClient
 
 client = SupabaseClient()
+async_client = AsyncSupabaseClient()
 
-def load_risk(ts_from, ts_to, symbol=None):
-    return client.fetch("risk_eval", ts_from, ts_to, symbol=symbol)
+# JSON keys of `data` that the snapshot aggregators read, per event. Loaders
+# transfer only these (plus `symbol`); callers that read more pass them via
+# `fields=`. Events missing here are fetched with the full `data` blob.
+EVENT_FIELDS = {
+    "risk_eval": ("risk", "direction"),
+    "risk_divergence": ("divergence_type", "confidence"),
+    "okx_market_state": ("okx_liquidity_regime",),
+    "bybit_market_state": ("regime", "mci", "mci_slope", "mci_phase", "confidence"),
+    "deribit_vbi_snapshot": ("vbi_state", "vbi_pattern", "iv_slope"),
+    "market_regime": ("regime", "activity"),
+}
 
-def load_okx_market_state(ts_from, ts_to):
-    return client.fetch("okx_market_state", ts_from, ts_to, symbol="MARKET")
 
-def load_bybit_market_state(ts_from, ts_to):
-    return client.fetch("bybit_market_state", ts_from, ts_to, symbol=None)
+def event_fields(event, extra=None):
+    base = EVENT_FIELDS.get(event)
+    if base is None:
+        return None
+    return base + tuple(f for f in (extra or ()) if f not in base)
 
-def load_deribit(ts_from, ts_to, symbol=None):
-    return client.fetch("deribit_vbi_snapshot", ts_from, ts_to, symbol=symbol)
 
-def load_meta(ts_from, ts_to, symbol=None):
-    return client.fetch("market_regime", ts_from, ts_to, symbol=symbol)
+# Events whose loaders pin the symbol regardless of the caller's (see
+# load_okx_market_state / load_bybit_market_state).
+FIXED_SYMBOLS = {
+    "okx_market_state": "MARKET",
+    "bybit_market_state": None,
+}
 
-def load_divergence(ts_from, ts_to, symbol=None):
-    return client.fetch("risk_divergence", ts_from, ts_to, symbol=symbol)
+
+def _load(event, ts_from, ts_to, symbol, fields):
+    return client.fetch(event, ts_from, ts_to, symbol=symbol, fields=event_fields(event, fields))
+
+def load_risk(ts_from, ts_to, symbol=None, fields=None):
+    return _load("risk_eval", ts_from, ts_to, symbol, fields)
+
+def load_okx_market_state(ts_from, ts_to, fields=None):
+    return _load("okx_market_state", ts_from, ts_to, "MARKET", fields)
+
+def load_bybit_market_state(ts_from, ts_to, fields=None):
+    return _load("bybit_market_state", ts_from, ts_to, None, fields)
+
+def load_deribit(ts_from, ts_to, symbol=None, fields=None):
+    return _load("deribit_vbi_snapshot", ts_from, ts_to, symbol, fields)
+
+def load_meta(ts_from, ts_to, symbol=None, fields=None):
+    return _load("market_regime", ts_from, ts_to, symbol, fields)
+
+def load_divergence(ts_from, ts_to, symbol=None, fields=None):
+    return _load("risk_divergence", ts_from, ts_to, symbol, fields)
+
+def _many_kwargs(events, symbol, fields):
+    fields = fields or {}
+    return {
+        "symbol": symbol,
+        "symbols": {e: FIXED_SYMBOLS[e] for e in events if e in FIXED_SYMBOLS},
+        "fields": {e: event_fields(e, fields.get(e)) for e in events},
+    }
+
+def load_many(events, ts_from, ts_to, symbol=None, fields=None):
+    """
+    Load several events over one window with a single request chain.
+
+    Returns {event: rows} with the same rows the per-event loaders return.
+    fields — optional {event: extra JSON keys}, as `fields=` of the loaders.
+    """
+    return client.fetch_many(events, ts_from, ts_to, **_many_kwargs(events, symbol, fields))
 
 def load_event(event, ts_from, ts_to, symbol=None):
     return client.fetch(event, ts_from, ts_to, symbol=symbol)
 
 def load_latest_log_ts():
     return client.fetch_latest_log_ts()
+
+
+# ---- asyncio variants (Telegram bot) ----
+
+async def _load_async(event, ts_from, ts_to, symbol, fields):
+    return await async_client.fetch(event, ts_from, ts_to, symbol=symbol, fields=event_fields(event, fields))
+
+async def load_risk_async(ts_from, ts_to, symbol=None, fields=None):
+    return await _load_async("risk_eval", ts_from, ts_to, symbol, fields)
+
+async def load_okx_market_state_async(ts_from, ts_to, fields=None):
+    return await _load_async("okx_market_state", ts_from, ts_to, "MARKET", fields)
+
+async def load_bybit_market_state_async(ts_from, ts_to, fields=None):
+    return await _load_async("bybit_market_state", ts_from, ts_to, None, fields)
+
+async def load_deribit_async(ts_from, ts_to, symbol=None, fields=None):
+    return await _load_async("deribit_vbi_snapshot", ts_from, ts_to, symbol, fields)
+
+async def load_meta_async(ts_from, ts_to, symbol=None, fields=None):
+    return await _load_async("market_regime", ts_from, ts_to, symbol, fields)
+
+async def load_divergence_async(ts_from, ts_to, symbol=None, fields=None):
+    return await _load_async("risk_divergence", ts_from, ts_to, symbol, fields)
+
+async def load_many_async(events, ts_from, ts_to, symbol=None, fields=None):
+    return await async_client.fetch_many(events, ts_from, ts_to, **_many_kwargs(events, symbol, fields))
+
+async def load_event_async(event, ts_from, ts_to, symbol=None):
+    return await async_client.fetch(event, ts_from, ts_to, symbol=symbol)
+
+async def load_latest_log_ts_async():
+    return await async_client.fetch_latest_log_ts()
@@ -0,0 +1,183 @@
+from datetime import datetime, timezone
+from functools import lru_cache
+import math
+
+
+SYMBOL_SEPARATORS = ("-", "_", "/", ":")
+SYMBOL_QUOTES = ("USDT", "USD", "PERP")
+
+
+@lru_cache(maxsize=4096)
+def parse_iso_ms(text: str) -> int | None:
+    """ISO-8601 timestamp -> epoch ms (naive = UTC). Cached: pages repeat them."""
+    try:
+        dt = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+def ts_to_ms(ts) -> int | None:
+    if isinstance(ts, (int, float)):
+        value = int(ts)
+        # Heuristic: convert seconds to milliseconds.
+        return value * 1000 if value < 10_000_000_000 else value
+
+    if isinstance(ts, str):
+        try:
+            return int(ts)
+        except ValueError:
+            return parse_iso_ms(ts)
+
+    return None
+
+
+def row_ts_ms(row: dict) -> int | None:
+    ts = row.get("ts")
+
+    if ts is None and isinstance(row.get("data"), dict):
+        data = row["data"]
+        ts = (
+            data.get("ts")
+            or data.get("timestamp")
+            or data.get("time")
+            or data.get("created_at")
+        )
+
+    if ts is None:
+        ts = row.get("created_at") or row.get("timestamp") or row.get("time")
+
+    return ts_to_ms(ts)
+
+
+@lru_cache(maxsize=1024)
+def normalize_symbol(symbol: str) -> str:
+    value = symbol.upper()
+
+    for sep in SYMBOL_SEPARATORS:
+        value = value.split(sep, 1)[0]
+
+    for quote in SYMBOL_QUOTES:
+        if value.endswith(quote):
+            return value[: -len(quote)]
+
+    return value
+
+
+def row_symbol(row: dict) -> str | None:
+    if isinstance(row.get("symbol"), str):
+        return row["symbol"]
+
+    data = row.get("data")
+    if isinstance(data, dict) and isinstance(data.get("symbol"), str):
+        return data["symbol"]
+
+    return None
+
+
+def to_float(x) -> float | None:
+    if isinstance(x, (int, float)):
+        return None if isinstance(x, float) and math.isnan(x) else float(x)
+    if isinstance(x, str):
+        try:
+            v = float(x.strip())
+        except ValueError:
+            return None
+        return None if math.isnan(v) else v
+    return None
+
+
+def _first_float(data: dict, keys) -> float | None:
+    for key in keys:
+        value = to_float(data.get(key))
+        if value is not None:
+            return value
+    return None
+
+
+def _first_present(data: dict, keys):
+    for key in keys:
+        value = data.get(key)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+class LogRow(dict):
+    """
+    A fetched row, decoded once when its page arrives.
+
+    Still the dict the aggregators read (`row["data"]`); the decoder adds
+    ts_ms (int) and sym (normalized symbol, None for market-wide rows), and
+    event subclasses add typed fields, so later stages never parse again.
+    """
+
+    __slots__ = ("ts_ms", "sym")
+
+    def _decode(self, data: dict) -> None:
+        pass
+
+
+class RiskRow(LogRow):
+    # asset: symbol or ticker, normalized; risk: avg_risk / risk / risk_score
+    __slots__ = ("asset", "risk")
+
+    def _decode(self, data: dict) -> None:
+        raw = self.get("symbol") or data.get("symbol") or self.get("ticker") or data.get("ticker")
+        self.asset = (normalize_symbol(raw) or None) if isinstance(raw, str) and raw else None
+        self.risk = _first_float(data, ("avg_risk", "risk", "risk_score"))
+
+
+class BybitStateRow(LogRow):
+    __slots__ = ("mci", "mci_slope")
+
+    def _decode(self, data: dict) -> None:
+        self.mci = to_float(data.get("mci"))
+        self.mci_slope = to_float(data.get("mci_slope"))
+
+
+class DeribitRow(LogRow):
+    __slots__ = ("iv_slope",)
+
+    def _decode(self, data: dict) -> None:
+        self.iv_slope = _first_float(data, ("iv_slope", "iv_slope_avg"))
+
+
+class AnomalyRow(LogRow):
+    # Display values of the alert, first non-empty of the known aliases.
+    __slots__ = ("symbol", "anomaly_type", "anomaly_id", "message", "severity")
+
+    def _decode(self, data: dict) -> None:
+        self.symbol = _first_present(data, ("symbol", "ticker", "asset", "coin", "instrument"))
+        self.anomaly_type = _first_present(
+            data, ("anomaly_type", "type", "kind", "name", "signal_type", "category")
+        )
+        self.anomaly_id = _first_present(data, ("id", "event_id", "anomaly_id", "signal_id"))
+        self.message = _first_present(data, ("message", "text", "description", "summary"))
+        self.severity = _first_present(data, ("severity", "level", "priority"))
+
+
+# Row type per `logs` event; other events (and tables) decode to LogRow.
+ROW_TYPES: dict[str, type[LogRow]] = {
+    "risk_eval": RiskRow,
+    "bybit_market_state": BybitStateRow,
+    "deribit_vbi_snapshot": DeribitRow,
+    "anomaly": AnomalyRow,
+}
+
+
+def decode_row(row: dict, ts_ms: int | None = None, event: str | None = None) -> LogRow:
+    """
+    Decode a raw row (with its `data` dict) into its event's row type.
+    `ts_ms` skips the timestamp parse when the caller already has it.
+    """
+    record = ROW_TYPES.get(event or row.get("event"), LogRow)(row)
+    record.ts_ms = row_ts_ms(row) if ts_ms is None else ts_ms
+    symbol = row_symbol(row)
+    record.sym = None if symbol is None else normalize_symbol(symbol)
+
+    data = row.get("data")
+    record._decode(data if isinstance(data, dict) else {})
+    return record
@@ -0,0 +1,188 @@
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from config import (
+    SUPABASE_ROW_CACHE_LIVE_MAX_AGE_SECONDS,
+    SUPABASE_ROW_CACHE_ROWS,
+    SUPABASE_ROW_CACHE_SETTLE_SECONDS,
+)
+
+
+@dataclass
+class _Segment:
+    """Rows of one key fully known for [ts_from, ts_to], ts-sorted."""
+
+    ts_from: int
+    ts_to: int
+    rows: list
+    ts: list
+    # Rows at or after `live_from` were still settling when fetched; they are
+    # trusted only until the segment is `live_max_age` seconds old.
+    live_from: int
+    fetched_at: float = field(default_factory=time.monotonic)
+
+    def has_live_edge(self) -> bool:
+        return self.ts_to >= self.live_from
+
+
+class SegmentRowCache:
+    """
+    In-process cache of ts-sorted `logs` rows, kept as covered time segments.
+
+    Any [ts_from, ts_to] is served by slicing the cached segments; only the
+    uncovered head/tail ranges ("gaps") have to be fetched.
+
+    max_rows        — rows kept across all keys; least recently used keys go first
+    live_max_age    — seconds the still-settling tail of a fetch is trusted
+    settle_seconds  — how far behind "now" rows are considered final
+    """
+
+    def __init__(self, max_rows: int = 100_000, live_max_age: float = 30.0, settle_seconds: float = 120.0):
+        self.max_rows = max(0, max_rows)
+        self.live_max_age = live_max_age
+        self.settle_ms = int(settle_seconds * 1000)
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple, list[_Segment]] = OrderedDict()
+        self._rows = 0
+
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self.rows_saved = 0
+        self.rows_fetched = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_rows > 0
+
+    def _expire_live_edges(self, segments: list[_Segment]) -> list[_Segment]:
+        now = time.monotonic()
+        kept = []
+
+        for seg in segments:
+            if seg.has_live_edge() and now - seg.fetched_at > self.live_max_age:
+                cut = bisect_left(seg.ts, seg.live_from)
+                self._rows -= len(seg.rows) - cut
+                seg.rows = seg.rows[:cut]
+                seg.ts = seg.ts[:cut]
+                seg.ts_to = seg.live_from - 1
+                if seg.ts_to < seg.ts_from:
+                    continue
+            kept.append(seg)
+
+        return kept
+
+    def lookup(self, key: tuple, ts_from: int, ts_to: int) -> list[tuple]:
+        """
+        Split [ts_from, ts_to] into ts-ordered pieces: ("rows", cached_rows)
+        for covered ranges and ("gap", a, b) for ranges to fetch.
+        """
+        pieces: list[tuple] = []
+        cursor = ts_from
+        served = 0
+
+        with self._lock:
+            segments = self._entries.get(key)
+            if segments is not None:
+                segments = self._expire_live_edges(segments)
+                self._entries[key] = segments
+                self._entries.move_to_end(key)
+
+                for seg in segments:
+                    if seg.ts_to < cursor or seg.ts_from > ts_to:
+                        continue
+                    if seg.ts_from > cursor:
+                        pieces.append(("gap", cursor, seg.ts_from - 1))
+                    end = min(seg.ts_to, ts_to)
+                    rows = seg.rows[bisect_left(seg.ts, cursor):bisect_right(seg.ts, end)]
+                    pieces.append(("rows", rows))
+                    served += len(rows)
+                    cursor = end + 1
+                    if cursor > ts_to:
+                        break
+
+            if cursor <= ts_to:
+                pieces.append(("gap", cursor, ts_to))
+
+            if len(pieces) == 1 and pieces[0][0] == "gap":
+                self.misses += 1
+            elif any(piece[0] == "gap" for piece in pieces):
+                self.partial_hits += 1
+            else:
+                self.hits += 1
+            self.rows_saved += served
+
+        return pieces
+
+    def store(self, key: tuple, ts_from: int, ts_to: int, rows: list, row_ts: list, now_ms: int) -> None:
+        """
+        Record `rows` (with their ts in ms, `row_ts`) as the complete,
+        ts-sorted content of [ts_from, ts_to] as of `now_ms`.
+        """
+        with self._lock:
+            self.rows_fetched += len(rows)
+            if not self.enabled or len(rows) > self.max_rows:
+                return
+
+            new = _Segment(ts_from, ts_to, list(rows), list(row_ts), live_from=now_ms - self.settle_ms)
+            merged: list[_Segment] = []
+
+            for seg in self._entries.get(key, []):
+                if seg.ts_to + 1 < new.ts_from or seg.ts_from > new.ts_to + 1:
+                    merged.append(seg)
+                    continue
+
+                # Fresh rows win inside the fetched range; keep the rest.
+                self._rows -= len(seg.rows)
+                head = bisect_left(seg.ts, new.ts_from)
+                tail = bisect_right(seg.ts, new.ts_to)
+                live = [s for s in (seg, new) if s.has_live_edge()]
+                new = _Segment(
+                    min(seg.ts_from, new.ts_from),
+                    max(seg.ts_to, new.ts_to),
+                    seg.rows[:head] + new.rows + seg.rows[tail:],
+                    seg.ts[:head] + new.ts + seg.ts[tail:],
+                    live_from=min(s.live_from for s in live) if live else new.live_from,
+                    fetched_at=min(s.fetched_at for s in live) if live else new.fetched_at,
+                )
+
+            merged.append(new)
+            merged.sort(key=lambda s: s.ts_from)
+            self._entries[key] = merged
+            self._entries.move_to_end(key)
+            self._rows += len(new.rows)
+
+            while self._rows > self.max_rows and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._rows -= sum(len(seg.rows) for seg in evicted)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._rows = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "partial_hits": self.partial_hits,
+                "misses": self.misses,
+                "rows_saved": self.rows_saved,
+                "rows_fetched": self.rows_fetched,
+                "rows_cached": self._rows,
+                "keys": len(self._entries),
+                "evictions": self.evictions,
+            }
+
+
+default_row_cache = SegmentRowCache(
+    max_rows=SUPABASE_ROW_CACHE_ROWS,
+    live_max_age=SUPABASE_ROW_CACHE_LIVE_MAX_AGE_SECONDS,
+    settle_seconds=SUPABASE_ROW_CACHE_SETTLE_SECONDS,
+)
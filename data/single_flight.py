@@ -0,0 +1,121 @@
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: while one call for `key` is in
+    flight, callers with the same key share its result or error instead of
+    running it again.
+
+    `stamp` (usually the window end, ms) is part of the call: only a run
+    with exactly the same key and stamp is shared, so every caller gets
+    the result for its own window.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[tuple, _Call] = {}
+
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: tuple, fn, stamp: int = 0):
+        """Run `fn()` or wait for the in-flight run of the same call."""
+        key = (key, stamp)
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+            else:
+                leader = self._calls[key] = _Call()
+                self.executions += 1
+
+        if call is not None:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            leader.result = fn()
+            return leader.result
+        except BaseException as exc:
+            leader.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            leader.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls),
+            }
+
+
+class _AsyncCall:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class AsyncSingleFlight:
+    """
+    `SingleFlight` for coroutines on one event loop. The shared run is
+    cancelled once every caller waiting on it has been cancelled.
+    """
+
+    def __init__(self):
+        self._calls: dict[tuple, _AsyncCall] = {}
+
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: tuple, fn, stamp: int = 0):
+        """Await `fn()` or the in-flight run of the same call."""
+        key = (key, stamp)
+        call = self._calls.get(key)
+        if call is not None:
+            self.coalesced += 1
+        else:
+            call = self._calls[key] = _AsyncCall(asyncio.ensure_future(fn()))
+            self.executions += 1
+
+            def forget(_, call=call):
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+
+            call.task.add_done_callback(forget)
+
+        call.waiters += 1
+        try:
+            # shield: one cancelled caller must not cancel the others' run
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def stats(self) -> dict:
+        return {
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._calls),
+        }
+
+
+default_single_flight = SingleFlight()
+default_async_single_flight = AsyncSingleFlight()
@@ -0,0 +1,71 @@
+import threading
+import time
+from collections import OrderedDict
+
+from config import SNAPSHOT_CACHE_SIZE, SNAPSHOT_CACHE_TTL_SECONDS
+
+
+class SnapshotCache:
+    """
+    Finished snapshots by (window length, symbol, window end). With window
+    ends snapped to the as-of grid (time_utils.as_of_ms), every request
+    within one grid step asks for the same key and is served from here.
+
+    max_entries — snapshots kept; least recently used go first (0 disables)
+    ttl_seconds — age after which an entry is recomputed, so rows ingested
+                  late into a recent window still show up
+    """
+
+    def __init__(self, max_entries: int = 64, ttl_seconds: float = 60.0):
+        self.max_entries = max(0, max_entries)
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple, tuple[float, object]] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: tuple):
+        """The cached value of `key`, or None when missing or expired."""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl_seconds:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: tuple, value) -> None:
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+default_snapshot_cache = SnapshotCache(
+    max_entries=SNAPSHOT_CACHE_SIZE,
+    ttl_seconds=SNAPSHOT_CACHE_TTL_SECONDS,
+)
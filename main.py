@@ -1,31 +1,52 @@
 
 import argparse
+import asyncio
+import heapq
+import time
 
+from bisect import bisect_left, bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
 from typing import Optional
-from aggregation.deribit import aggregate_deribit
-from aggregation.meta import aggregate_meta
-from aggregation.options import aggregate_options
-from aggregation.risk import aggregate_risk
-from config import DEFAULT_WINDOW_HOURS
-from data.queries import load_deribit, load_meta, load_okx_market_state, load_risk
-from interpretation.engine import interpret
-from interpretation.states import detect_states
-from models.snapshot import MarketSnapshot
+from aggregation.deribit import DERIBIT_METRICS, summarize_deribit
+from aggregation.engine import First, Sum, collect, finish, merge, partial
+from aggregation.meta import META_METRICS, summarize_meta
+from aggregation.options import OPTIONS_METRICS, summarize_options
+from aggregation.risk import RISK_METRICS, summarize_risk
+from aggregation.rollups import DAY_MS, combine, day_chunks, default_rollups
+from config import (
+    DEFAULT_WINDOW_HOURS,
+    SNAPSHOT_DEADLINE_SECONDS,
+    SNAPSHOT_LOAD_WORKERS,
+    SNAPSHOT_ROLLUP_BACKFILL_DAYS,
+)
+from data.queries import load_many, load_many_async
+from data.snapshot_cache import default_snapshot_cache
+from models.snapshot import LAYERS, MarketSnapshot
 from time_utils import parse_window
-from data.queries import load_divergence
+from data.async_client import gather_all
+from data.single_flight import default_async_single_flight, default_single_flight
 
 
-def aggregate_divergence(rows, risk_rows):
-    if not rows:
+DIVERGENCE_METRICS = {
+    "dominant_type": First("divergence_type"),
+    "confidence_sum": Sum("confidence"),
+}
+
+
+def aggregate_divergence(rows, risk_count: int):
+    return summarize_divergence(*collect(DIVERGENCE_METRICS, rows), risk_count)
+
+
+def summarize_divergence(m: dict, count: int, risk_count: int) -> dict:
+    if not count:
         return {}
 
     return {
-        "count": len(rows),
-        "share": round(len(rows) / len(risk_rows) * 100, 1) if risk_rows else 0.0,
-        "dominant_type": rows[0]["data"].get("divergence_type"),
-        "confidence_avg": round(
-            sum(r["data"].get("confidence", 0) for r in rows) / len(rows), 2
-        ),
+        "count": count,
+        "share": round(count / risk_count * 100, 1) if risk_count else 0.0,
+        "dominant_type": m["dominant_type"],
+        "confidence_avg": round(m["confidence_sum"] / count, 2),
     }
 
 def aggregate_alert_divergence(rows):
@@ -44,24 +65,451 @@ def aggregate_alert_divergence(rows):
 
     return alerts
 
-def run_snapshot(ts_from, ts_to, symbol: Optional[str] = None):
-    risk_rows = load_risk(ts_from, ts_to, symbol=symbol)
-    div_rows = load_divergence(ts_from, ts_to, symbol=symbol)
-
-    snapshot = MarketSnapshot(
-        ts_from=ts_from,
-        ts_to=ts_to,
-        risk=aggregate_risk(risk_rows),
-        options=aggregate_options(load_okx_market_state(ts_from, ts_to)),
-        deribit=aggregate_deribit(load_deribit(ts_from, ts_to, symbol=symbol)),
-        meta=aggregate_meta(load_meta(ts_from, ts_to, symbol=symbol)),
-    )
+# The snapshot layers are fetched as one multi-event stream (one request
+# chain instead of five), at most this much of a window at a time: longer
+# gaps are fetched and aggregated day by day so memory stays flat.
+MULTI_EVENT_MAX_WINDOW_MS = 24 * 3600 * 1000
+
+# Metrics aggregated per snapshot event.
+SNAPSHOT_LAYERS = {
+    "risk_eval": RISK_METRICS,
+    "okx_market_state": OPTIONS_METRICS,
+    "deribit_vbi_snapshot": DERIBIT_METRICS,
+    "market_regime": META_METRICS,
+    "risk_divergence": DIVERGENCE_METRICS,
+}
+
+SNAPSHOT_EVENTS = tuple(SNAPSHOT_LAYERS)
+
+# Events each MarketSnapshot layer is aggregated from (the divergence share
+# needs the risk row count).
+LAYER_EVENTS = {
+    "risk": ("risk_eval",),
+    "options": ("okx_market_state",),
+    "deribit": ("deribit_vbi_snapshot",),
+    "meta": ("market_regime",),
+    "divergence": ("risk_eval", "risk_divergence"),
+}
+
+def _layer_names(layers) -> tuple:
+    if layers is None:
+        return LAYERS
+    layers = set(layers)
+    unknown = layers - set(LAYERS)
+    if unknown:
+        raise ValueError(f"unknown snapshot layers: {sorted(unknown)}")
+    return tuple(name for name in LAYERS if name in layers)
+
+
+def _layer_events(names) -> tuple:
+    events = {event for name in names for event in LAYER_EVENTS[name]}
+    return tuple(event for event in SNAPSHOT_EVENTS if event in events)
+
+
+def _summarize(names, results: dict) -> dict:
+    # results: {event: (metric results, row count)}, see rollups.combine
+    summaries = {
+        "risk": lambda: summarize_risk(*results["risk_eval"]),
+        "options": lambda: summarize_options(*results["okx_market_state"]),
+        "deribit": lambda: summarize_deribit(*results["deribit_vbi_snapshot"]),
+        "meta": lambda: summarize_meta(*results["market_regime"]),
+        "divergence": lambda: summarize_divergence(*results["risk_divergence"], results["risk_eval"][1]),
+    }
+    return {name: summaries[name]() for name in names}
+
+
+def _rollup_key(symbol: Optional[str], event: str) -> tuple:
+    # One key per event, so a snapshot of some layers stores only theirs.
+    return ("snapshot", symbol.upper() if symbol else None, event)
+
+
+def _deadline_error() -> RuntimeError:
+    return RuntimeError(f"snapshot layers not loaded within {SNAPSHOT_DEADLINE_SECONDS:g}s")
+
+
+def _load_chunks(chunks: list[tuple], symbol: Optional[str]):
+    """
+    Fetch every (a, b, events) range and yield their {event: rows} in
+    range order, all under one deadline. Only SNAPSHOT_LOAD_WORKERS ranges
+    are in flight or waiting to be consumed, so a long gap still holds a
+    few days of rows at a time.
+
+    Each call has its own threads: ranges still running after a timeout
+    finish there and cannot hold up the loads of other snapshots.
+    """
+    workers = max(1, SNAPSHOT_LOAD_WORKERS)
+    deadline = time.monotonic() + SNAPSHOT_DEADLINE_SECONDS
+    chunks = iter(chunks)
+    pending = deque()
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="snapshot-load")
+
+    try:
+        while True:
+            for a, b, events in chunks:
+                pending.append(executor.submit(load_many, events, a, b, symbol=symbol))
+                if len(pending) >= workers:
+                    break
+            if not pending:
+                return
+
+            future = pending.popleft()
+            timeout = max(0.0, deadline - time.monotonic()) if SNAPSHOT_DEADLINE_SECONDS > 0 else None
+            if not wait([future], timeout=timeout).done:
+                raise _deadline_error()
+            yield future.result()
+    finally:
+        # Ranges not started yet are dropped; running ones still fill the row cache.
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _snapshots_key(windows: list[tuple], symbol: Optional[str], names: tuple) -> tuple:
+    return ("snapshot", tuple(ts_to - ts_from for ts_from, ts_to in windows), symbol.upper() if symbol else None, names)
+
+
+def _cache_key(window: tuple, symbol: Optional[str]) -> tuple:
+    ts_from, ts_to = window
+    return ("snapshot", ts_to - ts_from, symbol.upper() if symbol else None, ts_to)
+
+
+def _load_layers(window: tuple, symbol: Optional[str], names) -> dict:
+    # Loader of a lazy snapshot: layers first read after it was returned.
+    return _run_snapshots([window], symbol, _layer_names(names))[0]
+
+
+def _cached_snapshots(windows: list[tuple], symbol: Optional[str], names: tuple) -> tuple[list, list, list]:
+    """
+    The snapshot of every window, from the snapshot cache or new and
+    empty; the (window, snapshot) pairs still missing some of `names`; and
+    the new snapshots, cached by _store_snapshots once they are filled.
+    """
+    snaps = []
+    fresh = []
+    for window in windows:
+        snap = default_snapshot_cache.get(_cache_key(window, symbol))
+        if snap is None:
+            snap = MarketSnapshot(*window, loader=lambda names, window=window: _load_layers(window, symbol, names))
+            fresh.append((window, snap))
+        snaps.append(snap)
+    return snaps, [(window, snap) for window, snap in zip(windows, snaps) if snap.missing(names)], fresh
 
-    snapshot.interpretation = interpret(snapshot)
-    snapshot.active_states = detect_states(snapshot)
-    snapshot.divergence = aggregate_divergence(div_rows, risk_rows)
 
-    return snapshot
+def _store_snapshots(symbol: Optional[str], fresh: list) -> None:
+    for window, snap in fresh:
+        default_snapshot_cache.put(_cache_key(window, symbol), snap)
+
+
+def _missing_names(pending: list, names: tuple) -> tuple:
+    return _layer_names({name for _, snap in pending for name in snap.missing(names)})
+
+
+def run_snapshot(ts_from, ts_to, symbol: Optional[str] = None, layers=None) -> MarketSnapshot:
+    return run_snapshots([(ts_from, ts_to)], symbol, layers)[0]
+
+
+async def run_snapshot_async(ts_from, ts_to, symbol: Optional[str] = None, layers=None) -> MarketSnapshot:
+    return (await run_snapshots_async([(ts_from, ts_to)], symbol, layers))[0]
+
+
+def run_snapshots(windows: list[tuple], symbol: Optional[str] = None, layers=None) -> list[MarketSnapshot]:
+    """
+    Snapshots of several (ts_from, ts_to) windows, e.g. 12h / 6h / 1h ending
+    together: rows the windows share are fetched and aggregated once.
+
+    layers — names of the layers to load now (default: all, see
+             models.snapshot.LAYERS); the others load on first access.
+
+    Windows computed recently (same length, symbol and end) come from the
+    snapshot cache; only their missing layers are loaded.
+    """
+    names = _layer_names(layers)
+    snaps, pending, fresh = _cached_snapshots(list(windows), symbol, names)
+    if pending:
+        # Users opening the same view together share one snapshot computation.
+        missing = [window for window, _ in pending]
+        need = _missing_names(pending, names)
+        loaded = default_single_flight.do(
+            _snapshots_key(missing, symbol, need),
+            lambda: _run_snapshots(missing, symbol, need),
+            stamp=max(ts_to for _, ts_to in missing),
+        )
+        for (_, snap), values in zip(pending, loaded):
+            snap.fill(values)
+    _store_snapshots(symbol, fresh)
+    return snaps
+
+
+async def run_snapshots_async(windows: list[tuple], symbol: Optional[str] = None, layers=None) -> list[MarketSnapshot]:
+    names = _layer_names(layers)
+    snaps, pending, fresh = _cached_snapshots(list(windows), symbol, names)
+    if pending:
+        missing = [window for window, _ in pending]
+        need = _missing_names(pending, names)
+        loaded = await default_async_single_flight.do(
+            _snapshots_key(missing, symbol, need),
+            lambda: _run_snapshots_async(missing, symbol, need),
+            stamp=max(ts_to for _, ts_to in missing),
+        )
+        for (_, snap), values in zip(pending, loaded):
+            snap.fill(values)
+    _store_snapshots(symbol, fresh)
+    return snaps
+
+
+def _merge_ranges(ranges) -> list[tuple]:
+    merged = []
+    for a, b in sorted(ranges):
+        if merged and a <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], b)
+        else:
+            merged.append([a, b])
+    return [tuple(span) for span in merged]
+
+
+def _plan_snapshots(symbol: Optional[str], windows: list[tuple], events: tuple) -> tuple[list, list]:
+    """
+    Rollup pieces of every window and event, and the (a, b, events) spans
+    to fetch. Each event's gaps over all windows are merged, so a range
+    shared by nested windows (their live tail, or all of them without
+    rollups) is fetched once; events missing the same span (the usual
+    case) share one request chain.
+    """
+    plans = [
+        {event: default_rollups.lookup(_rollup_key(symbol, event), ts_from, ts_to) for event in events}
+        for ts_from, ts_to in windows
+    ]
+    spans: dict[tuple, list] = {}
+    for event in events:
+        gaps = [piece[1:] for plan in plans for piece in plan[event] if piece[0] == "gap"]
+        for span in _merge_ranges(gaps):
+            spans.setdefault(span, []).append(event)
+    return plans, [(a, b, tuple(group)) for (a, b), group in sorted(spans.items())]
+
+
+def _ts_of(row) -> int:
+    return row.ts_ms
+
+
+def _finish_snapshots(symbol: Optional[str], names: tuple, plans: list, chunks: list[tuple], loaded) -> list[dict]:
+    # Fetched chunks arrive in ts order per event. Each window gap takes its
+    # part of a chunk by bisect; equal slices (the shared tail) are absorbed
+    # once. Returns {name: layer} per window.
+    parts = [
+        {event: [list(piece[1]) if piece[0] == "buckets" else [] for piece in pieces] for event, pieces in plan.items()}
+        for plan in plans
+    ]
+    absorbed = {}
+
+    for (chunk_from, chunk_to, events), rows in zip(chunks, loaded):
+        now_ms = int(time.time() * 1000)
+        for plan, window_parts in zip(plans, parts):
+            for event in events:
+                for piece, piece_parts in zip(plan[event], window_parts[event]):
+                    if piece[0] != "gap":
+                        continue
+                    a, b = max(piece[1], chunk_from), min(piece[2], chunk_to)
+                    if a > b:
+                        continue
+                    if (event, a, b) not in absorbed:
+                        event_rows = rows[event]
+                        sliced = event_rows[bisect_left(event_rows, a, key=_ts_of):bisect_right(event_rows, b, key=_ts_of)]
+                        absorbed[(event, a, b)] = default_rollups.absorb(
+                            _rollup_key(symbol, event), {event: SNAPSHOT_LAYERS[event]}, a, b, {event: sliced}, now_ms
+                        )
+                    piece_parts.append(absorbed[(event, a, b)])
+
+    return [
+        _summarize(names, combine(
+            {event: SNAPSHOT_LAYERS[event] for event in window_parts},
+            [p for event_parts in window_parts.values() for piece_parts in event_parts for p in piece_parts],
+        ))
+        for window_parts in parts
+    ]
+
+
+async def _run_snapshots_async(windows: list[tuple], symbol: Optional[str], names: tuple) -> list[dict]:
+    plans, spans = _plan_snapshots(symbol, windows, _layer_events(names))
+
+    if any(b - a > MULTI_EVENT_MAX_WINDOW_MS for a, b, _ in spans):
+        # Long gaps (a cold 7d/30d window) are fetched day by day; that path
+        # is blocking, so it runs on a worker thread.
+        return await asyncio.to_thread(_run_snapshots, windows, symbol, names)
+
+    # Every span is fetched at once; the slowest one sets the latency.
+    try:
+        loaded = await asyncio.wait_for(
+            gather_all(load_many_async(events, a, b, symbol=symbol) for a, b, events in spans),
+            timeout=SNAPSHOT_DEADLINE_SECONDS if SNAPSHOT_DEADLINE_SECONDS > 0 else None,
+        )
+    except asyncio.TimeoutError:
+        raise _deadline_error() from None
+
+    # Slicing, rollup absorption and the exact sums are CPU work and take
+    # the rollup lock: off the event loop.
+    return await asyncio.to_thread(_finish_snapshots, symbol, names, plans, spans, loaded)
+
+
+def _run_snapshots(windows: list[tuple], symbol: Optional[str], names: tuple) -> list[dict]:
+    # Stored minute/hour/day partials cover most of a window; only the gaps
+    # (usually its head and live tail) are fetched and aggregated, for the
+    # events of the requested layers only. Spans go day by day, so every
+    # complete day of a long gap is stored as it is aggregated; the days of
+    # all spans are fetched concurrently.
+    plans, spans = _plan_snapshots(symbol, windows, _layer_events(names))
+    chunks = [(a, b, events) for span_from, span_to, events in spans for a, b in day_chunks(span_from, span_to)]
+    return _finish_snapshots(symbol, names, plans, chunks, _load_chunks(chunks, symbol))
+
+
+# Symbolized layers of the all-ticker scan (run_symbol_snapshots).
+SCAN_LAYERS = ("risk", "meta", "divergence")
+SCAN_EVENTS = _layer_events(SCAN_LAYERS)
+
+
+def _symbol_partials(event: str, rows) -> dict:
+    """
+    {normalized symbol: Partial} of one range of `event` rows, grouped in
+    one pass. Market-wide rows (no symbol) count for every symbol, in row
+    order, as with run_snapshot(symbol=...); None holds them alone.
+    """
+    groups: dict = {}
+    shared = []
+    for index, row in enumerate(rows):
+        sym = row.sym
+        (shared if sym is None else groups.setdefault(sym, [])).append((index, row))
+
+    metrics = SNAPSHOT_LAYERS[event]
+    partials = {None: partial(metrics, [row for _, row in shared])}
+    for sym, indexed in groups.items():
+        if shared:
+            indexed = heapq.merge(indexed, shared)
+        partials[sym] = partial(metrics, [row for _, row in indexed])
+    return partials
+
+
+def _scan_rank(item: tuple) -> tuple:
+    risk = item[1].risk
+    return risk.get("avg_risk", 0), risk.get("risk_2plus_pct", 0)
+
+
+def _finish_symbol_snapshots(ts_from: int, ts_to: int, loaded) -> list[tuple]:
+    # loaded: {event: rows} per range, in ts order. Only the per-symbol
+    # partials of a range are kept once it is aggregated.
+    ranges = [{event: _symbol_partials(event, rows[event]) for event in SCAN_EVENTS} for rows in loaded]
+    symbols = sorted({sym for parts in ranges for by_symbol in parts.values() for sym in by_symbol if sym is not None})
+
+    snaps = []
+    for sym in symbols:
+        results = {}
+        for event in SCAN_EVENTS:
+            metrics = SNAPSHOT_LAYERS[event]
+            results[event] = finish(metrics, merge(metrics, [parts[event].get(sym, parts[event][None]) for parts in ranges]))
+        snap = MarketSnapshot(
+            ts_from,
+            ts_to,
+            loader=lambda names, sym=sym: _load_layers((ts_from, ts_to), sym, names),
+            **_summarize(SCAN_LAYERS, results),
+        )
+        snaps.append((sym, snap))
+
+    # Stable: equal ranks keep symbol order.
+    snaps.sort(key=_scan_rank, reverse=True)
+    return snaps
+
+
+def _run_symbol_snapshots(ts_from: int, ts_to: int) -> list[tuple]:
+    chunks = [(a, b, SCAN_EVENTS) for a, b in day_chunks(ts_from, ts_to)]
+    return _finish_symbol_snapshots(ts_from, ts_to, _load_chunks(chunks, None))
+
+
+async def _run_symbol_snapshots_async(ts_from: int, ts_to: int) -> list[tuple]:
+    if ts_to - ts_from > MULTI_EVENT_MAX_WINDOW_MS:
+        return await asyncio.to_thread(_run_symbol_snapshots, ts_from, ts_to)
+
+    try:
+        loaded = await asyncio.wait_for(
+            load_many_async(SCAN_EVENTS, ts_from, ts_to),
+            timeout=SNAPSHOT_DEADLINE_SECONDS if SNAPSHOT_DEADLINE_SECONDS > 0 else None,
+        )
+    except asyncio.TimeoutError:
+        raise _deadline_error() from None
+
+    return await asyncio.to_thread(_finish_symbol_snapshots, ts_from, ts_to, [loaded])
+
+
+def _scan_key(ts_from: int, ts_to: int) -> tuple:
+    return ("scan", ts_to - ts_from, ts_to)
+
+
+def run_symbol_snapshots(ts_from, ts_to) -> list[tuple[str, MarketSnapshot]]:
+    """
+    (normalized symbol, snapshot) of every symbol with rows in the window,
+    ranked by avg risk, then RiskAct (risk_2plus_pct), highest first.
+
+    risk, divergence and meta are fetched once for all symbols (one request
+    chain per day of the window, however many symbols there are) and
+    grouped by symbol in one pass; the other layers load per symbol on
+    first access. Results are kept in the snapshot cache like run_snapshot.
+    """
+    key = _scan_key(ts_from, ts_to)
+    snaps = default_snapshot_cache.get(key)
+    if snaps is None:
+        snaps = default_single_flight.do(
+            key[:2], lambda: _run_symbol_snapshots(ts_from, ts_to), stamp=ts_to
+        )
+        default_snapshot_cache.put(key, snaps)
+    return snaps
+
+
+async def run_symbol_snapshots_async(ts_from, ts_to) -> list[tuple[str, MarketSnapshot]]:
+    key = _scan_key(ts_from, ts_to)
+    snaps = default_snapshot_cache.get(key)
+    if snaps is None:
+        snaps = await default_async_single_flight.do(
+            key[:2], lambda: _run_symbol_snapshots_async(ts_from, ts_to), stamp=ts_to
+        )
+        default_snapshot_cache.put(key, snaps)
+    return snaps
+
+
+def backfill_rollups(days: int = SNAPSHOT_ROLLUP_BACKFILL_DAYS, symbol: Optional[str] = None) -> bool:
+    """
+    Fetch and roll up the newest uncovered day among the last `days`
+    complete UTC days past the rollup ingest horizon. Called every watcher cycle, so it walks back one day
+    per cycle until long /stats windows find their days already stored.
+    Today is left to the snapshots themselves (their live tail is fetched
+    anyway). Returns whether anything was fetched.
+    """
+    if days <= 0 or not default_rollups.enabled:
+        return False
+
+    # Whole days only, ending before today: the live edge always has a
+    # fresh gap, and picking it would starve the older days.
+    final_ms = int(time.time() * 1000) - default_rollups.final_ms
+    ts_to = final_ms // DAY_MS * DAY_MS - 1
+    ts_from = ts_to + 1 - days * DAY_MS
+    gaps = {
+        event: [p[1:] for p in default_rollups.lookup(_rollup_key(symbol, event), ts_from, ts_to) if p[0] == "gap"]
+        for event in SNAPSHOT_EVENTS
+    }
+    newest = max((event_gaps[-1] for event_gaps in gaps.values() if event_gaps), key=lambda gap: gap[1], default=None)
+    if newest is None:
+        return False
+
+    # The whole day of that gap, so it is stored as one day bucket however
+    # little of it was missing (the hour tier may not reach that far back).
+    a = newest[1] // DAY_MS * DAY_MS
+    b = a + DAY_MS - 1
+    events = tuple(event for event, event_gaps in gaps.items() if any(g[0] <= b and a <= g[1] for g in event_gaps))
+    rows = load_many(events, a, b, symbol=symbol)
+    now_ms = int(time.time() * 1000)
+    for event in events:
+        default_rollups.absorb(_rollup_key(symbol, event), {event: SNAPSHOT_LAYERS[event]}, a, b, {event: rows[event]}, now_ms)
+    return True
+
+
+def maintain_rollups() -> None:
+    """Watcher step: backfill one day of market-wide partials and save the tiers."""
+    backfill_rollups()
+    default_rollups.save()
 
 
 def _risk_band(value: float | int | None, levels: tuple[float, float], labels: tuple[str, str, str]) -> str:
@@ -78,15 +526,13 @@ def _risk_band(value: float | int | None, levels: tuple[float, float], labels: t
         return mid_label
     return low_label
 
-def persist_snapshot_state(snapshot, symbol):
-    """
-    Persist snapshot states into state_history.
+# Snapshot layers _snapshot_states reads.
+PERSISTED_LAYERS = ("risk", "options", "deribit")
 
-    snapshot — объект Snapshot
-    symbol   — None (market) или тикер (BTCUSDT и т.д.)
-    """
 
-    from persistence.state_history import record_state
+def _snapshot_states(snapshot, symbol) -> list[dict]:
+    """record_state kwargs for every state a snapshot persists."""
+    states = []
 
     # -------- RISK --------
     if snapshot.risk:
@@ -101,40 +547,63 @@ def persist_snapshot_state(snapshot, symbol):
             labels=("LE_20", "GT_20", "GT_30"),
         )
 
-        record_state(
+        states.append(dict(
             layer="risk",
             state_key="avg_risk",
             state_value=avg_risk_band,
             symbol=symbol,
-        )
-        record_state(
+        ))
+        states.append(dict(
             layer="risk",
             state_key="risk_2plus_pct",
             state_value=riskact_band,
             symbol=symbol,
-        )
+        ))
 
     # -------- STRUCTURE (OPTIONS / OKX) --------
     if snapshot.options:
         phase = snapshot.options.get("dominant_phase")
         if phase:
-            record_state(
+            states.append(dict(
                 layer="structure",
                 state_key="dominant_phase",
                 state_value=str(phase),
                 symbol=None,  # structure is market-wide
-            )
+            ))
 
     # -------- VOLATILITY (DERIBIT) --------
     if snapshot.deribit:
         vbi = snapshot.deribit.get("vbi_state")
         if vbi:
-            record_state(
+            states.append(dict(
                 layer="volatility",
                 state_key="vbi_state",
                 state_value=str(vbi),
                 symbol=None,  # vol is market-wide
-            )
+            ))
+
+    return states
+
+
+def persist_snapshot_state(snapshot, symbol):
+    """
+    Persist snapshot states into state_history.
+
+    snapshot — объект Snapshot
+    symbol   — None (market) или тикер (BTCUSDT и т.д.)
+    """
+
+    from persistence.state_history import record_state
+
+    for state in _snapshot_states(snapshot, symbol):
+        record_state(**state)
+
+
+async def persist_snapshot_state_async(snapshot, symbol):
+    from data.async_client import gather_all
+    from persistence.state_history import record_state_async
+
+    await gather_all(record_state_async(**state) for state in _snapshot_states(snapshot, symbol))
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Build market snapshot from Supabase logs")
@@ -157,19 +626,15 @@ def parse_args():
 
 
 if __name__ == "__main__":
-    from time_utils import parse_window
+    from time_utils import as_of_ms, parse_window
     from trend.state_evolution import analyze_state_evolution
     from output.console import print_state_evolution
 
-    snap_12h = run_snapshot(*parse_window("12h"))
-    snap_6h = run_snapshot(*parse_window("6h"))
-    snap_1h = run_snapshot(*parse_window("1h"))
+    windows = ["12h", "6h", "1h"]
+    ts_to = as_of_ms()
+    snaps = run_snapshots([parse_window(w, ts_to) for w in windows])
 
-    analysis = analyze_state_evolution([
-        ("12h", snap_12h),
-        ("6h", snap_6h),
-        ("1h", snap_1h),
-    ])
+    analysis = analyze_state_evolution(list(zip(windows, snaps)))
 
     print_state_evolution(
         analysis["windows"],
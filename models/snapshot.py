@@ -1,14 +1,112 @@
-from dataclasses import dataclass
+import asyncio
+
+from interpretation.engine import interpret
+from interpretation.states import detect_states
+
+
+# Aggregated layers of a snapshot.
+LAYERS = ("risk", "options", "deribit", "meta", "divergence")
+
+# Layers read by the derived fields.
+INTERPRETATION_LAYERS = ("risk", "options", "deribit", "meta")
+STATE_LAYERS = ("options", "deribit")
+
+
+class LayerNotLoaded(LookupError):
+    """
+    A snapshot layer was read before it was loaded and cannot be loaded
+    there. Not an AttributeError, so getattr(snapshot, name, default) and
+    hasattr() do not hide it.
+    """
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _layer(name: str) -> property:
+    return property(lambda self: self.load((name,))[name])
+
 
-@dataclass
 class MarketSnapshot:
-    ts_from: int
-    ts_to: int
+    """
+    Aggregated layers of one window (dicts, {} when the window has no rows),
+    plus the interpretation and active states derived from them.
+
+    Layers are given up front or loaded on first access: `loader(names)`
+    returns {name: layer} for the missing ones. interpretation and
+    active_states are computed on first access from the layers they read.
+    The loader blocks, so on an event loop a missing layer raises instead
+    of loading; async callers request their layers up front
+    (run_snapshots_async(..., layers=...)) or `await snapshot.aload(...)`.
+    """
+
+    risk = _layer("risk")
+    options = _layer("options")
+    deribit = _layer("deribit")
+    meta = _layer("meta")
+    divergence = _layer("divergence")
+
+    def __init__(self, ts_from: int, ts_to: int, loader=None, **layers):
+        unknown = set(layers) - set(LAYERS)
+        if unknown:
+            raise TypeError(f"unknown snapshot layers: {sorted(unknown)}")
+
+        self.ts_from = ts_from
+        self.ts_to = ts_to
+        self._loader = loader
+        self._layers = dict(layers)
+        self._interpretation = None
+        self._active_states = None
+
+    def missing(self, names=LAYERS) -> list[str]:
+        return [name for name in names if name not in self._layers]
+
+    def fill(self, layers: dict) -> None:
+        """Set layers not loaded yet; loaded ones are kept."""
+        for name, value in layers.items():
+            self._layers.setdefault(name, value)
+
+    def _not_loaded(self, missing: list[str], hint: str = "") -> LayerNotLoaded:
+        return LayerNotLoaded(f"snapshot layers not loaded: {', '.join(missing)}{hint}")
+
+    def load(self, names) -> dict:
+        """{name: layer} for `names`, loading the missing ones in one call."""
+        missing = self.missing(names)
+        if missing:
+            if self._loader is None:
+                raise self._not_loaded(missing)
+            if _on_event_loop():
+                raise self._not_loaded(missing, " (use `await snapshot.aload(...)` on an event loop)")
+            self.fill(self._loader(missing))
+        return {name: self._layers[name] for name in names}
+
+    async def aload(self, names) -> dict:
+        """load() for async callers: the missing layers load on a worker thread."""
+        missing = self.missing(names)
+        if missing:
+            if self._loader is None:
+                raise self._not_loaded(missing)
+            self.fill(await asyncio.to_thread(self._loader, missing))
+        return {name: self._layers[name] for name in names}
+
+    @property
+    def interpretation(self) -> str:
+        if self._interpretation is None:
+            self.load(INTERPRETATION_LAYERS)
+            self._interpretation = interpret(self)
+        return self._interpretation
 
-    risk: dict
-    options: dict
-    deribit: dict
-    meta: dict
+    @property
+    def active_states(self) -> list[str]:
+        if self._active_states is None:
+            self.load(STATE_LAYERS)
+            self._active_states = detect_states(self)
+        return self._active_states
 
-    interpretation: str = ""
-    active_states: list[str] = None
+    def __repr__(self) -> str:
+        return f"MarketSnapshot(ts_from={self.ts_from}, ts_to={self.ts_to}, layers={sorted(self._layers)})"
@@ -1,12 +1,12 @@
+import asyncio
 from datetime import datetime, timezone
-from json import dumps, loads
-import socket
+from json import dumps
 import time
-from urllib.error import HTTPError, URLError
 from urllib.parse import urlencode
-from urllib.request import Request, urlopen
 
 from config import SUPABASE_KEY, SUPABASE_URL
+from data.http_pool import ACCEPT_ENCODING, TRANSIENT_ERRORS, default_pool, transfer_stats
+from data.json_codec import loads
 
 
 PAGE_SIZE = 200
@@ -15,10 +15,11 @@ MAX_RETRIES = 3
 RETRY_BACKOFF_SECONDS = 1.5
 
 
-def _build_request(url: str, method: str = "GET", payload: dict | None = None) -> Request:
+def _build_request(url: str, method: str = "GET", payload: dict | None = None) -> tuple[str, str, dict, bytes | None]:
     headers = {
         "apikey": SUPABASE_KEY,
         "Authorization": f"Bearer {SUPABASE_KEY}",
+        "Accept-Encoding": ACCEPT_ENCODING,
     }
 
     data = None
@@ -27,7 +28,72 @@ def _build_request(url: str, method: str = "GET", payload: dict | None = None) -
         headers["Prefer"] = "return=minimal"
         data = dumps(payload).encode("utf-8")
 
-    return Request(url, headers=headers, method=method, data=data)
+    return method, url, headers, data
+
+
+def _send(req: tuple[str, str, dict, bytes | None]) -> bytes:
+    method, url, headers, data = req
+
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            status, _, body = default_pool.request(
+                method,
+                url,
+                headers=headers,
+                body=data,
+                timeout=REQUEST_TIMEOUT_SECONDS,
+                label="state_history",
+            )
+        except TRANSIENT_ERRORS as exc:
+            if attempt == MAX_RETRIES:
+                reason = getattr(exc, "reason", exc)
+                raise RuntimeError(f"state_history connection error: {reason}") from exc
+            time.sleep(RETRY_BACKOFF_SECONDS * attempt)
+            continue
+
+        if status >= 400:
+            detail = body.decode("utf-8", errors="replace")
+            raise RuntimeError(f"state_history HTTP error {status}: {detail}")
+
+        return body
+
+    raise RuntimeError("state_history connection error: exhausted retries")
+
+
+async def _send_async(req: tuple[str, str, dict, bytes | None]) -> bytes:
+    # Imported here: the blocking path (watcher, CLI) needs no httpx.
+    import httpx
+
+    from data.async_client import UNSENT_ERRORS, get_http
+
+    method, url, headers, data = req
+
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            response = await get_http().request(
+                method,
+                url,
+                headers=headers,
+                content=data,
+                timeout=REQUEST_TIMEOUT_SECONDS,
+            )
+        except httpx.TransportError as exc:
+            # an insert is sent again only if it never reached the server
+            if attempt == MAX_RETRIES or (method != "GET" and not isinstance(exc, UNSENT_ERRORS)):
+                raise RuntimeError(f"state_history connection error: {exc}") from exc
+            await asyncio.sleep(RETRY_BACKOFF_SECONDS * attempt)
+            continue
+        except httpx.RequestError as exc:
+            raise RuntimeError(f"state_history request error: {exc}") from exc
+
+        transfer_stats.record("state_history", response.num_bytes_downloaded, len(response.content))
+
+        if response.status_code >= 400:
+            raise RuntimeError(f"state_history HTTP error {response.status_code}: {response.text}")
+
+        return response.content
+
+    raise RuntimeError("state_history connection error: exhausted retries")
 
 
 def _build_state_query(
@@ -55,13 +121,13 @@ def _build_state_query(
     return urlencode(query_params)
 
 
-def _fetch_state_rows(
+def _state_rows_request(
     layer: str,
     state_key: str,
     symbol: str | None,
     limit: int,
     offset: int = 0,
-) -> list[dict]:
+) -> tuple[str, str, dict, bytes | None]:
     query = _build_state_query(
         layer=layer,
         state_key=state_key,
@@ -72,22 +138,29 @@ def _fetch_state_rows(
     )
     url = f"{SUPABASE_URL}/rest/v1/state_history?{query}"
 
-    req = _build_request(url)
+    return _build_request(url)
 
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            with urlopen(req, timeout=REQUEST_TIMEOUT_SECONDS) as response:
-                return loads(response.read().decode("utf-8"))
-        except HTTPError as exc:
-            detail = exc.read().decode("utf-8", errors="replace") if exc.fp else str(exc)
-            raise RuntimeError(f"state_history HTTP error {exc.code}: {detail}") from exc
-        except (TimeoutError, socket.timeout, URLError) as exc:
-            if attempt == MAX_RETRIES:
-                reason = getattr(exc, "reason", exc)
-                raise RuntimeError(f"state_history connection error: {reason}") from exc
-            time.sleep(RETRY_BACKOFF_SECONDS * attempt)
 
-    raise RuntimeError("state_history connection error: exhausted retries")
+def _fetch_state_rows(
+    layer: str,
+    state_key: str,
+    symbol: str | None,
+    limit: int,
+    offset: int = 0,
+) -> list[dict]:
+    req = _state_rows_request(layer, state_key, symbol, limit, offset)
+    return loads(_send(req))
+
+
+async def _fetch_state_rows_async(
+    layer: str,
+    state_key: str,
+    symbol: str | None,
+    limit: int,
+    offset: int = 0,
+) -> list[dict]:
+    req = _state_rows_request(layer, state_key, symbol, limit, offset)
+    return loads(await _send_async(req))
 
 
 def _fetch_last_state(layer: str, state_key: str, symbol: str | None) -> str | None:
@@ -99,10 +172,44 @@ def _fetch_last_state(layer: str, state_key: str, symbol: str | None) -> str | N
     return rows[0].get("state_value")
 
 
+async def _fetch_last_state_async(layer: str, state_key: str, symbol: str | None) -> str | None:
+    rows = await _fetch_state_rows_async(layer=layer, state_key=state_key, symbol=symbol, limit=1)
+
+    if not rows:
+        return None
+
+    return rows[0].get("state_value")
+
+
 def _parse_ts(value: str) -> datetime:
     return datetime.fromisoformat(value.replace("Z", "+00:00"))
 
 
+def _scan_state_run(rows: list[dict], current_value: str, state_start_ts):
+    """
+    Walk one page (newest first) while the state keeps `current_value`.
+    Returns the earliest ts of the run so far and whether the run ended.
+    """
+    for row in rows:
+        if str(row.get("state_value")) != current_value:
+            return state_start_ts, True
+        state_start_ts = row.get("ts")
+
+    return state_start_ts, len(rows) < PAGE_SIZE
+
+
+def _persistence_result(current_value: str, state_start_ts) -> tuple[str, int]:
+    if not state_start_ts:
+        return current_value, 0
+
+    started_at = _parse_ts(state_start_ts)
+    if started_at.tzinfo is None:
+        started_at = started_at.replace(tzinfo=timezone.utc)
+
+    hours = int((datetime.now(timezone.utc) - started_at).total_seconds() // 3600)
+    return current_value, max(0, hours)
+
+
 def get_state_persistence_hours(
     layer: str,
     state_key: str,
@@ -123,36 +230,55 @@ def get_state_persistence_hours(
 
     offset = 0
     while True:
-        for row in rows:
-            row_value = str(row.get("state_value"))
-            if row_value != current_value:
-                break
-            state_start_ts = row.get("ts")
-        else:
-            if len(rows) < PAGE_SIZE:
-                break
-            offset += PAGE_SIZE
-            rows = _fetch_state_rows(
-                layer=layer,
-                state_key=state_key,
-                symbol=symbol,
-                limit=PAGE_SIZE,
-                offset=offset,
-            )
-            if not rows:
-                break
-            continue
-        break
+        state_start_ts, ended = _scan_state_run(rows, current_value, state_start_ts)
+        if ended:
+            break
+        offset += PAGE_SIZE
+        rows = _fetch_state_rows(
+            layer=layer,
+            state_key=state_key,
+            symbol=symbol,
+            limit=PAGE_SIZE,
+            offset=offset,
+        )
+        if not rows:
+            break
+
+    return _persistence_result(current_value, state_start_ts)
+
+
+async def get_state_persistence_hours_async(
+    layer: str,
+    state_key: str,
+    symbol: str | None = None,
+) -> tuple[str, int] | None:
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        raise RuntimeError("Supabase credentials not set")
 
-    if not state_start_ts:
-        return current_value, 0
+    rows = await _fetch_state_rows_async(layer=layer, state_key=state_key, symbol=symbol, limit=PAGE_SIZE)
+    if not rows:
+        return None
 
-    started_at = _parse_ts(state_start_ts)
-    if started_at.tzinfo is None:
-        started_at = started_at.replace(tzinfo=timezone.utc)
+    current_value = str(rows[0].get("state_value"))
+    state_start_ts = rows[0].get("ts")
 
-    hours = int((datetime.now(timezone.utc) - started_at).total_seconds() // 3600)
-    return current_value, max(0, hours)
+    offset = 0
+    while True:
+        state_start_ts, ended = _scan_state_run(rows, current_value, state_start_ts)
+        if ended:
+            break
+        offset += PAGE_SIZE
+        rows = await _fetch_state_rows_async(
+            layer=layer,
+            state_key=state_key,
+            symbol=symbol,
+            limit=PAGE_SIZE,
+            offset=offset,
+        )
+        if not rows:
+            break
+
+    return _persistence_result(current_value, state_start_ts)
 
 
 def record_state(
@@ -173,28 +299,40 @@ def record_state(
     if last_value == state_value_str:
         return
 
+    _send(_state_insert_request(layer, state_key, state_value_str, symbol))
+
+
+async def record_state_async(
+    layer: str,
+    state_key: str,
+    state_value: str,
+    symbol: str | None = None,
+) -> None:
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        raise RuntimeError("Supabase credentials not set")
+
+    state_value_str = str(state_value)
+    last_value = await _fetch_last_state_async(layer, state_key, symbol)
+
+    if last_value == state_value_str:
+        return
+
+    await _send_async(_state_insert_request(layer, state_key, state_value_str, symbol))
+
+
+def _state_insert_request(
+    layer: str,
+    state_key: str,
+    state_value: str,
+    symbol: str | None,
+) -> tuple[str, str, dict, bytes | None]:
     payload = {
         "ts": datetime.now(timezone.utc).isoformat(),
         "layer": layer,
         "state_key": state_key,
-        "state_value": state_value_str,
+        "state_value": state_value,
         "symbol": symbol,
     }
 
     url = f"{SUPABASE_URL}/rest/v1/state_history"
-    req = _build_request(url, method="POST", payload=payload)
-
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            with urlopen(req, timeout=REQUEST_TIMEOUT_SECONDS):
-                return
-        except HTTPError as exc:
-            detail = exc.read().decode("utf-8", errors="replace") if exc.fp else str(exc)
-            raise RuntimeError(f"state_history HTTP error {exc.code}: {detail}") from exc
-        except (TimeoutError, socket.timeout, URLError) as exc:
-            if attempt == MAX_RETRIES:
-                reason = getattr(exc, "reason", exc)
-                raise RuntimeError(f"state_history connection error: {reason}") from exc
-            time.sleep(RETRY_BACKOFF_SECONDS * attempt)
-
-    raise RuntimeError("state_history connection error: exhausted retries")
+    return _build_request(url, method="POST", payload=payload)
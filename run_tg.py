@@ -9,6 +9,9 @@ from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from typing import Optional
 from urllib.parse import urlsplit
 
+from data.http_pool import default_pool, transfer_stats
+from data.row_cache import default_row_cache
+from data.single_flight import default_single_flight
 from data.queries import load_latest_log_ts
 from runtime_env import validate_required_env
 from tg.bot import run_bot
@@ -131,6 +134,10 @@ class ServiceState:
                 "last_probe_at": supabase_last_probe_at,
                 "last_ok_at": supabase_last_ok_at,
                 "last_error": supabase_last_error,
+                "pool": default_pool.stats(),
+                "row_cache": default_row_cache.stats(),
+                "single_flight": default_single_flight.stats(),
+                "transfer": transfer_stats.stats(),
             },
             "shutting_down": shutting_down,
             "fatal_error": fatal_error,
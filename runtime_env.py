@@ -26,11 +26,19 @@ def validate_required_env() -> None:
         except ValueError:
             invalid.append(name)
 
+    relative = [
+        name
+        for name in ("SNAPSHOT_ROLLUP_PATH",)
+        if not _is_missing(os.getenv(name)) and not os.path.isabs(os.getenv(name).strip())
+    ]
+
     errors = []
     if missing:
         errors.append(f"missing: {', '.join(missing)}")
     if invalid:
         errors.append(f"must be integers: {', '.join(invalid)}")
+    if relative:
+        errors.append(f"must be absolute paths: {', '.join(relative)}")
 
     if errors:
         joined = "; ".join(errors)
@@ -0,0 +1,54 @@
+import main
+from aggregation.rollups import DAY_MS, RollupStore
+from data.records import decode_row
+
+
+NOW_MS = 1_760_000_000_000 + 13 * 3600 * 1000
+STEP_MS = 10 * 60 * 1000
+
+
+def _fake_load_many(calls):
+    def load_many(events, ts_from, ts_to, symbol=None):
+        calls.append((ts_from, ts_to))
+        start = -(-ts_from // STEP_MS) * STEP_MS
+        return {
+            event: [
+                decode_row({"ts": ts, "event": event, "data": {"symbol": "BTCUSDT", "risk": 1}})
+                for ts in range(start, ts_to + 1, STEP_MS)
+            ]
+            for event in events
+        }
+    return load_many
+
+
+def _gaps(store, ts_from, ts_to):
+    return [
+        piece[1:]
+        for event in main.SNAPSHOT_EVENTS
+        for piece in store.lookup(main._rollup_key(None, event), ts_from, ts_to)
+        if piece[0] == "gap"
+    ]
+
+
+def test_watcher_cycles_backfill_every_complete_day(monkeypatch):
+    store = RollupStore(max_keys=16, minute_hours=24, hour_days=35, days=35, settle_seconds=60, path=None)
+    calls = []
+    clock = [NOW_MS]
+    monkeypatch.setattr(main, "default_rollups", store)
+    monkeypatch.setattr(main, "load_many", _fake_load_many(calls))
+    monkeypatch.setattr(main.time, "time", lambda: clock[0] / 1000)
+
+    days = 3
+    today = NOW_MS // DAY_MS * DAY_MS
+    # A snapshot covered the live edge first, as /stats and the watcher do.
+    store.absorb(main._rollup_key(None, "risk_eval"), {"risk_eval": main.SNAPSHOT_LAYERS["risk_eval"]},
+                 today, NOW_MS - 120_000, _fake_load_many([])(("risk_eval",), today, NOW_MS - 120_000), NOW_MS)
+
+    for _ in range(days + 5):
+        clock[0] += 120_000
+        main.backfill_rollups(days=days)
+
+    assert _gaps(store, today - days * DAY_MS, today - 1) == []
+    # One whole day per cycle, newest first, and nothing once they are stored.
+    assert calls == [(today - n * DAY_MS, today - (n - 1) * DAY_MS - 1) for n in range(1, days + 1)]
+    assert not main.backfill_rollups(days=days)
@@ -0,0 +1,86 @@
+import json
+import math
+import random
+from collections import Counter
+
+from aggregation.engine import Counts, First, Latest, Mean, Mode, Sum, collect, finish, merge, partial
+from aggregation.rollups import _pack, _unpack
+
+
+METRICS = {
+    "sum_float": Sum("x"),
+    "sum_int": Sum("n"),
+    "mean": Mean("x"),
+    "counts": Counts("tag"),
+    "truthy": Counts("tag", truthy=True),
+    "mode": Mode("tag"),
+    "first": First("tag"),
+    "latest": Latest("tag"),
+}
+
+
+def _rows(rng, count):
+    rows = []
+    ts = 0
+    for _ in range(count):
+        ts += rng.choice((0, 1, 1000))  # equal ts too, for Latest ties
+        data = {
+            "x": rng.choice((rng.uniform(-1e6, 1e6), rng.uniform(-1e-9, 1e-9), 1e16, -1e16, rng.randint(-3, 3))),
+            "n": rng.randint(-50, 50),
+            "tag": rng.choice(("a", "b", "c", "", None)),
+        }
+        if rng.random() < 0.1:
+            del data["x"]
+        rows.append({"ts": ts, "data": data})
+    return rows
+
+
+def _splits(rng, rows):
+    cuts = sorted(rng.sample(range(len(rows) + 1), rng.randint(0, min(8, len(rows) + 1))))
+    bounds = [0, *cuts, len(rows)]
+    return [rows[a:b] for a, b in zip(bounds, bounds[1:])]
+
+
+def test_merged_partials_equal_one_pass_over_all_rows():
+    rng = random.Random(7)
+    for _ in range(200):
+        rows = _rows(rng, rng.choice((0, 1, 5, 300, 9000)))
+        whole = collect(METRICS, rows)
+        merged = finish(METRICS, merge(METRICS, [partial(METRICS, run) for run in _splits(rng, rows)]))
+        assert merged == whole
+
+
+def test_one_pass_matches_plain_python():
+    rows = _rows(random.Random(11), 5000)
+    datas = [r["data"] for r in rows]
+    xs = [d.get("x", 0) for d in datas]
+    tags = [d.get("tag") for d in datas]
+    numeric = [float(d["x"]) for d in datas if "x" in d]
+
+    m, total = collect(METRICS, rows)
+
+    assert total == len(rows)
+    assert m["sum_float"] == math.fsum(xs)
+    assert m["sum_int"] == sum(d["n"] for d in datas) and type(m["sum_int"]) is int
+    assert m["mean"] == math.fsum(numeric) / len(numeric)
+    assert m["counts"] == Counter(tags)
+    assert m["truthy"] == Counter(filter(None, tags))
+    assert m["mode"] == Counter(t for t in tags if t not in (None, "")).most_common(1)[0][0]
+    assert m["first"] == tags[0]
+    latest_ts = max(r["ts"] for r in rows)
+    assert m["latest"] == next(r["data"].get("tag") for r in rows if r["ts"] == latest_ts)
+
+
+def test_stored_partials_merge_like_fresh_ones():
+    rng = random.Random(3)
+    rows = _rows(rng, 3000)
+    runs = _splits(rng, rows)
+    stored = [
+        _unpack(json.loads(json.dumps(_pack(partial(METRICS, run).states))))
+        for run in runs
+    ]
+    parts = [partial(METRICS, run) for run in runs]
+    for part, states in zip(parts, stored):
+        part.states = states
+
+    assert finish(METRICS, merge(METRICS, parts)) == collect(METRICS, rows)
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from data import json_codec
+from data.json_codec import iter_array
+
+
+PAGE = [
+    {"id": 1, "ts": "2025-10-09T12:00:00+00:00", "data": {"risk": 3, "note": "façade ✓ 📈", "nested": [1, [2, {}]]}},
+    {"id": 2, "ts": 1760000000000, "data": {"mci": -0.125, "tiny": 1.5e-9, "big": 12345678901234567890}},
+    "a ] , [ string",
+    -12.5,
+    0,
+    True,
+    None,
+    [],
+]
+BODY = json.dumps(PAGE, ensure_ascii=False).encode("utf-8")
+
+
+def _chunked(data: bytes, size: int) -> list[bytes]:
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_every_split_point_yields_the_same_elements():
+    # Includes splits inside multi-byte characters, strings and numbers.
+    for cut in range(1, len(BODY)):
+        assert list(iter_array([BODY[:cut], BODY[cut:]])) == PAGE
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, len(BODY)])
+def test_small_chunks_yield_the_same_elements(size):
+    assert list(iter_array(_chunked(BODY, size))) == PAGE
+
+
+def test_elements_are_yielded_before_the_array_ends():
+    items = iter_array(iter([b'[{"id": 1},', b' {"id"', b": 2}"]))
+    assert next(items) == {"id": 1}
+
+
+def test_numbers_wait_for_their_delimiter():
+    assert list(iter_array([b"[1", b"2", b".5", b"e1, 3", b"]"])) == [125.0, 3]
+
+
+def test_whitespace_and_empty_arrays():
+    assert list(iter_array([b" \n[", b" ]\r\n"])) == []
+    assert list(iter_array([b"[]"])) == []
+
+
+@pytest.mark.parametrize("body", [b"", b'[{"id": 1}', b'{"id": 1}', b"[1, 2] 3", b'[{"id": 1}, tru]'])
+def test_malformed_arrays_raise_value_error(body):
+    with pytest.raises(ValueError):
+        list(iter_array(_chunked(body, 3)))
+
+
+def test_stdlib_path_without_orjson(monkeypatch):
+    monkeypatch.setattr(json_codec, "orjson", None)
+
+    assert json_codec.load_chunks(_chunked(BODY, 5)) == PAGE
+    assert json_codec.loads(BODY) == PAGE
+
+
+def test_orjson_path_matches_stdlib():
+    pytest.importorskip("orjson")
+
+    assert json_codec.load_chunks(_chunked(BODY, 5)) == PAGE
+    assert json_codec.loads(BODY) == PAGE
@@ -0,0 +1,100 @@
+import random
+
+import pytest
+
+from data.client import LogQuery, SupabaseClient
+
+
+QUERY = LogQuery(events=("risk_eval",))
+
+
+class _FakeLogs(SupabaseClient):
+    """Serves pages from an in-memory `logs` table the way PostgREST would."""
+
+    PAGE_SIZE = 5
+
+    def __init__(self, table):
+        super().__init__()
+        self.table = table
+        self.requests = []
+
+    def _request_page(self, query, ts_from, ts_to, offset=0, cursor=None, count=None):
+        self.requests.append((ts_from, ts_to, cursor, offset))
+        rows = [r for r in self.table if ts_from <= r["ts"] <= ts_to]
+        if cursor is not None:
+            last_ts, last_id = cursor
+            rows = [r for r in rows if r["ts"] > last_ts or (r["ts"] == last_ts and r["id"] > last_id)]
+        rows.sort(key=lambda r: (r["ts"], r["id"]))
+        page = [dict(r) for r in rows[offset:offset + self.PAGE_SIZE]]
+        return page, f"0-{len(page) - 1}/{len(rows)}" if count else ""
+
+
+def _table(seed, count=200, spread=40):
+    # Few distinct timestamps, so page edges keep landing inside ties.
+    rng = random.Random(seed)
+    ids = rng.sample(range(1, 10 * count), count)
+    return [{"id": i, "ts": 1000 + rng.randrange(spread), "data": {}} for i in ids]
+
+
+def _keys(pages):
+    return [(r["ts"], r["id"]) for page in pages for r in page]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_keyset_walk_breaks_ts_ties_by_id(seed):
+    table = _table(seed)
+    client = _FakeLogs(table)
+
+    keys = _keys(client._walk_keyset(QUERY, 0, 10_000))
+
+    assert keys == sorted((r["ts"], r["id"]) for r in table)
+    cursors = [c for _, _, c, _ in client.requests if c is not None]
+    assert any(a[0] == b[0] for a, b in zip(cursors, cursors[1:])), "no page edge inside a tie"
+
+
+def test_rows_inserted_behind_the_cursor_do_not_shift_pages():
+    table = _table(9)
+    client = _FakeLogs(table)
+    walk = client._walk_keyset(QUERY, 0, 10_000)
+
+    pages = [next(walk)]
+    table.extend({"id": 50_000 + i, "ts": 999, "data": {}} for i in range(7))  # before the cursor
+    pages.extend(walk)
+
+    keys = _keys(pages)
+    assert len(keys) == len(set(keys))
+    assert keys == sorted(keys)
+    assert not any(i >= 50_000 for _, i in keys)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_time_slices_neither_overlap_nor_skip_rows(seed):
+    table = _table(seed, count=300, spread=60)
+    client = _FakeLogs(table)
+
+    # ts_to at the last row, so slice bounds land on timestamps with rows
+    keys = _keys(client._iter_pages_keyset(QUERY, 0, 1059, fan_out=4))
+
+    slices = {(a, b) for a, b, cursor, _ in client.requests if cursor is None} - {(0, 1059)}
+    assert len(slices) == 3
+    assert keys == sorted((r["ts"], r["id"]) for r in table)
+
+
+def test_slice_plan_bounds_are_contiguous():
+    client = _FakeLogs([])
+    first = [{"id": i, "ts": 1000 + i // 2} for i in range(5)]
+
+    cursor, bounds = client._slice_plan(first, "0-4/10000", 5000, fan_out=4)
+
+    assert cursor == (1002, 4)
+    assert bounds[0] == 1002 and bounds[-1] == 5000 and len(bounds) == 5
+    # Slice k walks (bounds[k], bounds[k+1]]; the first resumes from the cursor.
+    assert all(a < b for a, b in zip(bounds, bounds[1:]))
+
+
+def test_slice_plan_stays_sequential_without_a_usable_count():
+    client = _FakeLogs([])
+    first = [{"id": i, "ts": 1000 + i} for i in range(5)]
+
+    assert client._slice_plan(first, "0-4/*", 5000, fan_out=4) == ((1004, 4), None)
+    assert client._slice_plan(first, "0-4/10000", 5000, fan_out=1) == ((1004, 4), None)
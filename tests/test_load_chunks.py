@@ -0,0 +1,30 @@
+import threading
+
+import pytest
+
+import main
+
+
+def test_timed_out_loads_do_not_starve_the_next_snapshot(monkeypatch):
+    release = threading.Event()
+    started = []
+
+    def load_many(events, ts_from, ts_to, symbol=None):
+        started.append(ts_from)
+        if ts_from < 100:
+            release.wait(5)  # a slow window
+        return {event: [] for event in events}
+
+    monkeypatch.setattr(main, "load_many", load_many)
+    monkeypatch.setattr(main, "SNAPSHOT_LOAD_WORKERS", 2)
+    monkeypatch.setattr(main, "SNAPSHOT_DEADLINE_SECONDS", 0.2)
+    try:
+        slow = [(0, 1, ("risk_eval",)), (10, 11, ("risk_eval",)), (20, 21, ("risk_eval",))]
+        with pytest.raises(RuntimeError, match="not loaded within"):
+            list(main._load_chunks(slow, None))
+
+        fast = [(100, 101, ("risk_eval",)), (200, 201, ("risk_eval",))]
+        assert list(main._load_chunks(fast, None)) == [{"risk_eval": []}, {"risk_eval": []}]
+        assert 20 not in started  # queued behind the deadline: never started
+    finally:
+        release.set()
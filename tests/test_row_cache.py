@@ -0,0 +1,81 @@
+import time
+
+from data import row_cache
+from data.row_cache import SegmentRowCache
+
+
+NOW_MS = 1_760_000_000_000
+SEC = 1000
+
+
+def _rows(ts_from, ts_to, step=10 * SEC):
+    ts = list(range(ts_from, ts_to + 1, step))
+    return [{"ts": t} for t in ts], ts
+
+
+def _store(cache, key, ts_from, ts_to, now_ms=NOW_MS):
+    rows, ts = _rows(ts_from, ts_to)
+    cache.store(key, ts_from, ts_to, rows, ts, now_ms)
+    return rows
+
+
+def _shape(pieces):
+    return [("rows", len(p[1])) if p[0] == "rows" else p for p in pieces]
+
+
+def test_live_edge_is_served_while_fresh():
+    cache = SegmentRowCache(max_rows=1000, live_max_age=30, settle_seconds=120)
+    rows = _store(cache, ("k",), NOW_MS - 600 * SEC, NOW_MS)
+
+    assert _shape(cache.lookup(("k",), NOW_MS - 600 * SEC, NOW_MS)) == [("rows", len(rows))]
+    assert cache.stats()["hits"] == 1
+
+
+def test_live_edge_expires_and_settled_rows_stay(monkeypatch):
+    cache = SegmentRowCache(max_rows=1000, live_max_age=30, settle_seconds=120)
+    _store(cache, ("k",), NOW_MS - 600 * SEC, NOW_MS)
+    later = time.monotonic() + 31
+    monkeypatch.setattr(row_cache.time, "monotonic", lambda: later)
+
+    pieces = cache.lookup(("k",), NOW_MS - 600 * SEC, NOW_MS)
+
+    settled = NOW_MS - 120 * SEC
+    assert pieces[0][0] == "rows" and max(r["ts"] for r in pieces[0][1]) < settled
+    assert pieces[1:] == [("gap", settled, NOW_MS)]
+    assert cache.stats()["rows_cached"] == len(pieces[0][1])
+
+
+def test_refetched_tail_replaces_the_expired_edge(monkeypatch):
+    cache = SegmentRowCache(max_rows=1000, live_max_age=30, settle_seconds=120)
+    _store(cache, ("k",), NOW_MS - 600 * SEC, NOW_MS)
+    later = time.monotonic() + 31
+    monkeypatch.setattr(row_cache.time, "monotonic", lambda: later)
+    (_, a, b), = [p for p in cache.lookup(("k",), NOW_MS - 600 * SEC, NOW_MS) if p[0] == "gap"]
+    monkeypatch.undo()
+
+    _store(cache, ("k",), a, b + 60 * SEC, now_ms=NOW_MS + 60 * SEC)
+
+    assert _shape(cache.lookup(("k",), NOW_MS - 600 * SEC, NOW_MS + 60 * SEC)) == [("rows", 67)]
+
+
+def test_least_recently_used_keys_are_evicted_by_rows():
+    cache = SegmentRowCache(max_rows=20, live_max_age=30, settle_seconds=0)
+    span = 70 * SEC  # 8 rows
+    for key in ("a", "b"):
+        _store(cache, (key,), NOW_MS - span, NOW_MS)
+    cache.lookup(("a",), NOW_MS - span, NOW_MS)  # "b" is now least recent
+
+    _store(cache, ("c",), NOW_MS - span, NOW_MS)
+
+    assert cache.lookup(("b",), NOW_MS - span, NOW_MS) == [("gap", NOW_MS - span, NOW_MS)]
+    assert _shape(cache.lookup(("a",), NOW_MS - span, NOW_MS)) == [("rows", 8)]
+    stats = cache.stats()
+    assert (stats["evictions"], stats["rows_cached"], stats["keys"]) == (1, 16, 2)
+
+
+def test_fetch_larger_than_the_cache_is_not_kept():
+    cache = SegmentRowCache(max_rows=5, live_max_age=30, settle_seconds=0)
+    _store(cache, ("k",), NOW_MS - 600 * SEC, NOW_MS)
+
+    assert cache.lookup(("k",), NOW_MS - 600 * SEC, NOW_MS) == [("gap", NOW_MS - 600 * SEC, NOW_MS)]
+    assert cache.stats()["rows_cached"] == 0
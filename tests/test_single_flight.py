@@ -0,0 +1,22 @@
+import asyncio
+
+from data.single_flight import AsyncSingleFlight
+
+
+def test_only_calls_with_the_same_stamp_share_a_run():
+    flight = AsyncSingleFlight()
+    runs = []
+
+    async def call(stamp):
+        async def fn():
+            runs.append(stamp)
+            await asyncio.sleep(0.01)
+            return stamp
+        return await flight.do(("k",), fn, stamp=stamp)
+
+    async def main():
+        return await asyncio.gather(call(1000), call(1000), call(1001))
+
+    assert asyncio.run(main()) == [1000, 1000, 1001]
+    assert sorted(runs) == [1000, 1001]
+    assert flight.stats() == {"executions": 2, "coalesced": 1, "in_flight": 0}
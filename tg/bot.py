@@ -1,21 +1,28 @@
 import asyncio
 import html
+import inspect
 import logging
 from typing import Callable, Optional
 from telegram.error import BadRequest, NetworkError, TimedOut
 from config import DATA_SCOPE
-from trend.dispersion import compute_dispersion
-from trend.market_structure import compute_market_structure
+from trend.dispersion import compute_dispersion_async
+from trend.market_structure import compute_market_structure_async
+from data.async_client import close_http, gather_all
 from data.queries import (
-    load_bybit_market_state,
-    load_deribit,
-    load_divergence,
-    load_event,
-    load_latest_log_ts,
-    load_okx_market_state,
-    load_risk,
+    load_divergence_async,
+    load_event_async,
+    load_latest_log_ts_async,
+    load_risk_async,
 )
-from main import persist_snapshot_state, run_snapshot
+from main import (
+    PERSISTED_LAYERS,
+    maintain_rollups,
+    persist_snapshot_state_async,
+    run_snapshot_async,
+    run_snapshots_async,
+    run_symbol_snapshots_async,
+)
+from models.snapshot import STATE_LAYERS
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.constants import ParseMode
 from telegram.ext import (
@@ -30,6 +37,11 @@ from telegram.ext import (
 from tg.bot_alerts import build_anomaly_alert, can_send_alert, can_send_anomaly
 from tg.bot_config import ALERT_CHAT_ID, SUPPORTED_TICKERS, TELEGRAM_TOKEN, normalize_ticker
 from tg.bot_formatting import (
+    SNAPSHOT_TEXT_LAYERS,
+    STATUS_PRICE_FIELDS,
+    STATUS_PRICE_WINDOW,
+    STATUS_TICKER_LAYERS,
+    STATUS_WINDOWS,
     _extract_iv_slope,
     _fmt_number,
     _fmt_price,
@@ -37,12 +49,16 @@ from tg.bot_formatting import (
     _format_last_snapshot_utc,
     _extract_status_price,
     aggregate_options_snapshot,
-    build_market_persistence_block_cached,
+    build_market_persistence_block_cached_async,
+    build_status_market_block_cached_async,
+    load_options_venues_async,
     parse_window_safe,
     render_options_snapshot,
+    render_scan,
     snapshot_to_text,
     split_text_chunks,
 )
+from time_utils import as_of_ms
 from tg.bot_keyboards import (
     main_menu_keyboard,
     menu_button_keyboard,
@@ -58,7 +74,7 @@ from tg.bot_keyboards import (
 
 
 async def build_info_text(update: Update) -> str:
-    latest_ts = await run_data_task(update, "latest log ts", load_latest_log_ts)
+    latest_ts = await run_data_task(update, "latest log ts", load_latest_log_ts_async)
     last_snapshot = _format_last_snapshot_utc(latest_ts)
 
     return (
@@ -181,7 +197,10 @@ async def safe_reply(
 
 
 async def run_data_task(update: Update, task_name: str, fn, *args, **kwargs):
+    # Coroutine functions are awaited on the loop; blocking ones run on a thread.
     try:
+        if inspect.iscoroutinefunction(fn):
+            return await fn(*args, **kwargs)
         return await asyncio.to_thread(fn, *args, **kwargs)
     except RuntimeError as exc:
         logger.warning("%s failed: %s", task_name, exc)
@@ -192,22 +211,19 @@ async def run_data_task(update: Update, task_name: str, fn, *args, **kwargs):
     return None
 
 
-async def collect_snapshots(update: Update, task_name: str, windows: list[str], symbol: str | None = None):
+async def collect_snapshots(update: Update, task_name: str, windows: list[str], symbol: str | None = None, layers=None):
+    # One ts_to for all windows: nested windows share their rows.
+    ts_to = as_of_ms()
     ranges = []
     for w in windows:
-        bounds = parse_window_safe(w)
+        bounds = parse_window_safe(w, ts_to)
         if bounds is None:
             await safe_reply(update, f"Invalid window: {w}. Use values like 10m, 1h, 6h, 1d.")
             return None
-        ranges.append((w, *bounds))
+        ranges.append(bounds)
 
     try:
-        snaps = await asyncio.gather(
-            *[
-                asyncio.to_thread(run_snapshot, ts_from, ts_to, symbol=symbol)
-                for _, ts_from, ts_to in ranges
-            ]
-        )
+        snaps = await run_snapshots_async(ranges, symbol=symbol, layers=layers)
     except RuntimeError as exc:
         logger.warning("%s failed: %s", task_name, exc)
         await safe_reply(update, "Data source timeout. Try again in 1-2 minutes.")
@@ -273,6 +289,8 @@ async def run_last_action(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await event(update, context)
     elif action == "dispersion":
         await dispersion(update, context)
+    elif action == "scan":
+        await scan(update, context)
     elif action == "information":
         await information(update, context)
     else:
@@ -330,7 +348,9 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await safe_reply(update, "Invalid window. Use values like 10m, 1h, 6h, 1d.")
             return
         ts_from, ts_to = bounds
-        snap = await run_data_task(update, "stats snapshot", run_snapshot, ts_from, ts_to)
+        snap = await run_data_task(
+            update, "stats snapshot", run_snapshot_async, ts_from, ts_to, layers=SNAPSHOT_TEXT_LAYERS
+        )
         if snap is None:
             return
 
@@ -344,7 +364,7 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # -------- MULTI WINDOW (STATE EVOLUTION) --------
-    snapshots = await collect_snapshots(update, "state snapshots", args)
+    snapshots = await collect_snapshots(update, "state snapshots", args, layers=SNAPSHOT_TEXT_LAYERS)
     if snapshots is None:
         return
 
@@ -355,7 +375,7 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         text += f"[{label}]\n"
         text += snapshot_to_text(snap) + "\n\n"
 
-    persistence_block = await run_data_task(update, "state persistence", build_market_persistence_block_cached)
+    persistence_block = await run_data_task(update, "state persistence", build_market_persistence_block_cached_async)
     if persistence_block is not None:
         text += persistence_block + "\n\n"
 
@@ -380,46 +400,48 @@ async def options(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     ts_from, ts_to = bounds
 
-    bybit_rows = await run_data_task(
-        update,
-        "options bybit",
-        load_bybit_market_state,
-        ts_from,
-        ts_to,
-    )
-    if bybit_rows is None:
-        return
-
-    okx_rows = await run_data_task(
-        update,
-        "options okx",
-        load_okx_market_state,
-        ts_from,
-        ts_to,
-    )
-    if okx_rows is None:
+    # The venues load together; one that misses the deadline renders as N/A.
+    venues = await run_data_task(update, "options venues", load_options_venues_async, ts_from, ts_to)
+    if venues is None:
         return
 
-    deribit_rows = await run_data_task(
-        update,
-        "options deribit",
-        load_deribit,
-        ts_from,
-        ts_to,
-    )
-    if deribit_rows is None:
+    missing = [venue for venue, rows in venues.items() if rows is None]
+    if len(missing) == len(venues):
+        logger.warning("options venues failed: none loaded in time")
+        await safe_reply(update, "Data source timeout. Try again in 1-2 minutes.")
         return
+    if missing:
+        logger.warning("options venues not loaded in time: %s", ", ".join(missing))
 
-    aggregated = aggregate_options_snapshot(bybit_rows, okx_rows, deribit_rows)
+    aggregated = aggregate_options_snapshot(venues["bybit"], venues["okx"], venues["deribit"])
     text = render_options_snapshot(window, aggregated)
     await safe_reply(update, text, reply_markup=section_nav_keyboard(context))
 
 
+async def scan(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    args = context.args
+    window = args[0] if args else "1h"
+    remember_last_action(context, "scan", [window])
+
+    bounds = parse_window_safe(window)
+    if bounds is None:
+        await safe_reply(update, "Usage: /scan [window], e.g. /scan 1h")
+        return
+    ts_from, ts_to = bounds
+
+    # Every ticker from one fetch, grouped by symbol.
+    ranked = await run_data_task(update, "scan", run_symbol_snapshots_async, ts_from, ts_to)
+    if ranked is None:
+        return
+
+    await safe_reply(update, render_scan(window, ranked), reply_markup=section_nav_keyboard(context))
+
+
 async def alerts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     remember_last_action(context, "alerts")
     # -------- ACTIVE STATES (1h) --------
     ts_from, ts_to = parse_window_safe("1h")
-    snap = await run_data_task(update, "alerts snapshot", run_snapshot, ts_from, ts_to)
+    snap = await run_data_task(update, "alerts snapshot", run_snapshot_async, ts_from, ts_to, layers=STATE_LAYERS)
     if snap is None:
         return
 
@@ -433,7 +455,7 @@ async def alerts(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # -------- RECENT DIVERGENCES (2h) --------
     ts_from, ts_to = parse_window_safe("2h")
-    div_rows = await run_data_task(update, "alerts divergence", load_divergence, ts_from, ts_to)
+    div_rows = await run_data_task(update, "alerts divergence", load_divergence_async, ts_from, ts_to)
     if div_rows is None:
         return
 
@@ -463,7 +485,7 @@ async def event(update: Update, context: ContextTypes.DEFAULT_TYPE):
     remember_last_action(context, "event")
     # 1. Берём последнюю дивергенцию
     ts_from, ts_to = parse_window_safe("4h")
-    rows = await run_data_task(update, "event divergence", load_divergence, ts_from, ts_to)
+    rows = await run_data_task(update, "event divergence", load_divergence_async, ts_from, ts_to)
     if rows is None:
         return
 
@@ -542,75 +564,70 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await safe_reply(update, "unknown ticker")
         return
 
-    windows = ["12h", "6h", "1h"]
-
-    ticker_snapshots = await collect_snapshots(update, "status ticker snapshots", windows, symbol=symbol)
-    if ticker_snapshots is None:
-        return
-
-    market_snapshots = await collect_snapshots(update, "status market snapshots", windows)
-    if market_snapshots is None:
-        return
-
-    ts_from, ts_to = parse_window_safe("10m")
-    risk_rows = await run_data_task(update, "status price (10m)", load_risk, ts_from, ts_to, symbol)
-    if risk_rows is None:
-        return
+    # The persistence block is cached; it loads while the status does.
+    persistence_task = asyncio.ensure_future(
+        run_data_task(update, "status persistence", build_market_persistence_block_cached_async)
+    )
 
-    if not risk_rows:
-        ts_from, ts_to = parse_window_safe("30m")
-        risk_rows = await run_data_task(update, "status price (1h fallback)", load_risk, ts_from, ts_to, symbol)
-        if risk_rows is None:
+    try:
+        # Ticker snapshots, the shared market context and the price load concurrently.
+        ts_to = as_of_ms()
+        price_from, price_to = parse_window_safe(STATUS_PRICE_WINDOW, ts_to)
+        loaded = await run_data_task(
+            update,
+            "status",
+            gather_all,
+            (
+                run_snapshots_async(
+                    [parse_window_safe(w, ts_to) for w in STATUS_WINDOWS], symbol=symbol, layers=STATUS_TICKER_LAYERS
+                ),
+                build_status_market_block_cached_async(),
+                load_risk_async(price_from, price_to, symbol, fields=STATUS_PRICE_FIELDS),
+            ),
+        )
+        if loaded is None:
             return
+        ticker_snaps, market_block, risk_rows = loaded
 
-    price_value = _extract_status_price(risk_rows)
-    symbol_html = html.escape(symbol)
-
-    text = f"=== STATUS: {symbol_html} ===\n\n"
-    text += f"Price: {_fmt_price(price_value)}\n\n"
+        price_value = _extract_status_price(risk_rows)
+        symbol_html = html.escape(symbol)
 
+        text = f"=== STATUS: {symbol_html} ===\n\n"
+        text += f"Price: {_fmt_price(price_value)}\n\n"
 
-    # ---------- TICKER (FUTURES) ----------
-    text += "<u>Perps</u>\n"
 
-    for w, snap in ticker_snapshots:
-        r = snap.risk or {}
-        d = getattr(snap, "divergence", {}) or {}
+        # ---------- TICKER (FUTURES) ----------
+        text += "<u>Perps</u>\n"
 
-        text += f"<b>[{html.escape(w)}]</b>\n"
-        text += (
-            f"Risk: {r.get('avg_risk', 0):.2f} | "
-            f"RiskAct: {r.get('risk_2plus_pct', 0):.1f}% | "
-            f"Divs: {d.get('count', 0)}\n"
-        )
-
-    # ---------- MARKET CONTEXT (BTC / ETH) ----------
-    text += "\n<u>Options (BTC / ETH)</u>\n"
+        for w, snap in zip(STATUS_WINDOWS, ticker_snaps):
+            r = snap.risk or {}
+            d = getattr(snap, "divergence", {}) or {}
 
-    for w, snap in market_snapshots:
-        o = snap.options or {}
-        v = snap.deribit or {}
+            text += f"<b>[{html.escape(w)}]</b>\n"
+            text += (
+                f"Risk: {r.get('avg_risk', 0):.2f} | "
+                f"RiskAct: {r.get('risk_2plus_pct', 0):.1f}% | "
+                f"Divs: {d.get('count', 0)}\n"
+            )
 
-        text += f"<b>[{html.escape(w)}]</b>\n"
-        text += (
-            f"Struct: {html.escape(str(o.get('dominant_phase')))} "
-            f"({o.get('dominant_phase_pct', 0):.1f}%)\n"
-            f"Vol: {html.escape(str(v.get('vbi_state')))} "
-            f"({_extract_iv_slope(v):+.2f})\n"
-        )
+        # ---------- MARKET CONTEXT (BTC / ETH) ----------
+        text += "\n" + market_block
 
-    persistence_block = await run_data_task(update, "status persistence", build_market_persistence_block_cached)
-    if persistence_block is not None:
-        persistence_block = html.escape(persistence_block)
-        persistence_block = persistence_block.replace("Market Persistence:", "<u>Market Persistence</u>:")
-        text += "\n" + persistence_block
+        persistence_block = await persistence_task
+        if persistence_block is not None:
+            persistence_block = html.escape(persistence_block)
+            persistence_block = persistence_block.replace("Market Persistence:", "<u>Market Persistence</u>:")
+            text += "\n" + persistence_block
+    finally:
+        # No-op once awaited; otherwise it stops loading for a failed status.
+        persistence_task.cancel()
 
     await safe_reply(update, text, reply_markup=section_nav_keyboard(context), parse_mode=ParseMode.HTML)
 
 
 async def dispersion(update: Update, context: ContextTypes.DEFAULT_TYPE):
     remember_last_action(context, "dispersion")
-    data = await run_data_task(update, "dispersion", compute_dispersion)
+    data = await run_data_task(update, "dispersion", compute_dispersion_async)
     if data is None:
         return
 
@@ -632,7 +649,7 @@ async def dispersion(update: Update, context: ContextTypes.DEFAULT_TYPE):
     ms = await run_data_task(
         update,
         "market structure",
-        compute_market_structure,
+        compute_market_structure_async,
         sorted(SUPPORTED_TICKERS),
         12,  # lookback hours for adaptive normalization
     )
@@ -653,13 +670,12 @@ _PERSISTENCE_WARNING_EMITTED = False
 
 async def divergence_watcher(app):
     global _PERSISTENCE_WARNING_EMITTED
-    from data.queries import load_divergence
 
     cycle_from, cycle_to = parse_window_safe("1h")
 
-    market_snapshot = await asyncio.to_thread(run_snapshot, cycle_from, cycle_to)
+    market_snapshot = await run_snapshot_async(cycle_from, cycle_to, layers=PERSISTED_LAYERS)
     try:
-        await asyncio.to_thread(persist_snapshot_state, market_snapshot, None)
+        await persist_snapshot_state_async(market_snapshot, None)
     except Exception as exc:
         if isinstance(exc, NameError) and "ts" in str(exc):
             if not _PERSISTENCE_WARNING_EMITTED:
@@ -671,12 +687,17 @@ async def divergence_watcher(app):
         else:
             logger.warning("Snapshot persistence failed in watcher: %s", exc)
 
+    try:
+        await asyncio.to_thread(maintain_rollups)
+    except Exception as exc:
+        logger.warning("Rollup backfill failed in watcher: %s", exc)
+
     ts_from, ts_to = parse_window_safe("2h")
-    rows = await asyncio.to_thread(load_divergence, ts_from, ts_to)
+    rows = await load_divergence_async(ts_from, ts_to)
 
         # ---------- FUTURES ANOMALIES (FROM LOGS.EVENT = anomaly) ----------
     a_from, a_to = parse_window_safe("30m")
-    anomaly_rows = await asyncio.to_thread(load_event, "anomaly", a_from, a_to)
+    anomaly_rows = await load_event_async("anomaly", a_from, a_to)
 
     for row in anomaly_rows:
         anomaly = build_anomaly_alert(row)
@@ -702,7 +723,7 @@ async def divergence_watcher(app):
         data = r.get("data", {})
         symbol = data.get("symbol")
         div_type = data.get("divergence_type")
-        event_ts = r.get("ts") or r.get("created_at")
+        event_ts = r.ts_ms
 
         if not symbol or not div_type:
             continue
@@ -837,6 +858,33 @@ async def help_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await options(update, context)
         return
 
+    # ---------- SCAN ----------
+    if data == "help:scan":
+        context.user_data["back_target"] = "help:scan"
+        keyboard = [
+            [
+                InlineKeyboardButton("1h", callback_data="scan:1h"),
+                InlineKeyboardButton("6h", callback_data="scan:6h"),
+                InlineKeyboardButton("12h", callback_data="scan:12h"),
+            ],
+            [
+                InlineKeyboardButton("⬅ Back", callback_data="main:menu"),
+                InlineKeyboardButton("Menu", callback_data="main:menu"),
+            ],
+        ]
+        await query.edit_message_text(
+            "Scan windows:",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+        )
+        return
+
+    if data.startswith("scan:"):
+        await lock_menu(query, "⏳ Loading scan…")
+        window = data.split(":", 1)[1]
+        context.args = [window]
+        await scan(update, context)
+        return
+
     # ---------- STATUS ----------
     if data == "help:status":
         context.user_data["back_target"] = "help:status"
@@ -907,6 +955,7 @@ def _build_application():
     app.add_handler(CommandHandler("alerts", alerts))
     app.add_handler(CommandHandler("event", event))
     app.add_handler(CommandHandler("status", status))
+    app.add_handler(CommandHandler("scan", scan))
     app.add_handler(CommandHandler("context", info_cmd))
     app.add_handler(CommandHandler("dispersion", dispersion))
     app.add_handler(MessageHandler(filters.ALL, ensure_started))
@@ -946,6 +995,11 @@ async def _shutdown_application(app, was_running: bool) -> None:
     except Exception:
         logger.exception("Failed to shutdown Telegram app cleanly")
 
+    try:
+        await close_http()
+    except Exception:
+        logger.exception("Failed to close Supabase HTTP client cleanly")
+
 
 
 def run_bot(
@@ -1,6 +1,6 @@
-from datetime import datetime, timezone
 import re
 
+from data.records import AnomalyRow, decode_row, parse_iso_ms
 from tg.bot_config import ALERT_COOLDOWN, ANOMALY_ALERT_COOLDOWN
 
 _LAST_ALERTS = {}  # (symbol, div_type) -> event_ts
@@ -12,14 +12,7 @@ def normalize_event_ts_ms(value):
         if value.isdigit():
             value = int(value)
         else:
-            try:
-                dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
-            except ValueError:
-                return None
-
-            if dt.tzinfo is None:
-                dt = dt.replace(tzinfo=timezone.utc)
-            value = int(dt.timestamp() * 1000)
+            value = parse_iso_ms(value)
 
     if isinstance(value, (int, float)):
         value = int(value)
@@ -64,14 +57,6 @@ def can_send_anomaly(anomaly_key, event_ts):
     return True
 
 
-def _pick_first(mapping, *keys):
-    for key in keys:
-        value = mapping.get(key)
-        if value not in (None, ""):
-            return value
-    return None
-
-
 def _normalize_text(value):
     if value in (None, ""):
         return ""
@@ -110,32 +95,19 @@ def _strip_duplicate_message_lines(message, title, summary_line):
 
 
 def build_anomaly_alert(row):
-    data = row.get("data", {}) or {}
-    if not isinstance(data, dict):
-        data = {}
-
-    event_ts = (
-        row.get("ts")
-        or row.get("created_at")
-        or _pick_first(data, "ts", "timestamp", "time", "created_at", "ts_unix_ms")
-    )
-    event_ts = normalize_event_ts_ms(event_ts)
+    # Loader rows are decoded already; anything else is decoded here.
+    if not isinstance(row, AnomalyRow):
+        row = decode_row(row, event="anomaly")
+
+    event_ts = row.ts_ms
     if event_ts is None:
         return None
 
-    symbol = _pick_first(data, "symbol", "ticker", "asset", "coin", "instrument")
-    anomaly_type = _pick_first(
-        data,
-        "anomaly_type",
-        "type",
-        "kind",
-        "name",
-        "signal_type",
-        "category",
-    )
-    anomaly_id = _pick_first(data, "id", "event_id", "anomaly_id", "signal_id")
-    message = _pick_first(data, "message", "text", "description", "summary")
-    severity = _pick_first(data, "severity", "level", "priority")
+    symbol = row.symbol
+    anomaly_type = row.anomaly_type
+    anomaly_id = row.anomaly_id
+    message = row.message
+    severity = row.severity
 
     key_parts = [str(v).strip() for v in (symbol, anomaly_type, anomaly_id) if v not in (None, "")]
     anomaly_key = ":".join(key_parts) if key_parts else f"anomaly:{event_ts}"
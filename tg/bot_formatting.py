@@ -1,8 +1,15 @@
+import asyncio
+import html
 import time
 from datetime import datetime, timezone
 
-from persistence.state_history import get_state_persistence_hours
-from time_utils import parse_window
+from aggregation.engine import Latest, Max, Mean, Min, Mode, collect
+from config import OPTIONS_DEADLINE_SECONDS
+from data.async_client import gather_all
+from data.queries import load_bybit_market_state_async, load_deribit_async, load_okx_market_state_async
+from persistence.state_history import get_state_persistence_hours, get_state_persistence_hours_async
+from main import run_snapshots_async
+from time_utils import as_of_ms, parse_window
 from tg.bot_config import MAX_TELEGRAM_TEXT_LEN
 
 _PERSISTENCE_CACHE_TTL_SECONDS = 45
@@ -11,6 +18,13 @@ _PERSISTENCE_CACHE = {
     "at": 0.0,
 }
 
+# The /status market context is the same for every ticker: one block per interval.
+_STATUS_MARKET_CACHE_TTL_SECONDS = 30
+_STATUS_MARKET_CACHE = {
+    "value": None,
+    "at": 0.0,
+}
+
 
 def _extract_iv_slope(deribit: dict) -> float:
     for key in ("iv_slope", "iv_slope_avg"):
@@ -45,6 +59,10 @@ def _format_last_snapshot_utc(ts_value) -> str:
     return dt.strftime("%H:%M UTC")
 
 
+# Snapshot layers snapshot_to_text reads.
+SNAPSHOT_TEXT_LAYERS = ("risk", "options", "deribit", "divergence")
+
+
 def snapshot_to_text(snapshot):
     r = snapshot.risk or {}
     o = snapshot.options or {}
@@ -106,12 +124,27 @@ def _format_named_state_persistence(label: str, state: tuple[str, int] | None) -
     return f"{label}: {value} for {_format_hours(hours)}"
 
 
+_PERSISTENCE_STATES = (
+    ("risk", "avg_risk"),
+    ("risk", "risk_2plus_pct"),
+    ("structure", "dominant_phase"),
+    ("volatility", "vbi_state"),
+)
+
+
 def build_market_persistence_block() -> str:
-    avg_risk_state = get_state_persistence_hours("risk", "avg_risk", symbol=None)
-    riskact_state = get_state_persistence_hours("risk", "risk_2plus_pct", symbol=None)
-    struct_state = get_state_persistence_hours("structure", "dominant_phase", symbol=None)
-    vol_state = get_state_persistence_hours("volatility", "vbi_state", symbol=None)
+    states = [get_state_persistence_hours(layer, key, symbol=None) for layer, key in _PERSISTENCE_STATES]
+    return _format_market_persistence_block(*states)
 
+
+async def build_market_persistence_block_async() -> str:
+    states = await gather_all(
+        get_state_persistence_hours_async(layer, key, symbol=None) for layer, key in _PERSISTENCE_STATES
+    )
+    return _format_market_persistence_block(*states)
+
+
+def _format_market_persistence_block(avg_risk_state, riskact_state, struct_state, vol_state) -> str:
     lines = ["Market Persistence:"]
     lines.append(_format_risk_band_persistence("Risk", "avg_risk", avg_risk_state))
     lines.append(_format_risk_band_persistence("RiskAct", "risk_2plus_pct", riskact_state))
@@ -134,9 +167,23 @@ def build_market_persistence_block_cached() -> str:
     return fresh_value
 
 
-def parse_window_safe(window: str) -> tuple[int, int] | None:
+async def build_market_persistence_block_cached_async() -> str:
+    now = time.monotonic()
+    cached_at = _PERSISTENCE_CACHE["at"]
+    cached_value = _PERSISTENCE_CACHE["value"]
+
+    if cached_value and (now - cached_at) < _PERSISTENCE_CACHE_TTL_SECONDS:
+        return cached_value
+
+    fresh_value = await build_market_persistence_block_async()
+    _PERSISTENCE_CACHE["value"] = fresh_value
+    _PERSISTENCE_CACHE["at"] = now
+    return fresh_value
+
+
+def parse_window_safe(window: str, ts_to: int | None = None) -> tuple[int, int] | None:
     try:
-        return parse_window(window)
+        return parse_window(window, ts_to)
     except ValueError:
         return None
 
@@ -167,62 +214,81 @@ def split_text_chunks(text: str, chunk_size: int = MAX_TELEGRAM_TEXT_LEN):
     return chunks or [""]
 
 
-def _avg(rows: list[dict], field: str) -> float | None:
-    values = [r.get("data", {}).get(field) for r in rows]
-    numeric = [float(v) for v in values if isinstance(v, (int, float))]
-    if not numeric:
-        return None
-    return sum(numeric) / len(numeric)
-
-
-def _min(rows: list[dict], field: str) -> float | None:
-    values = [r.get("data", {}).get(field) for r in rows]
-    numeric = [float(v) for v in values if isinstance(v, (int, float))]
-    if not numeric:
-        return None
-    return min(numeric)
-
-
-def _max(rows: list[dict], field: str) -> float | None:
-    values = [r.get("data", {}).get(field) for r in rows]
-    numeric = [float(v) for v in values if isinstance(v, (int, float))]
-    if not numeric:
-        return None
-    return max(numeric)
+STATUS_PRICE_FIELDS = (
+    "price",
+    "last_price",
+    "mark_price",
+    "index_price",
+    "close",
+    "mid_price",
+)
+
+# Fields aggregate_options_snapshot reads on top of the loaders' defaults.
+OPTIONS_OKX_FIELDS = (
+    "okx_olsi_avg",
+    "okx_olsi_slope",
+    "divergence_type",
+    "divergence_diff",
+    "divergence_strength",
+    "divergence_strength_label",
+)
+OPTIONS_DERIBIT_FIELDS = ("curvature", "skew")
+
+# Snapshot layers of the /status ticker rows and market context rows.
+STATUS_TICKER_LAYERS = ("risk", "divergence")
+STATUS_MARKET_LAYERS = ("options", "deribit")
+STATUS_WINDOWS = ("12h", "6h", "1h")
+
+# The status price is read from the latest risk row of this window.
+STATUS_PRICE_WINDOW = "30m"
+
+
+def _format_status_market_block(snapshots) -> str:
+    text = "<u>Options (BTC / ETH)</u>\n"
+    for w, snap in snapshots:
+        o = snap.options or {}
+        v = snap.deribit or {}
+
+        text += f"<b>[{html.escape(w)}]</b>\n"
+        text += (
+            f"Struct: {html.escape(str(o.get('dominant_phase')))} "
+            f"({o.get('dominant_phase_pct', 0):.1f}%)\n"
+            f"Vol: {html.escape(str(v.get('vbi_state')))} "
+            f"({_extract_iv_slope(v):+.2f})\n"
+        )
+    return text
+
+
+async def build_status_market_block_async() -> str:
+    ts_to = as_of_ms()
+    snaps = await run_snapshots_async(
+        [parse_window(w, ts_to) for w in STATUS_WINDOWS], layers=STATUS_MARKET_LAYERS
+    )
+    return _format_status_market_block(zip(STATUS_WINDOWS, snaps))
 
 
-def _mode(rows: list[dict], field: str):
-    values = [r.get("data", {}).get(field) for r in rows]
-    values = [v for v in values if v not in (None, "")]
-    if not values:
-        return None
-    return max(set(values), key=values.count)
+async def build_status_market_block_cached_async() -> str:
+    now = time.monotonic()
+    cached_at = _STATUS_MARKET_CACHE["at"]
+    cached_value = _STATUS_MARKET_CACHE["value"]
 
+    if cached_value and (now - cached_at) < _STATUS_MARKET_CACHE_TTL_SECONDS:
+        return cached_value
 
-def _latest(rows: list[dict], field: str):
-    if not rows:
-        return None
-    latest_row = max(rows, key=lambda r: r.get("ts", 0))
-    return latest_row.get("data", {}).get(field)
+    fresh_value = await build_status_market_block_async()
+    _STATUS_MARKET_CACHE["value"] = fresh_value
+    _STATUS_MARKET_CACHE["at"] = now
+    return fresh_value
 
 
 def _extract_status_price(rows: list[dict]) -> float | None:
-    price_fields = (
-        "price",
-        "last_price",
-        "mark_price",
-        "index_price",
-        "close",
-        "mid_price",
-    )
-
     if not rows:
         return None
 
     latest_row = max(rows, key=lambda r: r.get("ts", 0))
     data = latest_row.get("data", {})
 
-    for field in price_fields:
+    for field in STATUS_PRICE_FIELDS:
         value = data.get(field)
         if isinstance(value, (int, float)):
             return float(value)
@@ -256,33 +322,67 @@ def _derive_term_structure(iv_slope, curvature) -> str:
     return f"iv_slope={iv_slope:+.3f}, curvature={curvature:+.3f}"
 
 
+OPTIONS_BYBIT_METRICS = {
+    "regime": Mode("regime"),
+    "mci": Mean("mci"),
+    "mci_slope": Mean("mci_slope"),
+    "mci_phase": Mode("mci_phase"),
+    "confidence": Latest("confidence"),
+}
+OPTIONS_OKX_METRICS = {
+    "okx_olsi_latest": Latest("okx_olsi_avg"),
+    "okx_olsi_avg": Mean("okx_olsi_avg"),
+    "okx_olsi_min": Min("okx_olsi_avg"),
+    "okx_olsi_max": Max("okx_olsi_avg"),
+    "okx_olsi_slope": Latest("okx_olsi_slope"),
+    "okx_liquidity_regime": Mode("okx_liquidity_regime"),
+    "divergence": Mode("divergence_type"),
+    "divergence_diff": Mean("divergence_diff"),
+    "divergence_strength": Mean("divergence_strength"),
+    "divergence_strength_label": Mode("divergence_strength_label"),
+}
+OPTIONS_DERIBIT_METRICS = {
+    "vbi_state": Mode("vbi_state"),
+    "iv_slope": Latest("iv_slope"),
+    "curvature": Mean("curvature"),
+    "skew": Latest("skew"),
+}
+
+
+async def load_options_venues_async(ts_from: int, ts_to: int, timeout: float = OPTIONS_DEADLINE_SECONDS) -> dict:
+    """
+    {venue: rows} of the /options venues, loaded concurrently under one
+    deadline. A venue not loaded in time, or failing with a data source
+    error (RuntimeError), maps to None so the others still render.
+    """
+    tasks = {
+        "bybit": asyncio.ensure_future(load_bybit_market_state_async(ts_from, ts_to)),
+        "okx": asyncio.ensure_future(load_okx_market_state_async(ts_from, ts_to, fields=OPTIONS_OKX_FIELDS)),
+        "deribit": asyncio.ensure_future(load_deribit_async(ts_from, ts_to, fields=OPTIONS_DERIBIT_FIELDS)),
+    }
+    try:
+        done, _ = await asyncio.wait(tasks.values(), timeout=timeout if timeout > 0 else None)
+    finally:
+        # Venues still loading past the deadline are dropped.
+        for task in tasks.values():
+            task.cancel()
+
+    venues = {}
+    for venue, task in tasks.items():
+        if task not in done or isinstance(task.exception(), RuntimeError):
+            venues[venue] = None
+        else:
+            venues[venue] = task.result()
+    return venues
+
+
 def aggregate_options_snapshot(bybit_rows, okx_rows, deribit_rows) -> dict:
+    # One pass per venue over its rows for all of the venue's fields; a
+    # venue without rows (None: not loaded) renders as N/A.
     return {
-        "bybit": {
-            "regime": _mode(bybit_rows, "regime"),
-            "mci": _avg(bybit_rows, "mci"),
-            "mci_slope": _avg(bybit_rows, "mci_slope"),
-            "mci_phase": _mode(bybit_rows, "mci_phase"),
-            "confidence": _latest(bybit_rows, "confidence"),
-        },
-        "okx": {
-            "okx_olsi_latest": _latest(okx_rows, "okx_olsi_avg"),
-            "okx_olsi_avg": _avg(okx_rows, "okx_olsi_avg"),
-            "okx_olsi_min": _min(okx_rows, "okx_olsi_avg"),
-            "okx_olsi_max": _max(okx_rows, "okx_olsi_avg"),
-            "okx_olsi_slope": _latest(okx_rows, "okx_olsi_slope"),
-            "okx_liquidity_regime": _mode(okx_rows, "okx_liquidity_regime"),
-            "divergence": _mode(okx_rows, "divergence_type"),
-            "divergence_diff": _avg(okx_rows, "divergence_diff"),
-            "divergence_strength": _avg(okx_rows, "divergence_strength"),
-            "divergence_strength_label": _mode(okx_rows, "divergence_strength_label"),
-        },
-        "deribit": {
-            "vbi_state": _mode(deribit_rows, "vbi_state"),
-            "iv_slope": _latest(deribit_rows, "iv_slope"),
-            "curvature": _avg(deribit_rows, "curvature"),
-            "skew": _latest(deribit_rows, "skew"),
-        },
+        "bybit": collect(OPTIONS_BYBIT_METRICS, bybit_rows)[0] if bybit_rows is not None else {},
+        "okx": collect(OPTIONS_OKX_METRICS, okx_rows)[0] if okx_rows is not None else {},
+        "deribit": collect(OPTIONS_DERIBIT_METRICS, deribit_rows)[0] if deribit_rows is not None else {},
     }
 
 
@@ -362,3 +462,27 @@ def render_options_snapshot(window: str, payload: dict) -> str:
         f"• VBI: {_fmt_text(deribit.get('vbi_state'))}\n"
         f"• Term structure: {term_structure}"
     )
+
+
+# Tickers /scan lists; the others are only counted.
+SCAN_TOP_TICKERS = 20
+
+
+def render_scan(window: str, ranked: list, limit: int = SCAN_TOP_TICKERS) -> str:
+    # ranked: (symbol, snapshot) pairs from run_symbol_snapshots, highest risk first
+    if not ranked:
+        return f"=== SCAN ({window}) ===\n\nNo ticker data in this window."
+
+    lines = [f"=== SCAN ({window}) ===", f"Top {min(limit, len(ranked))} of {len(ranked)} tickers by Risk / RiskAct", ""]
+    for rank, (symbol, snap) in enumerate(ranked[:limit], start=1):
+        r = snap.risk or {}
+        d = snap.divergence or {}
+        m = snap.meta or {}
+        lines.append(
+            f"{rank}. {symbol} — "
+            f"Risk: {r.get('avg_risk', 0):.2f} | "
+            f"RiskAct: {r.get('risk_2plus_pct', 0):.1f}% | "
+            f"Divs: {d.get('count', 0)} | "
+            f"{_fmt_text(m.get('market_regime'))}"
+        )
+    return "\n".join(lines)
@@ -18,6 +18,7 @@ def main_menu_keyboard():
         [InlineKeyboardButton("📊 Stats", callback_data="help:stats")],
         [InlineKeyboardButton("🧠 Status (ticker)", callback_data="help:status")],
         [InlineKeyboardButton("🧩 Options", callback_data="help:options")],
+        [InlineKeyboardButton("🔎 Scan (all tickers)", callback_data="help:scan")],
         [InlineKeyboardButton("⚠️ Alerts", callback_data="run:alerts")],
         [InlineKeyboardButton("📍 Event", callback_data="run:event")],
         [InlineKeyboardButton("📈 Dispersion", callback_data="run:dispersion")],
@@ -1,12 +1,26 @@
 import time
 from datetime import datetime, timezone
 
+from config import AS_OF_GRID_SECONDS
+
 def now_ms() -> int:
     return int(time.time() * 1000)
 
-def parse_window(arg: str) -> tuple[int, int]:
+def as_of_ms(grid_ms: int | None = None) -> int:
+    """
+    Current time snapped down to the as-of grid (AS_OF_GRID_SECONDS unless
+    `grid_ms` is given): windows ending there are the same for every
+    request within one grid step, so their results can be shared.
+    """
+    if grid_ms is None:
+        grid_ms = int(AS_OF_GRID_SECONDS * 1000)
+    now = now_ms()
+    return now - now % grid_ms if grid_ms > 0 else now
+
+def parse_window(arg: str, ts_to: int | None = None) -> tuple[int, int]:
     """
-    '6h', '90m', '1d'
+    '6h', '90m', '1d'; ending at as_of_ms() unless `ts_to` is given
+    (windows parsed with one ts_to are nested).
     """
     if not isinstance(arg, str) or len(arg) < 2:
         raise ValueError("Invalid window format")
@@ -29,7 +43,8 @@ def parse_window(arg: str) -> tuple[int, int]:
     if n <= 0:
         raise ValueError("Invalid window format")
 
-    ts_to = now_ms()
+    if ts_to is None:
+        ts_to = as_of_ms()
     ts_from = ts_to - n * mult[unit]
 
     return ts_from, ts_to
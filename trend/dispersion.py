@@ -1,7 +1,8 @@
 from aggregation.risk import aggregate_risk
 from aggregation.options import aggregate_options
 from aggregation.deribit import aggregate_deribit
-from data.queries import load_deribit, load_bybit_market_state, load_okx_market_state, load_risk
+from data.async_client import gather_all
+from data.queries import load_many, load_many_async
 from time_utils import parse_window
 
 
@@ -29,19 +30,32 @@ def categorical_dispersion(values):
     return "HIGH"
 
 
+DISPERSION_WINDOWS = ["12h", "6h", "1h"]
+DISPERSION_EVENTS = ("risk_eval", "okx_market_state", "deribit_vbi_snapshot")
+
+
 def compute_dispersion():
-    windows = ["12h", "6h", "1h"]
+    rows_by_window = {}
+    for w in DISPERSION_WINDOWS:
+        rows_by_window[w] = load_many(DISPERSION_EVENTS, *parse_window(w))
+
+    return _dispersion_from_rows(rows_by_window)
+
 
+async def compute_dispersion_async():
+    loaded = await gather_all(load_many_async(DISPERSION_EVENTS, *parse_window(w)) for w in DISPERSION_WINDOWS)
+    return _dispersion_from_rows(dict(zip(DISPERSION_WINDOWS, loaded)))
+
+
+def _dispersion_from_rows(rows_by_window):
     risk_vals = {}
     struct_vals = {}
     vol_vals = {}
 
-    for w in windows:
-        ts_from, ts_to = parse_window(w)
-
-        risk = aggregate_risk(load_risk(ts_from, ts_to))
-        options = aggregate_options(load_okx_market_state(ts_from, ts_to))
-        deribit = aggregate_deribit(load_deribit(ts_from, ts_to))
+    for w, rows in rows_by_window.items():
+        risk = aggregate_risk(rows["risk_eval"])
+        options = aggregate_options(rows["okx_market_state"])
+        deribit = aggregate_deribit(rows["deribit_vbi_snapshot"])
 
         if risk:
             risk_vals[w] = risk.get("avg_risk")
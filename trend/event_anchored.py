@@ -1,5 +1,5 @@
 from time_utils import parse_window
-from main import run_snapshot
+from main import run_snapshots
 
 
 def event_anchored_analysis(event_ts_ms):
@@ -17,9 +17,12 @@ def event_anchored_analysis(event_ts_ms):
     after_from = event_ts_ms
     after_to = event_ts_ms + 1 * 60 * 60 * 1000
 
-    snap_before = run_snapshot(before_from, before_to)
-    snap_during = run_snapshot(during_from, during_to)
-    snap_after = run_snapshot(after_from, after_to)
+    # The windows overlap: their rows are fetched once. Only the layers
+    # /event shows are loaded.
+    snap_before, snap_during, snap_after = run_snapshots(
+        [(before_from, before_to), (during_from, during_to), (after_from, after_to)],
+        layers=("risk", "options", "deribit", "divergence"),
+    )
 
     return {
         "before": snap_before,
@@ -1,10 +1,22 @@
 # trend/market_structure.py
 import math
-from datetime import datetime, timezone
 from typing import Dict, List, Optional, Tuple
 
 from time_utils import parse_window
-from data.queries import load_risk, load_bybit_market_state, load_deribit
+from data.async_client import gather_all
+from data.queries import load_many, load_many_async, load_risk, load_risk_async
+from data.records import normalize_symbol
+from trend import market_structure_np
+
+
+# The row loops below have vectorized versions in market_structure_np, used
+# when numpy is importable; these pure-Python ones stay the reference.
+USE_NUMPY = market_structure_np.np is not None
+
+
+# Keys read below on top of the loaders' default projections.
+RISK_FIELDS = ("ticker", "avg_risk", "risk_score")
+DERIBIT_FIELDS = ("iv_slope_avg",)
 
 
 # ----------------- small math helpers -----------------
@@ -12,17 +24,6 @@ from data.queries import load_risk, load_bybit_market_state, load_deribit
 def _is_num(x) -> bool:
     return isinstance(x, (int, float)) and not (isinstance(x, float) and math.isnan(x))
 
-def _to_float(x) -> Optional[float]:
-    if _is_num(x):
-        return float(x)
-    if isinstance(x, str):
-        try:
-            v = float(x.strip())
-        except ValueError:
-            return None
-        return None if math.isnan(v) else v
-    return None
-
 def _stdev(xs: List[float]) -> Optional[float]:
     xs = [float(x) for x in xs if _is_num(x)]
     if len(xs) < 2:
@@ -75,92 +76,50 @@ def _bucket_hour(ts: int) -> int:
     return ts - (ts % hour_ms)
 
 
-def _ts_to_ms(ts) -> Optional[int]:
-    v = _to_float(ts)
-    if v is not None:
-        value = int(v)
-        return value * 1000 if value < 10_000_000_000 else value
-
-    if isinstance(ts, str):
-        try:
-            dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
-            if dt.tzinfo is None:
-                dt = dt.replace(tzinfo=timezone.utc)
-            return int(dt.timestamp() * 1000)
-        except ValueError:
-            return None
-
-    return None
-
-
 def _normalize_symbol(symbol: Optional[str]) -> Optional[str]:
     if not isinstance(symbol, str) or not symbol:
         return None
+    return normalize_symbol(symbol)
 
-    value = symbol.upper()
-
-    for sep in ("-", "_", "/", ":"):
-        value = value.split(sep, 1)[0]
-
-    for quote in ("USDT", "USD", "PERP"):
-        if value.endswith(quote):
-            value = value[: -len(quote)]
-            break
-
-    return value
+# Rows arrive decoded (data.records): r.ts_ms, and per event
+#   risk_eval            -> r.asset (normalized symbol/ticker), r.risk
+#   bybit_market_state   -> r.mci, r.mci_slope
+#   deribit_vbi_snapshot -> r.iv_slope
+# so the loops below do no parsing.
 
-def _extract_symbol(row: dict) -> Optional[str]:
-    data = row.get("data", {}) if isinstance(row.get("data"), dict) else {}
-    return row.get("symbol") or data.get("symbol") or row.get("ticker") or data.get("ticker")
 
-def _extract_risk_value(row: dict) -> Optional[float]:
-    # risk_eval may contain either aggregated avg_risk or per-row risk values.
-    data = row.get("data", {}) if isinstance(row.get("data"), dict) else {}
-    for key in ("avg_risk", "risk", "risk_score"):
-        value = _to_float(data.get(key))
-        if value is not None:
-            return value
-    return None
-
-def _extract_mci(row: dict) -> Optional[float]:
-    v = row.get("data", {}).get("mci")
-    return _to_float(v)
-
-def _extract_mci_slope(row: dict) -> Optional[float]:
-    v = row.get("data", {}).get("mci_slope")
-    return _to_float(v)
-
-def _extract_iv_slope(row: dict) -> Optional[float]:
-    # your bot already reads "iv_slope" and sometimes "iv_slope_avg"
-    data = row.get("data", {})
-    for k in ("iv_slope", "iv_slope_avg"):
-        v = _to_float(data.get(k))
-        if v is not None:
-            return v
-    return None
-
-
-def _latest_per_symbol(rows: List[dict], value_fn) -> Dict[str, float]:
+def _latest_risk_per_symbol(rows: List[dict]) -> Dict[str, float]:
     """
-    Returns latest value per symbol from rows (ts assumed seconds).
+    Returns latest risk value per symbol from decoded risk_eval rows.
     """
     best: Dict[str, Tuple[int, float]] = {}
     for r in rows:
-        sym = _normalize_symbol(_extract_symbol(r))
-        if not sym:
-            continue
-        ts = _ts_to_ms(r.get("ts"))
-        if ts is None:
-            continue
-        val = value_fn(r)
-        if val is None:
+        sym = r.asset
+        if not sym or r.risk is None:
             continue
         prev = best.get(sym)
-        if prev is None or ts > prev[0]:
-            best[sym] = (ts, float(val))
+        if prev is None or r.ts_ms > prev[0]:
+            best[sym] = (r.ts_ms, r.risk)
     return {k: v for k, (_, v) in best.items()}
 
 
+def _earliest_risk_per_symbol(rows: List[dict], supported_norm: List[str]) -> Dict[str, float]:
+    # approximate earliest by taking first-seen per symbol (not perfect but stable)
+    earliest: Dict[str, Tuple[int, float]] = {}
+    for r in rows:
+        sym = r.asset
+        if sym not in supported_norm:
+            continue
+        v = r.risk
+        if v is None:
+            continue
+        ts = r.ts_ms
+        prev = earliest.get(sym)
+        if prev is None or ts < prev[0]:
+            earliest[sym] = (ts, v)
+    return {k: v for k, (_, v) in earliest.items()}
+
+
 def _hourly_dispersion_from_risk_rows(
     risk_rows_12h: List[dict],
     supported_tickers: List[str],
@@ -176,20 +135,18 @@ def _hourly_dispersion_from_risk_rows(
     supported_norm.discard(None)
 
     for r in risk_rows_12h:
-        sym = _normalize_symbol(_extract_symbol(r))
+        sym = r.asset
         if sym not in supported_norm:
             continue
-        ts = _ts_to_ms(r.get("ts"))
-        if ts is None:
-            continue
-        v = _extract_risk_value(r)
+        v = r.risk
         if v is None:
             continue
+        ts = r.ts_ms
         b = _bucket_hour(ts)
         sym_map = buckets.setdefault(b, {})
         prev = sym_map.get(sym)
         if prev is None or ts > prev[0]:
-            sym_map[sym] = (ts, float(v))
+            sym_map[sym] = (ts, v)
 
     # take last max_points buckets (most recent)
         # take last max_points buckets (most recent)
@@ -234,44 +191,36 @@ def _hourly_impulses_12h(
     # --- futures: bucket -> symbol -> latest (ts_ms, value)
     fut_buckets: Dict[int, Dict[str, Tuple[int, float]]] = {}
     for r in (risk_rows_12h or []):
-        sym = _normalize_symbol(_extract_symbol(r))
+        sym = r.asset
         if not sym or sym not in supported_set:
             continue
-        ts_ms = _ts_to_ms(r.get("ts"))
-        if ts_ms is None:
-            continue
-        v = _extract_risk_value(r)
+        v = r.risk
         if v is None:
             continue
+        ts_ms = r.ts_ms
         b = _bucket_hour(ts_ms)
         m = fut_buckets.setdefault(b, {})
         prev = m.get(sym)
         if prev is None or ts_ms > prev[0]:
-            m[sym] = (ts_ms, float(v))
+            m[sym] = (ts_ms, v)
 
     # --- options: bucket -> list abs(mci_slope)
     opt_buckets: Dict[int, List[float]] = {}
     for r in (bybit_rows_12h or []):
-        ts_ms = _ts_to_ms(r.get("ts"))
-        if ts_ms is None:
-            continue
-        v = _extract_mci_slope(r)
+        v = r.mci_slope
         if v is None:
             continue
-        b = _bucket_hour(ts_ms)
-        opt_buckets.setdefault(b, []).append(abs(float(v)))
+        b = _bucket_hour(r.ts_ms)
+        opt_buckets.setdefault(b, []).append(abs(v))
 
     # --- vol: bucket -> list abs(iv_slope)
     vol_buckets: Dict[int, List[float]] = {}
     for r in (deribit_rows_12h or []):
-        ts_ms = _ts_to_ms(r.get("ts"))
-        if ts_ms is None:
-            continue
-        v = _extract_iv_slope(r)
+        v = r.iv_slope
         if v is None:
             continue
-        b = _bucket_hour(ts_ms)
-        vol_buckets.setdefault(b, []).append(abs(float(v)))
+        b = _bucket_hour(r.ts_ms)
+        vol_buckets.setdefault(b, []).append(abs(v))
 
     all_buckets = sorted(set(fut_buckets.keys()) | set(opt_buckets.keys()) | set(vol_buckets.keys()))[-max_points:]
 
@@ -307,8 +256,59 @@ def _hourly_impulses_12h(
         "vol_impulses": vol_abs_series,
     }
 
+
+def _risk_series(
+    risk_rows_30m: List[dict],
+    risk_rows_1h: List[dict],
+    risk_rows_12h: List[dict],
+    bybit_rows_12h: List[dict],
+    deribit_rows_12h: List[dict],
+    supported_tickers: List[str],
+    supported_norm: List[str],
+) -> dict:
+    """Per-symbol latest / earliest risk and the 12h hourly reference series."""
+    if USE_NUMPY:
+        np_ms = market_structure_np
+        # each risk window is converted to arrays once
+        risk_1h = np_ms.RiskArrays.from_rows(risk_rows_1h)
+        risk_12h = np_ms.RiskArrays.from_rows(risk_rows_12h)
+        return {
+            "latest_now": np_ms.latest_per_symbol(np_ms.RiskArrays.from_rows(risk_rows_30m)),
+            "disp_samples": np_ms.hourly_dispersion(risk_12h, supported_norm, max_points=12),
+            "latest_1h": np_ms.latest_per_symbol(risk_1h),
+            "earliest_1h": np_ms.earliest_per_symbol(risk_1h.supported(supported_norm)),
+            "ref": np_ms.hourly_impulses(risk_12h, bybit_rows_12h, deribit_rows_12h, supported_norm, max_points=12),
+        }
+
+    return {
+        "latest_now": _latest_risk_per_symbol(risk_rows_30m),
+        "disp_samples": _hourly_dispersion_from_risk_rows(risk_rows_12h, supported_tickers, max_points=12),
+        "latest_1h": _latest_risk_per_symbol(risk_rows_1h),
+        "earliest_1h": _earliest_risk_per_symbol(risk_rows_1h, supported_norm),
+        "ref": _hourly_impulses_12h(
+            risk_rows_12h,
+            bybit_rows_12h,
+            deribit_rows_12h,
+            supported_norm=supported_norm,
+            max_points=12,
+        ),
+    }
+
+
 # ----------------- main compute -----------------
 
+# risk / bybit / deribit of one window come from a single request chain
+LAYER_EVENTS = ("risk_eval", "bybit_market_state", "deribit_vbi_snapshot")
+LAYER_FIELDS = {"risk_eval": RISK_FIELDS, "deribit_vbi_snapshot": DERIBIT_FIELDS}
+
+
+def _structure_windows(short_lookback_hours: int):
+    ts_from_30m, ts_to_now = parse_window("30m")
+    ts_from_1h, _ = parse_window("1h")
+    ts_from_12h, _ = parse_window(f"{short_lookback_hours}h")
+    return ts_from_30m, ts_from_1h, ts_from_12h, ts_to_now
+
+
 def compute_market_structure(
     supported_tickers: List[str],
     short_lookback_hours: int = 12,
@@ -320,29 +320,63 @@ def compute_market_structure(
     - Cross-layer driver (live)
     - Diagnostic regime tag
     """
-    # windows
-    ts_from_30m, ts_to_now = parse_window("30m")
-    ts_from_1h, _ = parse_window("1h")
-    ts_from_12h, _ = parse_window(f"{short_lookback_hours}h")
+    ts_from_30m, ts_from_1h, ts_from_12h, ts_to_now = _structure_windows(short_lookback_hours)
 
     # --- load rows (bulk) ---
     # IMPORTANT: we assume load_risk supports symbol=None to return multi-symbol rows.
     # If your load_risk requires a symbol, we can adjust later (but try bulk first).
-    risk_rows_30m = load_risk(ts_from_30m, ts_to_now, None)
-    risk_rows_1h = load_risk(ts_from_1h, ts_to_now, None)
-    risk_rows_12h = load_risk(ts_from_12h, ts_to_now, None)
+    risk_rows_30m = load_risk(ts_from_30m, ts_to_now, None, fields=RISK_FIELDS)
+    rows_1h = load_many(LAYER_EVENTS, ts_from_1h, ts_to_now, fields=LAYER_FIELDS)
+    rows_12h = load_many(LAYER_EVENTS, ts_from_12h, ts_to_now, fields=LAYER_FIELDS)
+
+    return _market_structure_from_rows(supported_tickers, risk_rows_30m, rows_1h, rows_12h)
 
-    bybit_rows_1h = load_bybit_market_state(ts_from_1h, ts_to_now)
-    bybit_rows_12h = load_bybit_market_state(ts_from_12h, ts_to_now)
 
-    deribit_rows_1h = load_deribit(ts_from_1h, ts_to_now)
-    deribit_rows_12h = load_deribit(ts_from_12h, ts_to_now)
+async def compute_market_structure_async(
+    supported_tickers: List[str],
+    short_lookback_hours: int = 12,
+) -> dict:
+    ts_from_30m, ts_from_1h, ts_from_12h, ts_to_now = _structure_windows(short_lookback_hours)
+
+    risk_rows_30m, rows_1h, rows_12h = await gather_all([
+        load_risk_async(ts_from_30m, ts_to_now, None, fields=RISK_FIELDS),
+        load_many_async(LAYER_EVENTS, ts_from_1h, ts_to_now, fields=LAYER_FIELDS),
+        load_many_async(LAYER_EVENTS, ts_from_12h, ts_to_now, fields=LAYER_FIELDS),
+    ])
+
+    return _market_structure_from_rows(supported_tickers, risk_rows_30m, rows_1h, rows_12h)
+
+
+def _market_structure_from_rows(
+    supported_tickers: List[str],
+    risk_rows_30m: List[dict],
+    rows_1h: Dict[str, List[dict]],
+    rows_12h: Dict[str, List[dict]],
+) -> dict:
+    risk_rows_1h = rows_1h["risk_eval"]
+    risk_rows_12h = rows_12h["risk_eval"]
+
+    bybit_rows_1h = rows_1h["bybit_market_state"]
+    bybit_rows_12h = rows_12h["bybit_market_state"]
+
+    deribit_rows_1h = rows_1h["deribit_vbi_snapshot"]
+    deribit_rows_12h = rows_12h["deribit_vbi_snapshot"]
 
     # --- Futures coherence (now) ---
     supported_norm = [_normalize_symbol(s) for s in supported_tickers]
     supported_norm = [s for s in supported_norm if s]
 
-    latest_risk = _latest_per_symbol(risk_rows_30m or [], _extract_risk_value)
+    series = _risk_series(
+        risk_rows_30m or [],
+        risk_rows_1h or [],
+        risk_rows_12h or [],
+        bybit_rows_12h or [],
+        deribit_rows_12h or [],
+        supported_tickers,
+        supported_norm,
+    )
+
+    latest_risk = series["latest_now"]
     # keep only supported tickers
     risk_vals_now = [latest_risk.get(sym) for sym in supported_norm]
     risk_vals_now = [v for v in risk_vals_now if _is_num(v)]
@@ -350,7 +384,7 @@ def compute_market_structure(
     dispersion_xs_now = _trimmed_stdev(risk_vals_now, trim_ratio=0.1)
 
     # adaptive normalization for dispersion_xs using 12h hourly samples (max 12 points)
-    disp_samples = _hourly_dispersion_from_risk_rows(risk_rows_12h or [], supported_tickers, max_points=12)
+    disp_samples = series["disp_samples"]
     disp_lo = min(disp_samples) if disp_samples else None
     disp_hi = max(disp_samples) if disp_samples else None
 
@@ -375,11 +409,11 @@ def compute_market_structure(
 
     # --- Compression components ---
     # VBI component: prefer low absolute iv_slope (flat term-structure) => more compression
-    iv_slope_1h_vals = [_extract_iv_slope(r) for r in (deribit_rows_1h or [])]
+    iv_slope_1h_vals = [r.iv_slope for r in (deribit_rows_1h or [])]
     iv_slope_1h_vals = [v for v in iv_slope_1h_vals if _is_num(v)]
     iv_slope_abs_now = _safe_abs(iv_slope_1h_vals[-1]) if iv_slope_1h_vals else None
 
-    iv_abs_12h = [_safe_abs(_extract_iv_slope(r)) for r in (deribit_rows_12h or [])]
+    iv_abs_12h = [_safe_abs(r.iv_slope) for r in (deribit_rows_12h or [])]
     iv_abs_12h = [v for v in iv_abs_12h if _is_num(v)]
     iv_lo = min(iv_abs_12h) if iv_abs_12h else None
     iv_hi = max(iv_abs_12h) if iv_abs_12h else None
@@ -394,11 +428,11 @@ def compute_market_structure(
     }
 
     # MCI component: prefer low MCI (compression) OR low abs(mci_slope)
-    mci_1h = [_extract_mci(r) for r in (bybit_rows_1h or [])]
+    mci_1h = [r.mci for r in (bybit_rows_1h or [])]
     mci_1h = [v for v in mci_1h if _is_num(v)]
     mci_now = sum(mci_1h) / len(mci_1h) if mci_1h else None
 
-    mci_12h = [_extract_mci(r) for r in (bybit_rows_12h or [])]
+    mci_12h = [r.mci for r in (bybit_rows_12h or [])]
     mci_12h = [v for v in mci_12h if _is_num(v)]
     mci_lo = min(mci_12h) if mci_12h else None
     mci_hi = max(mci_12h) if mci_12h else None
@@ -441,25 +475,10 @@ def compute_market_structure(
 
     # --- Cross-layer driver (LIVE via 1h impulses) ---
     # Futures impulse: change in market avg risk over 1h (earliest vs latest)
-    latest_risk_1h = _latest_per_symbol(risk_rows_1h or [], _extract_risk_value)
-
-    # approximate earliest by taking first-seen per symbol (not perfect but stable)
-    earliest: Dict[str, Tuple[int, float]] = {}
-    for r in (risk_rows_1h or []):
-        sym = _normalize_symbol(_extract_symbol(r))
-        if sym not in supported_norm:
-            continue
-        ts = _ts_to_ms(r.get("ts"))
-        if ts is None:
-            continue
-        v = _extract_risk_value(r)
-        if v is None:
-            continue
-        prev = earliest.get(sym)
-        if prev is None or ts < prev[0]:
-            earliest[sym] = (ts, float(v))
+    latest_risk_1h = series["latest_1h"]
+    earliest = series["earliest_1h"]
 
-    start_vals = [earliest.get(s, (None, None))[1] for s in supported_norm]
+    start_vals = [earliest.get(s) for s in supported_norm]
     end_vals = [latest_risk_1h.get(s) for s in supported_norm]
     start_vals = [v for v in start_vals if _is_num(v)]
     end_vals = [v for v in end_vals if _is_num(v)]
@@ -468,12 +487,12 @@ def compute_market_structure(
         fut_impulse = (sum(end_vals) / len(end_vals)) - (sum(start_vals) / len(start_vals))
 
     # Options impulse: latest avg mci_slope (abs)
-    mci_slope_1h = [_extract_mci_slope(r) for r in (bybit_rows_1h or [])]
+    mci_slope_1h = [r.mci_slope for r in (bybit_rows_1h or [])]
     mci_slope_1h = [v for v in mci_slope_1h if _is_num(v)]
     opt_impulse = (sum(mci_slope_1h) / len(mci_slope_1h)) if mci_slope_1h else None
 
     # Vol impulse: delta of iv_slope over 1h (latest - earliest)
-    iv_series = [_extract_iv_slope(r) for r in (deribit_rows_1h or [])]
+    iv_series = [r.iv_slope for r in (deribit_rows_1h or [])]
     iv_series = [v for v in iv_series if _is_num(v)]
     vol_impulse = None
     if len(iv_series) >= 2:
@@ -484,13 +503,7 @@ def compute_market_structure(
     opt_impulse_abs = _safe_abs(opt_impulse)
     vol_impulse_abs = _safe_abs(vol_impulse)
 
-    ref = _hourly_impulses_12h(
-        risk_rows_12h or [],
-        bybit_rows_12h or [],
-        deribit_rows_12h or [],
-        supported_norm=supported_norm,
-        max_points=12,
-    )
+    ref = series["ref"]
 
     def lohi(xs: List[float]) -> Tuple[Optional[float], Optional[float]]:
         xs = [float(x) for x in xs if _is_num(x)]
@@ -0,0 +1,181 @@
+# trend/market_structure_np.py
+"""
+NumPy versions of the row loops of trend/market_structure.py, selected
+there when numpy is importable. Each risk window is converted to arrays
+once (RiskArrays); per-symbol latest/earliest values come from one lexsort
+instead of a dict walk, hours are bucketed with array arithmetic and the
+trimmed stdev trims with np.partition instead of a sort.
+
+The pure-Python functions stay the reference: results match them up to
+float summation order.
+"""
+from typing import Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # optional speed-up
+    np = None
+
+
+HOUR_MS = 3600 * 1000
+
+
+class RiskArrays:
+    """Decoded risk_eval rows with an asset and a risk value, as arrays (row order kept)."""
+
+    def __init__(self, ts, sym, risk, symbols: List[str]):
+        self.ts = ts            # int64 ms
+        self.sym = sym          # int32 codes into `symbols`
+        self.risk = risk        # float64
+        self.symbols = symbols
+
+    @classmethod
+    def from_rows(cls, rows) -> "RiskArrays":
+        kept = [r for r in rows if r.asset and r.risk is not None]
+        codes: Dict[str, int] = {}
+        return cls(
+            np.fromiter([r.ts_ms for r in kept], dtype=np.int64, count=len(kept)),
+            np.fromiter([codes.setdefault(r.asset, len(codes)) for r in kept], dtype=np.int32, count=len(kept)),
+            np.fromiter([r.risk for r in kept], dtype=np.float64, count=len(kept)),
+            list(codes),
+        )
+
+    def supported(self, supported_norm) -> "RiskArrays":
+        wanted = set(supported_norm)
+        codes = [i for i, s in enumerate(self.symbols) if s in wanted]
+        keep = np.isin(self.sym, np.array(codes, dtype=np.int32))
+        return RiskArrays(self.ts[keep], self.sym[keep], self.risk[keep], self.symbols)
+
+
+def _group_ends(*keys) -> "np.ndarray":
+    # Last position of every run of equal keys in key-sorted arrays.
+    if not len(keys[0]):
+        return np.zeros(0, dtype=np.intp)
+    change = np.zeros(len(keys[0]), dtype=bool)
+    change[-1] = True
+    for key in keys:
+        change[:-1] |= key[1:] != key[:-1]
+    return np.flatnonzero(change)
+
+
+def _latest_order(arrays: RiskArrays, *group_keys) -> "np.ndarray":
+    # Sorted by group, then ts, then reverse row order: the last row of each
+    # group is its latest value, the first one seen on ts ties.
+    index = np.arange(len(arrays.ts))
+    return np.lexsort((-index, arrays.ts) + tuple(reversed(group_keys)))
+
+
+def latest_per_symbol(arrays: RiskArrays) -> Dict[str, float]:
+    order = _latest_order(arrays, arrays.sym)
+    ends = order[_group_ends(arrays.sym[order])]
+    return {arrays.symbols[s]: float(v) for s, v in zip(arrays.sym[ends].tolist(), arrays.risk[ends].tolist())}
+
+
+def earliest_per_symbol(arrays: RiskArrays) -> Dict[str, float]:
+    # min ts per symbol, the first one seen on ties
+    index = np.arange(len(arrays.ts))
+    order = np.lexsort((index, arrays.ts, arrays.sym))
+    sorted_sym = arrays.sym[order]
+    starts = np.flatnonzero(np.r_[True, sorted_sym[1:] != sorted_sym[:-1]]) if len(order) else order
+    firsts = order[starts]
+    return {arrays.symbols[s]: float(v) for s, v in zip(arrays.sym[firsts].tolist(), arrays.risk[firsts].tolist())}
+
+
+def _hourly_latest(arrays: RiskArrays):
+    # (hour buckets, {bucket: values of the latest row per symbol})
+    buckets = arrays.ts - arrays.ts % HOUR_MS
+    order = _latest_order(arrays, buckets, arrays.sym)
+    ends = order[_group_ends(buckets[order], arrays.sym[order])]
+    end_buckets = buckets[ends]
+    hours = np.unique(end_buckets)
+    split = np.searchsorted(end_buckets, hours[1:])
+    return hours, dict(zip(hours.tolist(), np.split(arrays.risk[ends], split)))
+
+
+def trimmed_stdev(xs, trim_ratio: float = 0.1) -> Optional[float]:
+    xs = np.asarray(xs, dtype=np.float64)
+    xs = xs[~np.isnan(xs)]
+    n = len(xs)
+    if n < 2:
+        return 0.0 if n else None
+
+    if n >= 6:
+        trim = max(1, int(n * trim_ratio))
+        if n > 2 * trim:
+            xs = np.partition(xs, (trim, n - trim - 1))[trim:n - trim]
+    return float(np.std(xs, ddof=1))
+
+
+def hourly_dispersion(arrays: RiskArrays, supported_norm, max_points: int = 12) -> List[float]:
+    """As market_structure._hourly_dispersion_from_risk_rows."""
+    arrays = arrays.supported(supported_norm)
+    hours, values = _hourly_latest(arrays)
+    min_coverage = max(3, int(len(set(supported_norm)) * 0.65))
+
+    dispersions = []
+    for hour in hours[-max_points:].tolist():
+        vals = values[hour]
+        if len(vals) < min_coverage:
+            continue
+        d = trimmed_stdev(vals, trim_ratio=0.1)
+        if d is not None:
+            dispersions.append(d)
+    return dispersions
+
+
+def _bucket_means(ts, values):
+    # {hour bucket: mean of abs(values)} over the non-missing values
+    keep = ~np.isnan(values)
+    buckets = ts[keep] - ts[keep] % HOUR_MS
+    if not len(buckets):
+        return {}
+    hours, inverse = np.unique(buckets, return_inverse=True)
+    sums = np.bincount(inverse, weights=np.abs(values[keep]))
+    counts = np.bincount(inverse)
+    return dict(zip(hours.tolist(), (sums / counts).tolist()))
+
+
+def _slope_arrays(rows, attr: str):
+    ts = np.fromiter((r.ts_ms for r in rows), dtype=np.int64, count=len(rows))
+    values = np.fromiter(
+        (np.nan if getattr(r, attr) is None else getattr(r, attr) for r in rows),
+        dtype=np.float64,
+        count=len(rows),
+    )
+    return ts, values
+
+
+def hourly_impulses(
+    arrays: RiskArrays,
+    bybit_rows: list,
+    deribit_rows: list,
+    supported_norm,
+    max_points: int = 12,
+) -> dict:
+    """As market_structure._hourly_impulses_12h."""
+    arrays = arrays.supported(supported_norm)
+    fut_hours, fut_values = _hourly_latest(arrays)
+    opt = _bucket_means(*_slope_arrays(bybit_rows, "mci_slope"))
+    vol = _bucket_means(*_slope_arrays(deribit_rows, "iv_slope"))
+
+    all_buckets = sorted(set(fut_hours.tolist()) | set(opt) | set(vol))[-max_points:]
+    min_coverage = max(3, int(len(set(s for s in supported_norm if s)) * 0.65))
+
+    fut_avg_series: List[float] = []
+    opt_abs_series: List[float] = []
+    vol_abs_series: List[float] = []
+    for b in all_buckets:
+        vals = fut_values.get(b)
+        if vals is not None and len(vals) >= min_coverage:
+            fut_avg_series.append(float(vals.mean()))
+        if b in opt:
+            opt_abs_series.append(opt[b])
+        if b in vol:
+            vol_abs_series.append(vol[b])
+
+    series = np.array(fut_avg_series)
+    return {
+        "fut_impulses": np.abs(np.diff(series)).tolist() if len(series) >= 2 else [],
+        "opt_impulses": opt_abs_series,
+        "vol_impulses": vol_abs_series,
+    }